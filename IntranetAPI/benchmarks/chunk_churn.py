@@ -0,0 +1,112 @@
+"""Measure chunk hash churn per edit for the content-defined chunker.
+
+Applies small edits to the documents in ./corpus and reports the share of
+chunk hashes that change, next to the old fixed 4000/300 character windows.
+
+Run from IntranetAPI/src:  python ../benchmarks/chunk_churn.py
+"""
+
+import argparse
+import os
+import random
+import re
+import sys
+
+BENCHMARK_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(BENCHMARK_DIR, "..", "src"))
+
+from chunking import iter_chunks  # noqa: E402
+from essential_methods import generate_uuid  # noqa: E402
+
+CORPUS_DIR = os.path.join(BENCHMARK_DIR, "corpus")
+INSERTED_SENTENCE = "Observera att rutinen uppdaterades efter beslut i kommunstyrelsen."
+
+
+def fixed_window_chunks(text, chunk_size=4000, overlap=300):
+    length = len(text)
+    chunks = []
+    start = 0
+    while start < length:
+        end = min(start + chunk_size, length)
+        chunks.append(text[start:end])
+        start = end - overlap
+        if end == length:
+            break
+    return chunks
+
+
+def load_documents():
+    documents = {}
+    for name in sorted(os.listdir(CORPUS_DIR)):
+        with open(os.path.join(CORPUS_DIR, name), encoding="utf-8") as f:
+            text = f.read()
+        paragraphs = [p.strip() for p in text.split("\n\n") if p.strip()]
+        # Scraped pages arrive as one whitespace-joined string, PDFs as pages with breaks
+        documents[f"{name} (page)"] = [" ".join(paragraphs)]
+        documents[f"{name} (pdf)"] = [
+            "\n\n".join(paragraphs[i : i + 4]) for i in range(0, len(paragraphs), 4)
+        ]
+    return documents
+
+
+def sentences(text):
+    return re.split(r"(?<=[.!?])\s+", text)
+
+
+def make_edits(pieces, rng):
+    """Yield (edit name, edited pieces) for a set of typical small CMS edits."""
+    first = pieces[0]
+    yield "insert sentence at top", [
+        first.replace(". ", f". {INSERTED_SENTENCE} ", 1)
+    ] + pieces[1:]
+
+    middle = len(pieces) // 2
+    parts = sentences(pieces[middle])
+    drop = rng.randrange(len(parts))
+    yield "delete sentence in middle", (
+        pieces[:middle] + [" ".join(parts[:drop] + parts[drop + 1 :])] + pieces[middle + 1 :]
+    )
+
+    words = pieces[middle].split(" ")
+    index = rng.randrange(len(words))
+    words[index] = words[index].upper()
+    yield "change one word", pieces[:middle] + [" ".join(words)] + pieces[middle + 1 :]
+
+    yield "append paragraph", pieces[:-1] + [pieces[-1] + "\n\n" + INSERTED_SENTENCE]
+
+
+def churn(old_chunks, new_chunks):
+    old_hashes = {generate_uuid(chunk) for chunk in old_chunks}
+    new_hashes = {generate_uuid(chunk) for chunk in new_chunks}
+    changed = len(new_hashes - old_hashes)
+    return changed, len(new_hashes)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args()
+    rng = random.Random(args.seed)
+
+    print(f"{'document':<36} {'edit':<26} {'fixed':>12} {'content-defined':>17}")
+    totals = {"fixed": [0, 0], "cdc": [0, 0]}
+    for name, pieces in load_documents().items():
+        base_fixed = fixed_window_chunks("\n\n".join(pieces))
+        base_cdc = list(iter_chunks(pieces))
+        for edit, edited in make_edits(pieces, rng):
+            fixed = churn(base_fixed, fixed_window_chunks("\n\n".join(edited)))
+            cdc = churn(base_cdc, list(iter_chunks(edited)))
+            for key, (changed, total) in (("fixed", fixed), ("cdc", cdc)):
+                totals[key][0] += changed
+                totals[key][1] += total
+            print(
+                f"{name:<36} {edit:<26} {fixed[0]:>5}/{fixed[1]:<6} {cdc[0]:>8}/{cdc[1]:<8}"
+            )
+
+    for key, label in (("fixed", "fixed 4000/300"), ("cdc", "content-defined")):
+        changed, total = totals[key]
+        print(f"Churn rate {label}: {changed / total:.1%} of chunk hashes changed")
+
+
+if __name__ == "__main__":
+    main()
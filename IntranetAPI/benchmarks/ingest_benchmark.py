@@ -0,0 +1,412 @@
+"""Measure ingestion throughput of update_url on the fixture corpus.
+
+Serves fixtures/ingest (HTML pages linking PDF and DOCX documents) and a fake
+OpenAI embeddings endpoint from a local HTTP server, runs update_url for every
+page into an in-memory Qdrant collection and reports pages/s, MB/s and the
+per-stage profile. All state (SQLite files, logs) lives in a temp directory.
+
+Run from IntranetAPI/src:
+  python ../benchmarks/ingest_benchmark.py run
+  python ../benchmarks/ingest_benchmark.py run --fetcher http --render-wait 0 --warm
+  python ../benchmarks/ingest_benchmark.py fixtures   # Regenerate the corpus
+"""
+
+import argparse
+import json
+import mimetypes
+import multiprocessing
+import os
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import zlib
+from datetime import datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+BENCHMARK_DIR = os.path.dirname(os.path.abspath(__file__))
+SRC_DIR = os.path.join(BENCHMARK_DIR, "..", "src")
+sys.path.insert(0, SRC_DIR)
+
+CORPUS_PATH = os.path.join(BENCHMARK_DIR, "corpus", "policy_paragraphs.txt")
+FIXTURE_DIR = os.path.join(BENCHMARK_DIR, "fixtures", "ingest")
+PAGES_DIR = os.path.join(FIXTURE_DIR, "pages")
+DOCUMENTS_DIR = os.path.join(FIXTURE_DIR, "documents")
+
+VECTOR_SIZE = 3072
+VECTOR_POOL = 64  # Distinct fake embeddings, serialized once
+FIXTURE_DATE = datetime(2024, 1, 1)
+DOCX_TYPE = "application/vnd.openxmlformats-officedocument.wordprocessingml.document"
+
+PAGE_TEMPLATE = """<!DOCTYPE html>
+<html lang="sv">
+<head><meta charset="utf-8"><title>{title}</title></head>
+<body>
+  <div class="tm-header"><nav><a href="/">Start</a> <a href="/personal">Personal</a></nav></div>
+  <div class="tm-page"><div id="tm-main">
+    <h1>{title}</h1>
+{paragraphs}
+    <h2>Dokument</h2>
+    <ul>
+{links}
+    </ul>
+  </div></div>
+  <div class="tm-footer">Falkenbergs kommun</div>
+</body>
+</html>
+"""
+
+
+# Fixture corpus
+def load_sections():
+    with open(CORPUS_PATH, encoding="utf-8") as f:
+        paragraphs = [part.strip() for part in f.read().split("\n\n") if part.strip()]
+    sections = []
+    for paragraph in paragraphs:
+        if "\n" not in paragraph and not paragraph.endswith("."):
+            sections.append((paragraph, []))
+        elif sections:
+            sections[-1][1].append(paragraph)
+    return sections
+
+
+def section_text(rng, sections, title, count):
+    """Corpus paragraphs under numbered headings, so every chunk is unique."""
+    paragraphs = [paragraph for _, section in sections for paragraph in section]
+    return [
+        f"{title}, avsnitt {index + 1}. {rng.choice(paragraphs)} {rng.choice(paragraphs)}"
+        for index in range(count)
+    ]
+
+
+def make_pdf(pages):
+    """Minimal text PDF (Helvetica, WinAnsi), one page per string."""
+    objects = [b"<< /Type /Catalog /Pages 2 0 R >>"]
+    kids = " ".join(f"{3 + i * 2} 0 R" for i in range(len(pages)))
+    objects.append(f"<< /Type /Pages /Kids [{kids}] /Count {len(pages)} >>".encode())
+    font_id = 3 + len(pages) * 2
+    for i, text in enumerate(pages):
+        lines = []
+        for paragraph in text.split("\n"):
+            words = paragraph.split()
+            while words:
+                line = []
+                while words and len(" ".join(line + words[:1])) <= 95:
+                    line.append(words.pop(0))
+                lines.append(" ".join(line or [words.pop(0)]))
+            lines.append("")
+        escaped = (
+            line.replace("\\", "\\\\").replace("(", "\\(").replace(")", "\\)") for line in lines
+        )
+        stream = "BT /F1 10 Tf 40 800 Td 13 TL " + " ".join(f"({line}) '" for line in escaped)
+        data = (stream + " ET").encode("cp1252", errors="replace")
+        objects.append(
+            f"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 595 842] /Contents {4 + i * 2} 0 R "
+            f"/Resources << /Font << /F1 {font_id} 0 R >> >> >>".encode()
+        )
+        objects.append(b"<< /Length %d >>\nstream\n" % len(data) + data + b"\nendstream")
+    objects.append(
+        b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica /Encoding /WinAnsiEncoding >>"
+    )
+
+    out = b"%PDF-1.4\n"
+    offsets = []
+    for number, obj in enumerate(objects, start=1):
+        offsets.append(len(out))
+        out += f"{number} 0 obj\n".encode() + obj + b"\nendobj\n"
+    xref = len(out)
+    out += f"xref\n0 {len(objects) + 1}\n0000000000 65535 f \n".encode()
+    out += b"".join(f"{offset:010d} 00000 n \n".encode() for offset in offsets)
+    out += f"trailer\n<< /Size {len(objects) + 1} /Root 1 0 R >>\n".encode()
+    out += f"startxref\n{xref}\n%%EOF\n".encode()
+    return out
+
+
+def make_docx(path, title, paragraphs):
+    import docx
+
+    document = docx.Document()
+    document.core_properties.created = document.core_properties.modified = FIXTURE_DATE
+    document.add_heading(title, level=1)
+    for paragraph in paragraphs[:-4]:
+        document.add_paragraph(paragraph)
+    table = document.add_table(rows=2, cols=2)
+    for cell, paragraph in zip((c for row in table.rows for c in row.cells), paragraphs[-4:]):
+        cell.text = paragraph
+    document.save(path)
+
+
+def generate_fixtures(seed=7):
+    """Pages per corpus section, each linking two shared or own PDF/DOCX documents."""
+    rng = random.Random(seed)
+    sections = load_sections()
+    for directory in (PAGES_DIR, DOCUMENTS_DIR):
+        shutil.rmtree(directory, ignore_errors=True)
+        os.makedirs(directory)
+
+    documents = []
+    for index, (title, _) in enumerate(sections):
+        name = f"dokument-{index + 1}"
+        if index % 3 == 2:
+            make_docx(
+                os.path.join(DOCUMENTS_DIR, f"{name}.docx"),
+                f"{title} (mall)",
+                section_text(rng, sections, title, 24),
+            )
+            documents.append((f"/alla-dokument/{name}", f"{title} (mall)"))
+        else:
+            page_count = 8 + index * 4  # The largest ones are split across processes
+            pages = ["\n".join(section_text(rng, sections, title, 5)) for _ in range(page_count)]
+            with open(os.path.join(DOCUMENTS_DIR, f"{name}.pdf"), "wb") as f:
+                f.write(make_pdf(pages))
+            link = f"/images/dokument/{name}.pdf" if index % 2 else f"/alla-dokument/{name}"
+            documents.append((link, f"{title} (PDF)"))
+
+    for index, (title, _) in enumerate(sections * 2):
+        paragraphs = section_text(rng, sections, f"{title} {index + 1}", 12)
+        # Each page links its own document and one shared with another page
+        linked = [documents[index % len(documents)], documents[(index * 3 + 1) % len(documents)]]
+        with open(os.path.join(PAGES_DIR, f"sida-{index + 1}.html"), "w", encoding="utf-8") as f:
+            f.write(
+                PAGE_TEMPLATE.format(
+                    title=f"{title} {index + 1}",
+                    paragraphs="\n".join(f"    <p>{paragraph}</p>" for paragraph in paragraphs),
+                    links="\n".join(
+                        f'      <li><a href="{href}">{text}</a></li>'
+                        for href, text in dict(linked).items()
+                    ),
+                )
+            )
+    print(f"Wrote {len(sections) * 2} pages and {len(documents)} documents to {FIXTURE_DIR}")
+
+
+# Local intranet and embeddings server
+def fake_embedding_pool():
+    import numpy as np
+
+    rng = np.random.default_rng(0)
+    pool = []
+    for _ in range(VECTOR_POOL):
+        vector = rng.standard_normal(VECTOR_SIZE).astype(np.float32)
+        vector /= np.linalg.norm(vector)
+        pool.append(json.dumps([round(float(value), 6) for value in vector]))
+    return pool
+
+
+class FixtureHandler(BaseHTTPRequestHandler):
+    pool = []
+    embed_latency = 0.0
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send(self, status, body, content_type):
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        path = self.path.split("?")[0].rstrip("/")
+        if path.startswith("/alla-dokument/") and path.endswith("/file"):
+            name = path[len("/alla-dokument/") : -len("/file")]
+            candidates = [f"{name}.pdf", f"{name}.docx"]
+        elif path.startswith("/images/dokument/"):
+            candidates = [os.path.basename(path)]
+        else:
+            candidates = [os.path.join("..", "pages", f"{os.path.basename(path)}.html")]
+
+        for candidate in candidates:
+            file_path = os.path.normpath(os.path.join(DOCUMENTS_DIR, candidate))
+            if file_path.startswith(FIXTURE_DIR) and os.path.isfile(file_path):
+                with open(file_path, "rb") as f:
+                    body = f.read()
+                content_type = (
+                    DOCX_TYPE
+                    if file_path.endswith(".docx")
+                    else mimetypes.guess_type(file_path)[0] or "application/octet-stream"
+                )
+                if content_type == "text/html":
+                    content_type += "; charset=utf-8"
+                self._send(200, body, content_type)
+                return
+        self._send(404, b"Not found", "text/plain")
+
+    def do_POST(self):
+        if self.path.rstrip("/") != "/v1/embeddings":
+            self._send(404, b"Not found", "text/plain")
+            return
+        request = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+        if self.embed_latency:
+            time.sleep(self.embed_latency)
+        items = ",".join(
+            '{"object":"embedding","index":%d,"embedding":%s}'
+            % (index, self.pool[zlib.crc32(text.encode()) % len(self.pool)])
+            for index, text in enumerate(request["input"])
+        )
+        tokens = sum(len(text) // 4 for text in request["input"])
+        usage = json.dumps({"prompt_tokens": tokens, "total_tokens": tokens})
+        body = (
+            '{"object":"list","data":[%s],"model":"%s","usage":%s}'
+            % (items, request["model"], usage)
+        ).encode()
+        self._send(200, body, "application/json")
+
+
+def serve(port_queue, embed_latency):
+    FixtureHandler.pool = fake_embedding_pool()
+    FixtureHandler.embed_latency = embed_latency
+    server = ThreadingHTTPServer(("127.0.0.1", 0), FixtureHandler)
+    port_queue.put(server.server_address[1])
+    server.serve_forever()
+
+
+def start_server(embed_latency):
+    """Server in its own process so it doesn't compete with the pipeline for the GIL."""
+    port_queue = multiprocessing.Queue()
+    process = multiprocessing.Process(target=serve, args=(port_queue, embed_latency), daemon=True)
+    process.start()
+    return process, f"http://127.0.0.1:{port_queue.get(timeout=30)}"
+
+
+# Benchmark
+def ingest(update_url, page_urls, skip_unchanged=False):
+    import ingest_profiler
+
+    ingest_profiler.reset()
+    started = time.perf_counter()
+    for url in page_urls:
+        # The warm pass runs like a scheduled sync
+        update_url(url, skip_unchanged=skip_unchanged, reuse_fresh_documents=skip_unchanged)
+    seconds = time.perf_counter() - started
+
+    report = ingest_profiler.summary()
+    stages = report["stages"]
+    page_bytes = sum(stages.get(name, {}).get("mb", 0) for name in ("render", "fetch"))
+    document_bytes = stages.get("download", {}).get("mb", 0)
+    return {
+        "pages": len(page_urls),
+        "documents": stages.get("download", {}).get("calls", 0),
+        "seconds": round(seconds, 3),
+        "pages_per_second": round(len(page_urls) / seconds, 2),
+        "mb": round(page_bytes + document_bytes, 2),
+        "mb_per_second": round((page_bytes + document_bytes) / seconds, 3),
+        "profile": report,
+    }
+
+
+def git_commit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            cwd=BENCHMARK_DIR,
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run(args):
+    page_names = sorted(name[: -len(".html")] for name in os.listdir(PAGES_DIR))
+    if args.pages:
+        page_names = page_names[: args.pages]
+    server, base_url = start_server(args.embed_latency / 1000)
+
+    # Relative ../data paths of the stores resolve inside the temp directory
+    work_dir = tempfile.mkdtemp(prefix="ingest_benchmark_")
+    os.makedirs(os.path.join(work_dir, "data"))
+    os.makedirs(os.path.join(work_dir, "src"))
+    os.chdir(os.path.join(work_dir, "src"))
+    os.environ.update(
+        INTRANET_URL=base_url,
+        SCRAP_FETCHER=args.fetcher,
+        COOKIE_NAME="benchmark",
+        COOKIE_VALUE="benchmark",
+    )
+    os.environ.setdefault("OPENAI_API_KEY", "benchmark")
+    os.environ.pop("INGEST_PROFILE", None)
+
+    try:
+        import openai
+        from qdrant_client import QdrantClient
+
+        import config
+
+        openai.api_base = f"{base_url}/v1"
+        config._qdrant_client = QdrantClient(":memory:")
+
+        import scrap
+        from individual_update_url import update_url
+        from ingest_profiler import format_report
+        from logging_setup import setup_logging
+
+        setup_logging("../data/benchmark_logg.txt", console=False)
+        if args.render_wait is not None:
+            scrap.RENDER_WAIT_MS = args.render_wait
+
+        page_urls = [f"{base_url}/{name}" for name in page_names]
+        results = {
+            "commit": git_commit(),
+            "fetcher": args.fetcher,
+            "cold": ingest(update_url, page_urls),
+        }
+        if args.warm:
+            results["warm"] = ingest(update_url, page_urls, skip_unchanged=True)
+    finally:
+        server.terminate()
+        os.chdir(SRC_DIR)
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    if args.record:
+        with open(args.record, "a", encoding="utf-8") as f:
+            f.write(json.dumps({"time": time.strftime("%Y-%m-%dT%H:%M:%S"), **results}) + "\n")
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+    for name in ("cold", "warm"):
+        if name not in results:
+            continue
+        result = results[name]
+        print(
+            f"\n{name}: {result['pages']} pages, {result['documents']} documents, "
+            f"{result['mb']:.2f} MB in {result['seconds']:.2f}s -> "
+            f"{result['pages_per_second']:.2f} pages/s, {result['mb_per_second']:.3f} MB/s"
+        )
+        print(format_report(result["profile"]))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    fixtures_parser = subparsers.add_parser("fixtures", help="Regenerate the fixture corpus.")
+    fixtures_parser.add_argument("--seed", type=int, default=7)
+
+    run_parser = subparsers.add_parser("run", help="Ingest the fixture corpus.")
+    run_parser.add_argument("--fetcher", choices=["browser", "http"], default="browser")
+    run_parser.add_argument(
+        "--render-wait", type=int, default=None, help="JavaScript wait per page in ms"
+    )
+    run_parser.add_argument("--pages", type=int, default=None, help="Only the first N pages")
+    run_parser.add_argument(
+        "--embed-latency", type=float, default=0, help="Fake embedding latency in ms"
+    )
+    run_parser.add_argument("--warm", action="store_true", help="Also re-run with skip_unchanged")
+    run_parser.add_argument("--record", help="Append the results to this JSONL file")
+    run_parser.add_argument("--json", action="store_true")
+    args = parser.parse_args()
+
+    if args.command == "fixtures":
+        generate_fixtures(args.seed)
+    else:
+        run(args)
+
+
+if __name__ == "__main__":
+    main()
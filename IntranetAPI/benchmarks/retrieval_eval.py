@@ -0,0 +1,373 @@
+"""Evaluate retrieval quality against search latency for several configurations.
+
+Replays a golden set of questions (question, keywords, expected_urls per
+JSON line) through search_collection on a local snapshot of the collection
+(qdrant-client local mode) and reports recall@k, MRR and p50/p95 search
+latency per configuration, side by side with the first (baseline) one.
+
+Configurations are comma separated options:
+  k=5         results returned (search limit)
+  hybrid=1    keyword scroll merged ahead of the vector results (0 = vector only)
+  kw=3        keyword results per query
+  dim=1024    vectors truncated to this dimension and renormalized
+  quant=int8  stored vectors scalar quantized (int8, one scale per collection)
+              and dequantized, queries stay float, accuracy only
+
+Run from IntranetAPI/src:
+  python ../benchmarks/retrieval_eval.py snapshot --path ../data/retrieval_snapshot
+  python ../benchmarks/retrieval_eval.py run --path ../data/retrieval_snapshot \\
+      --golden ../data/golden_questions.jsonl --config k=5 --config k=5,hybrid=0
+
+Without --path the fixture corpus is indexed with a local hashed embedder,
+so the harness itself can be run offline:
+  python ../benchmarks/retrieval_eval.py run --config k=5 --config k=3 --config k=5,dim=512
+"""
+
+import argparse
+import json
+import os
+import re
+import sys
+import time
+import zlib
+
+import numpy as np
+
+BENCHMARK_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(BENCHMARK_DIR, "..", "src"))
+
+from qdrant_client import QdrantClient, models  # noqa: E402
+
+from essential_methods import generate_uuid  # noqa: E402
+from retrieval import keyword_filter_for, search_collection  # noqa: E402
+
+CORPUS_PATH = os.path.join(BENCHMARK_DIR, "corpus", "policy_paragraphs.txt")
+FIXTURE_GOLDEN = os.path.join(BENCHMARK_DIR, "fixtures", "golden_fixture.jsonl")
+FIXTURE_COLLECTION = "fixture"
+EMBEDDING_MODEL = "text-embedding-3-large"
+HASHED_DIM = 3072
+SCROLL_BATCH = 256
+TOKEN_PATTERN = re.compile(r"[a-zåäöé0-9]+")
+
+
+# Embeddings
+class HashedEmbedder:
+    """Deterministic bag of words and character 4-grams, only for the offline fixture."""
+
+    def __init__(self, dim=HASHED_DIM):
+        self.dim = dim
+
+    def embed(self, text):
+        vector = np.zeros(self.dim, dtype=np.float32)
+        for word in TOKEN_PATTERN.findall(text.lower()):
+            padded = f" {word} "
+            features = [word] + [padded[i : i + 4] for i in range(len(padded) - 3)]
+            for feature in features:
+                digest = zlib.crc32(feature.encode())
+                vector[digest % self.dim] += 1.0 if digest & 1 << 31 else -1.0
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+
+def openai_query_embeddings(questions, cache_path):
+    """Query embeddings from the API, cached so replays don't call it again."""
+    cached = dict(np.load(cache_path)) if os.path.exists(cache_path) else {}
+    keys = {question: generate_uuid(question) for question in questions}
+    missing = [question for question in questions if keys[question] not in cached]
+    if missing:
+        import openai
+
+        from config import configure_openai
+
+        configure_openai()
+        response = openai.Embedding.create(input=missing, model=EMBEDDING_MODEL)
+        for question, item in zip(missing, response["data"]):
+            cached[keys[question]] = np.asarray(item["embedding"], dtype=np.float32)
+        np.savez(cache_path, **cached)
+    return {question: cached[keys[question]] for question in questions}
+
+
+# Collections
+def slug(title):
+    title = title.lower().translate(str.maketrans("åäöé", "aaoe"))
+    return re.sub(r"[^a-z0-9]+", "-", title).strip("-")
+
+
+def build_fixture(client, embedder):
+    """Index the corpus sections (one page each, a chunk per paragraph)."""
+    with open(CORPUS_PATH, encoding="utf-8") as f:
+        paragraphs = [part.strip() for part in f.read().split("\n\n") if part.strip()]
+
+    pages = []
+    for paragraph in paragraphs:
+        if "\n" not in paragraph and not paragraph.endswith("."):
+            pages.append((paragraph, []))
+        elif pages:
+            pages[-1][1].append(paragraph)
+
+    client.create_collection(
+        collection_name=FIXTURE_COLLECTION,
+        vectors_config=models.VectorParams(size=embedder.dim, distance=models.Distance.COSINE),
+    )
+    points = []
+    for title, chunks in pages:
+        for index, chunk in enumerate(chunks):
+            points.append(
+                models.PointStruct(
+                    id=generate_uuid(chunk),
+                    vector=embedder.embed(f"{title}\n{chunk}").tolist(),
+                    payload={
+                        "content": chunk,
+                        "metadata": {
+                            "title": title,
+                            "url": f"https://intranet.falkenberg.se/{slug(title)}",
+                            "chunk_info": f"Chunk {index + 1} of {len(chunks)}",
+                        },
+                    },
+                )
+            )
+    client.upsert(collection_name=FIXTURE_COLLECTION, points=points)
+    return FIXTURE_COLLECTION
+
+
+def snapshot(path, limit=None):
+    """Copy the live collection (vectors and payloads) into a local mode directory."""
+    from config import COLLECTION_NAME, get_qdrant_client
+
+    live = get_qdrant_client()
+    local = QdrantClient(path=path)
+    size = live.get_collection(COLLECTION_NAME).config.params.vectors.size
+    if local.collection_exists(COLLECTION_NAME):
+        local.delete_collection(COLLECTION_NAME)
+    local.create_collection(
+        collection_name=COLLECTION_NAME,
+        vectors_config=models.VectorParams(size=size, distance=models.Distance.COSINE),
+    )
+    copied = 0
+    offset = None
+    while True:
+        points, offset = live.scroll(
+            collection_name=COLLECTION_NAME,
+            limit=SCROLL_BATCH,
+            offset=offset,
+            with_payload=True,
+            with_vectors=True,
+        )
+        local.upsert(
+            collection_name=COLLECTION_NAME,
+            points=[
+                models.PointStruct(id=point.id, vector=point.vector, payload=point.payload)
+                for point in points
+            ],
+        )
+        copied += len(points)
+        print(f"Copied {copied} points", end="\r")
+        if offset is None or (limit and copied >= limit):
+            break
+    print(f"\nSnapshot of {copied} points in {path}")
+
+
+def transform(vectors, dim=None, quant=None, scale=None):
+    vectors = np.asarray(vectors, dtype=np.float32)
+    if dim:
+        vectors = vectors[..., :dim]
+        vectors = vectors / np.linalg.norm(vectors, axis=-1, keepdims=True).clip(1e-12)
+    if quant == "int8":
+        vectors = np.clip(np.round(vectors / scale), -127, 127) * scale
+    elif quant:
+        raise ValueError(f"Unsupported quantization: {quant}")
+    return vectors
+
+
+def scroll_vectors(client, collection):
+    """All points of the collection, one batch at a time."""
+    offset = None
+    while True:
+        points, offset = client.scroll(
+            collection_name=collection,
+            limit=SCROLL_BATCH,
+            offset=offset,
+            with_payload=True,
+            with_vectors=True,
+        )
+        if points:
+            yield points
+        if offset is None:
+            break
+
+
+def int8_scale(client, collection, dim=None):
+    """Symmetric int8 scale at the 99th percentile of all stored values, like Qdrant's int8."""
+    values = np.concatenate(
+        [
+            np.abs(transform([point.vector for point in points], dim)).ravel()
+            for points in scroll_vectors(client, collection)
+        ]
+    )
+    return np.quantile(values, 0.99) / 127 or 1.0
+
+
+def derived_collection(client, source, dim=None, quant=None):
+    """Copy of the source collection with transformed vectors, built once per run.
+
+    Quantization uses one scale for the whole collection, queries stay float
+    like searches against a quantized Qdrant collection.
+    """
+    if not dim and not quant:
+        return source
+    name = f"{source}__dim{dim or 'full'}_{quant or 'float'}"
+    if client.collection_exists(name):
+        return name
+    size = dim or client.get_collection(source).config.params.vectors.size
+    scale = int8_scale(client, source, dim) if quant == "int8" else None
+    client.create_collection(
+        collection_name=name,
+        vectors_config=models.VectorParams(size=size, distance=models.Distance.COSINE),
+    )
+    for points in scroll_vectors(client, source):
+        vectors = transform([point.vector for point in points], dim, quant, scale)
+        client.upsert(
+            collection_name=name,
+            points=[
+                models.PointStruct(id=point.id, vector=vector.tolist(), payload=point.payload)
+                for point, vector in zip(points, vectors)
+            ],
+        )
+    return name
+
+
+# Evaluation
+def parse_config(spec):
+    config = {"name": spec, "k": 5, "hybrid": True, "kw": 3, "dim": None, "quant": None}
+    for option in filter(None, spec.split(",")):
+        key, _, value = option.partition("=")
+        if key not in config:
+            raise ValueError(f"Unknown option {key} in {spec}")
+        if key == "hybrid":
+            config[key] = value not in ("0", "false", "no")
+        elif key in ("k", "kw", "dim"):
+            config[key] = int(value)
+        else:
+            config[key] = value
+    return config
+
+
+def evaluate(client, collection, golden, embeddings, config, repeat):
+    recalls, reciprocal_ranks, latencies = [], [], []
+    for item in golden:
+        vector = transform(embeddings[item["question"]], config["dim"])
+        keyword_filter = keyword_filter_for(item.get("keywords")) if config["hybrid"] else None
+        for _ in range(repeat):
+            started = time.perf_counter()
+            results = search_collection(
+                client,
+                collection,
+                vector.tolist(),
+                keyword_filter=keyword_filter,
+                limit=config["k"],
+                keyword_limit=config["kw"],
+            )
+            latencies.append(time.perf_counter() - started)
+
+        # Ranked source URLs, a URL counts once at its best position
+        urls = list(dict.fromkeys(point.payload["metadata"]["url"] for point in results))
+        expected = set(item["expected_urls"])
+        recalls.append(len(expected & set(urls)) / len(expected))
+        rank = next((index for index, url in enumerate(urls, start=1) if url in expected), None)
+        reciprocal_ranks.append(1 / rank if rank else 0.0)
+
+    latencies_ms = np.array(latencies) * 1000
+    return {
+        "config": config["name"],
+        "k": config["k"],
+        "recall": float(np.mean(recalls)),
+        "mrr": float(np.mean(reciprocal_ranks)),
+        "p50_ms": float(np.percentile(latencies_ms, 50)),
+        "p95_ms": float(np.percentile(latencies_ms, 95)),
+    }
+
+
+def print_table(rows):
+    baseline = rows[0]
+    print(f"{'config':<28}{'recall@k':>10}{'MRR':>8}{'p50 ms':>9}{'p95 ms':>9}{'Δrecall':>9}{'Δp95':>8}")
+    for row in rows:
+        print(
+            f"{row['config']:<28}{row['recall']:>10.3f}{row['mrr']:>8.3f}"
+            f"{row['p50_ms']:>9.2f}{row['p95_ms']:>9.2f}"
+            f"{row['recall'] - baseline['recall']:>+9.3f}"
+            f"{row['p95_ms'] / max(baseline['p95_ms'], 1e-9):>7.2f}x"
+        )
+
+
+def load_golden(path):
+    with open(path, encoding="utf-8") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    snapshot_parser = subparsers.add_parser("snapshot", help="Copy the live collection locally.")
+    snapshot_parser.add_argument("--path", required=True)
+    snapshot_parser.add_argument("--limit", type=int, default=None)
+
+    run_parser = subparsers.add_parser("run", help="Evaluate configurations.")
+    run_parser.add_argument("--path", help="Local snapshot directory (default: fixture corpus)")
+    run_parser.add_argument("--collection", default="IntranetFalkenbergHemsida_RAG")
+    run_parser.add_argument("--golden", default=None)
+    run_parser.add_argument("--config", action="append", default=[])
+    run_parser.add_argument("--repeat", type=int, default=5, help="Searches per question")
+    run_parser.add_argument("--json", action="store_true", help="Print the results as JSON")
+    run_parser.add_argument(
+        "--max-recall-drop",
+        type=float,
+        default=None,
+        help="Exit 1 if a configuration loses more recall than this against the baseline",
+    )
+    args = parser.parse_args()
+
+    if args.command == "snapshot":
+        snapshot(args.path, args.limit)
+        return
+
+    if args.path:
+        client = QdrantClient(path=args.path)
+        collection = args.collection
+        golden = load_golden(args.golden or os.path.join(args.path, "golden_questions.jsonl"))
+        embeddings = openai_query_embeddings(
+            [item["question"] for item in golden],
+            os.path.join(args.path, "query_embeddings.npz"),
+        )
+    else:
+        client = QdrantClient(":memory:")
+        embedder = HashedEmbedder()
+        collection = build_fixture(client, embedder)
+        golden = load_golden(args.golden or FIXTURE_GOLDEN)
+        embeddings = {item["question"]: embedder.embed(item["question"]) for item in golden}
+
+    rows = []
+    for spec in args.config or ["k=5"]:
+        config = parse_config(spec)
+        target = derived_collection(client, collection, config["dim"], config["quant"])
+        evaluate(client, target, golden[:1], embeddings, config, 1)  # Warm-up
+        rows.append(evaluate(client, target, golden, embeddings, config, args.repeat))
+
+    if args.json:
+        print(json.dumps(rows, indent=2))
+    else:
+        print(f"{len(golden)} questions, {args.repeat} searches each\n")
+        print_table(rows)
+
+    if args.max_recall_drop is not None:
+        worst = min(row["recall"] for row in rows[1:]) if len(rows) > 1 else rows[0]["recall"]
+        if rows[0]["recall"] - worst > args.max_recall_drop:
+            print(
+                f"\nRecall dropped by more than {args.max_recall_drop} against the baseline",
+                file=sys.stderr,
+            )
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
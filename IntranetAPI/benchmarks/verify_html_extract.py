@@ -0,0 +1,64 @@
+"""Verify extract_page against the legacy BeautifulSoup extraction.
+
+Compares title, texts and document links for every stored fixture page and
+reports the speedup.
+
+Run from IntranetAPI/src:  python ../benchmarks/verify_html_extract.py
+"""
+
+import argparse
+import os
+import sys
+import time
+
+BENCHMARK_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(BENCHMARK_DIR, "..", "src"))
+
+from html_extract import extract_page, extract_page_legacy  # noqa: E402
+
+PAGES_DIR = os.path.join(BENCHMARK_DIR, "fixtures", "pages")
+
+
+def timed(function, content, repeat):
+    started = time.perf_counter()
+    for _ in range(repeat):
+        result = function(content)
+    return result, (time.perf_counter() - started) / repeat
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("pages_dir", nargs="?", default=PAGES_DIR)
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    mismatches = 0
+    total_new = total_legacy = 0.0
+    for name in sorted(os.listdir(args.pages_dir)):
+        if not name.endswith(".html"):
+            continue
+        with open(os.path.join(args.pages_dir, name), encoding="utf-8") as f:
+            content = f.read()
+
+        new, new_seconds = timed(extract_page, content, args.repeat)
+        legacy, legacy_seconds = timed(extract_page_legacy, content, args.repeat)
+        total_new += new_seconds
+        total_legacy += legacy_seconds
+
+        status = "OK"
+        for field, new_value, legacy_value in zip(("title", "texts", "links"), new, legacy):
+            if new_value != legacy_value:
+                status = "MISMATCH"
+                mismatches += 1
+                print(f"  {name} {field} differs:\n    new:    {new_value!r}\n    legacy: {legacy_value!r}")
+        print(
+            f"{status:<9} {name:<32} {legacy_seconds * 1000:8.2f} ms -> {new_seconds * 1000:8.2f} ms"
+        )
+
+    if total_new:
+        print(f"Speedup: {total_legacy / total_new:.1f}x")
+    sys.exit(1 if mismatches else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,45 @@
+import asyncio
+import threading
+from contextvars import ContextVar
+
+# Set while a request is handled, readable from the WSGI thread (asgiref copies the context)
+client_disconnected: ContextVar = ContextVar("client_disconnected", default=None)
+
+
+def get_disconnect_event():
+    """Event set when the current HTTP client has gone away."""
+    return client_disconnected.get() or threading.Event()
+
+
+class DisconnectMiddleware:
+    """ASGI middleware that keeps listening for http.disconnect during streaming.
+
+    WsgiToAsgi stops reading from the client once the request body is consumed,
+    so without this a streamed response is generated to the end for nobody.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        event = threading.Event()
+        token = client_disconnected.set(event)
+        messages = asyncio.Queue()
+
+        async def watch():
+            while True:
+                message = await receive()
+                await messages.put(message)
+                if message["type"] == "http.disconnect":
+                    event.set()
+                    return
+
+        watcher = asyncio.create_task(watch())
+        try:
+            await self.app(scope, messages.get, send)
+        finally:
+            watcher.cancel()
+            client_disconnected.reset(token)
@@ -3,125 +3,84 @@ import os
 import re
 import json
 import logging
+import threading
+import time
+import uuid
 import tiktoken
-from dotenv import load_dotenv
 from datetime import datetime, timezone
 from zoneinfo import ZoneInfo
 
 import openai
-from qdrant_client import QdrantClient
 from qdrant_client import models
 
 from flask import Flask, request, jsonify, Response, stream_with_context
 from flask_cors import CORS
-from flask_limiter import Limiter
+from werkzeug.middleware.proxy_fix import ProxyFix
 from asgiref.wsgi import WsgiToAsgi
 
-from essential_methods import swedish_time
+from logging_setup import bind_log_context, setup_logging
 
 # Setup Logging
 log_file = "../data/update_logg.txt"
-
-logging.Formatter.converter = swedish_time
-
-logging.basicConfig(
-    level=logging.INFO,
-    format="%(asctime)s - %(levelname)s - %(message)s",
-    handlers=[
-        logging.FileHandler(log_file),  # Log to file
-        logging.StreamHandler(),  # Log to console
-    ],
-)
-
+setup_logging(log_file)
 logger = logging.getLogger(__name__)
 
 
-from individual_update_url import update_url
-from essential_methods import calculate_cost
-
-api_keys_path = "../data/API_KEYS.env"
-cookie_path = "../data/COOKIE.env"  # Added path for cookies
-
-
-def load_api_key(key_variable):
-    if not os.path.exists(api_keys_path):
-        raise FileNotFoundError(f"{api_keys_path} file not found.")
-    load_dotenv(dotenv_path=api_keys_path)
-    api_key = os.getenv(key_variable)
-    if not api_key is None:
-        return api_key
-
-    raise ValueError(
-        "API key was not found!, Make sure the environment variable is set."
-    )
-
-
-# Load Cookie Info
-if os.path.exists(cookie_path):
-    load_dotenv(dotenv_path=cookie_path)
-    COOKIE_NAME = os.getenv("COOKIE_NAME")
-    COOKIE_VALUE = os.getenv("COOKIE_VALUE")
-else:
-    logger.warning("COOKIE.env not found. Cookie validation will be skipped.")
-    COOKIE_NAME = None
-    COOKIE_VALUE = None
+from essential_methods import count_tokens, get_encoding, token_cost
+from model_routing import route_model
+from asgi_disconnect import DisconnectMiddleware, get_disconnect_event
+from chat_completion import CHAT_TIMEOUT, check_upstream, stream_chat_completion
+from deadlines import Deadline, DeadlineExceeded, call_with_deadline
+from metrics import get_metrics, increment, record_completion, record_model_call
+from singleflight import FanoutStream, SingleFlight, normalize_question
+from faq_cache import get_faq_cache
+from ingest_queue import IngestQueue, PRIORITIES, PRIORITY_WEBHOOK
+from document_registry import DocumentRegistry
+from crawl_state import get_crawl_state
+from qdrant_delete import delete_urls, hand_over_points
+from retrieval import keyword_filter_for, search_collection
+from config import (
+    COLLECTION_NAME,
+    configure_openai,
+    get_cookie,
+    get_qdrant_client,
+    get_secret,
+)
+from rate_limit import RateLimiter
+from health import register_check, run_checks, start_warm_up, status
 
-
-def validate_cookie_startup():
-    if not COOKIE_NAME or not COOKIE_VALUE:
-        logger.warning("Skipping cookie validation (Credentials missing).")
-        return
+def validate_cookie():
+    """Check that the intranet cookie is still logged in (readiness, not required for chat)."""
+    cookie_name, cookie_value = get_cookie()
+    if not cookie_name or not cookie_value:
+        raise ValueError("Cookie credentials missing in COOKIE.env")
 
     url = "https://intranet.falkenberg.se/start2"
-    logger.info(f"Validating Cookie against {url}...")
-
-    try:
-        # Use GET to see the body content
-        response = requests.get(
-            url, cookies={COOKIE_NAME: COOKIE_VALUE}, allow_redirects=True, timeout=10
-        )
-
-        # 1. Check URL Redirect (3xx -> Login URL)
-        if "idp.falkenberg.se" in response.url:
-            logger.error("CRITICAL: Cookie is INVALID! API redirected to Login Page.")
-            return False
-
-        # 2. Check Content Body for SAML/Login Form (The robust check)
-        content = response.text
-        if "idp.falkenberg.se" in content and "SAMLRequest" in content:
-            logger.error(
-                "CRITICAL: Cookie is INVALID! Detected SAML Login Form in response."
-            )
-            return False
-
-        if response.status_code == 200:
-            logger.info("Cookie is VALID. API started successfully.")
-            return True
-        else:
-            logger.warning(
-                f"Cookie validation returned unexpected status: {response.status_code}"
-            )
-            return False
+    response = requests.get(
+        url, cookies={cookie_name: cookie_value}, allow_redirects=True, timeout=10
+    )
 
-    except Exception as e:
-        logger.error(f"Failed to validate cookie during startup: {e}")
-        return False
+    # 1. Check URL Redirect (3xx -> Login URL)
+    if "idp.falkenberg.se" in response.url:
+        raise ValueError("Cookie is INVALID! Redirected to Login Page.")
 
+    # 2. Check Content Body for SAML/Login Form (The robust check)
+    content = response.text
+    if "idp.falkenberg.se" in content and "SAMLRequest" in content:
+        raise ValueError("Cookie is INVALID! Detected SAML Login Form in response.")
 
-validate_cookie_startup()
+    if response.status_code != 200:
+        raise ValueError(f"Cookie validation returned unexpected status: {response.status_code}")
+    return True
 
 
-# Qdrant
-COLLECTION_NAME = "IntranetFalkenbergHemsida_RAG"
-QDRANT_API_KEY = load_api_key("QDRANT_API_KEY")
-QDRANT_URL = "https://qdrant.utvecklingfalkenberg.se"
-QDRANT_CLIENT = QdrantClient(
-    url=QDRANT_URL, port=443, https=True, api_key=QDRANT_API_KEY
-)
+# Qdrant (client is created on first use)
+DOCUMENT_REGISTRY = DocumentRegistry()
+CRAWL_STATE = get_crawl_state()
 
 # OpenAI
-openai.api_key = load_api_key("OPENAI_API_KEY")
-GPT_MODEL = "gpt-4o"
+configure_openai()
+EMBEDDING_MODEL = "text-embedding-3-large"
 
 # Directus Chat Database
 chat_api_url = "https://nav.utvecklingfalkenberg.se/items/falkenberg_intranet_chat"
@@ -132,61 +91,55 @@ message_api_url = (
 )
 
 headers = {"Content-Type": "application/json"}
-params = {"access_token": load_api_key("DIRECTUS_KEY")}
+params = {"access_token": get_secret("DIRECTUS_KEY")}
+DIRECTUS_TIMEOUT = 5
+directus_session = requests.Session()
 
+# Prompt context when retrieval timed out
+NO_CONTEXT = "Inga dokument kunde hämtas just nu eftersom sökningen tog för lång tid. Berätta det för användaren och be hen försöka igen om en stund."
 
-def generate_embeddings(text):  # Generate embedding of the text
-    response = openai.Embedding.create(input=text, model="text-embedding-3-large")
-    return response["data"][0]["embedding"]
+# Streamed when the answer generation fails
+ANSWER_ERROR = "\n\nNågot gick fel när svaret skapades, försök igen om en stund."
 
+CHAT_FLIGHTS = SingleFlight()
+CHAT_READY_TIMEOUT = 2 * DIRECTUS_TIMEOUT  # Wait of a finished answer for its chat to be created
+RATE_LIMITER = RateLimiter()  # Shared by all workers, see rate_limit.py
+# Reverse proxies in front of the API, 0 uses the connecting address as the client
+TRUSTED_PROXY_HOPS = int(os.getenv("TRUSTED_PROXY_HOPS", "0"))
+FAQ_REFRESH_SECONDS = int(os.getenv("FAQ_REFRESH_SECONDS", "300"))  # 0 disables the refresher
 
-def search_collection(
-    qdrant_client: QdrantClient,
-    collection_name,
-    user_query_embedding,
-    keyword_filter=None,
-):
-    if keyword_filter is None:
-        response = qdrant_client.query_points(
-                collection_name=collection_name,
-                query=user_query_embedding,
-                limit=5,
-                with_payload=True,
-            )
-        return response.points if hasattr(response, 'points') else []
-
-    # Get results from vector search and filtered scroll
-    vector_result_obj = qdrant_client.query_points(
-        collection_name=collection_name,
-        query=user_query_embedding,
-        limit=5,
-        with_payload=True,
-    )
-    vector_results = vector_result_obj.points if hasattr(vector_result_obj, 'points') else []
 
-    filtered_results, _ = qdrant_client.scroll(
-        collection_name=collection_name, scroll_filter=keyword_filter, limit=3
+def generate_embeddings(text, timeout=None):  # Generate embedding of the text
+    response = openai.Embedding.create(
+        input=text, model=EMBEDDING_MODEL, request_timeout=timeout
     )
+    return response["data"][0]["embedding"]
 
-    filtered_ids = set(point.id for point in filtered_results)
-    combined_results = list(filtered_results)
-
-    for r in vector_results:
-        if r.id not in filtered_ids:
-            combined_results.append(r)
-        if len(combined_results) >= 5:
-            break
 
-    return combined_results[:5]
+# Cost (USD) of one model call, also recorded in the metrics per stage and model
+def account_model_call(stage, model, started, input_text, output_text=""):
+    input_tokens = count_tokens(input_text, model)
+    output_tokens = count_tokens(output_text, model) if output_text else 0
+    cost = token_cost(model, input_tokens, output_tokens)
+    record_model_call(
+        stage, model, time.monotonic() - started, input_tokens, output_tokens, cost
+    )
+    return cost
 
 
 def directus_get_cost(chat_id):
     cost_params = {
-        "access_token": load_api_key("DIRECTUS_KEY"),
+        "access_token": get_secret("DIRECTUS_KEY"),
         "filter[chat_id][_eq]": chat_id,
         "fields": "cost_usd",
     }
-    response = requests.get(chat_api_url, headers=headers, params=cost_params)
+    try:
+        response = directus_session.get(
+            chat_api_url, headers=headers, params=cost_params, timeout=DIRECTUS_TIMEOUT
+        )
+    except requests.exceptions.RequestException as e:
+        logger.error(f"Directus Cost Error: {e}")
+        return None
 
     if response.status_code == 200:
         data = response.json().get("data")
@@ -204,6 +157,35 @@ def directus_get_cost(chat_id):
         return None
 
 
+def add_chat_cost(chat_id, question_cost):
+    total_chat_cost = directus_get_cost(chat_id)
+    if total_chat_cost is None:
+        logger.error(f"Chat cost unknown, not updating cost for ID: {chat_id}")
+        return
+    total_chat_cost += question_cost
+
+    cost_data = {"cost_usd": total_chat_cost}
+    chat_cost_params = {**params, "filter[chat_id][_eq]": chat_id}
+
+    # Update the chat cost in Directus
+    try:
+        response = directus_session.patch(
+            f"{chat_api_url}/{chat_id}",
+            json=cost_data,
+            headers=headers,
+            params=chat_cost_params,
+            timeout=DIRECTUS_TIMEOUT,
+        )
+
+        if response.status_code == 200:
+            logger.info(f"Cost updated for ID: {chat_id}")
+        else:
+            logger.error(f"Error updating cost: {response.text}")
+
+    except requests.exceptions.RequestException as e:
+        logger.error(f"Network error updating cost: {str(e)}")
+
+
 # Remove emojis from answer right before saving in database
 def remove_emojis(text):
     emoji_pattern = re.compile(
@@ -220,8 +202,10 @@ def remove_emojis(text):
     return emoji_pattern.sub(r"", text)
 
 
-# Start
-def get_result(user_input, user_history, chat_id, MAX_INPUT_CHAR):
+# Rewrite, retrieval and prompt for an answer, returns (messages, cost, sources)
+def prepare_answer(
+    user_input, user_history, MAX_INPUT_CHAR, deadline: Deadline, with_time=True
+):
     question_cost = 0
     # Loop through user history and combine user inputs
     user_input_combo = ""
@@ -267,11 +251,25 @@ def get_result(user_input, user_history, chat_id, MAX_INPUT_CHAR):
         {"role": "user", "content": user_input},
     ]
 
-    openai_query = openai.ChatCompletion.create(model=GPT_MODEL, messages=query_input)
-    question_cost += calculate_cost(json.dumps(query_input), model="gpt-4o")
-
-    query_text_out = openai_query["choices"][0]["message"]["content"]
-    question_cost += calculate_cost(query_text_out, is_input=False, model="gpt-4o")
+    query_prompt = json.dumps(query_input)
+    rewrite_model = route_model("rewrite", count_tokens(query_prompt, "gpt-4o"))
+    started = time.monotonic()
+    try:
+        openai_query = call_with_deadline(
+            "rewrite",
+            lambda timeout: openai.ChatCompletion.create(
+                model=rewrite_model, messages=query_input, request_timeout=timeout
+            ),
+            deadline,
+        )
+        query_text_out = openai_query["choices"][0]["message"]["content"]
+        question_cost += account_model_call(
+            "rewrite", rewrite_model, started, query_prompt, query_text_out
+        )
+    except DeadlineExceeded as e:
+        # Search with the question as asked
+        logger.warning(f"Query rewrite skipped: {e}")
+        query_text_out = user_input.replace(",", " ")
 
     # Split the CSV string into question and keywords
     csv_parts = [part.strip() for part in query_text_out.split(",") if part.strip()]
@@ -280,34 +278,50 @@ def get_result(user_input, user_history, chat_id, MAX_INPUT_CHAR):
     logger.info(f"Generated Question: {question}")
     logger.info(f"Keywords: {keywords}")
 
-    if len(keywords) > 0:
-        keyword_filter = models.Filter(
-            should=[
-                models.FieldCondition(
-                    key="content",
-                    match=models.MatchText(text=keyword),
-                )
-                for keyword in keywords
-            ]
-        )
-    else:
-        keyword_filter = None
-
-    user_embedding = generate_embeddings(question)
-    question_cost += calculate_cost(question)
+    keyword_filter = keyword_filter_for(keywords)
 
-    search_results = search_collection(
-        QDRANT_CLIENT,
-        COLLECTION_NAME,
-        user_embedding,
-        keyword_filter=keyword_filter,
-    )
+    # Embedding and search are idempotent and hedged, a timeout degrades to no context
+    try:
+        started = time.monotonic()
+        user_embedding = call_with_deadline(
+            "embed",
+            lambda timeout: generate_embeddings(question, timeout=timeout),
+            deadline,
+            hedge=True,
+        )
+        question_cost += account_model_call("embed", EMBEDDING_MODEL, started, question)
+
+        search_results = call_with_deadline(
+            "search",
+            lambda timeout: search_collection(
+                get_qdrant_client(),
+                COLLECTION_NAME,
+                user_embedding,
+                keyword_filter=keyword_filter,
+                timeout=timeout,
+            ),
+            deadline,
+            hedge=True,
+        )
+    except DeadlineExceeded as e:
+        logger.warning(f"Retrieval timed out, answering without context: {e}")
+        search_results = None
 
-    found_ids = [res.id for res in search_results]
+    found_ids = [res.id for res in search_results or []]
     logger.info(f"Search found {len(found_ids)} results: {found_ids}")
+    sources = None
+    if search_results is not None:
+        sources = [
+            {
+                "id": str(res.id),
+                "url": res.payload["metadata"]["url"],
+                "source_url": res.payload["metadata"].get("source_url"),
+            }
+            for res in search_results
+        ]
 
     similar_texts = []
-    for result in search_results:
+    for result in search_results or []:
         similar_texts.append(
             {
                 "chunk": result.payload["content"],
@@ -321,11 +335,16 @@ def get_result(user_input, user_history, chat_id, MAX_INPUT_CHAR):
     # Send in current datetime so it knows
     utc_time = datetime.now(timezone.utc).replace(microsecond=0)
     current_date_time = utc_time.astimezone(ZoneInfo("Europe/Stockholm"))
-    current_date_time_str = current_date_time.strftime("%Y-%m-%dT%H:%M:%S")
+    # Precomputed answers are reused all day, they only get the date
+    current_date_time_str = current_date_time.strftime(
+        "%Y-%m-%dT%H:%M:%S" if with_time else "%Y-%m-%d"
+    )
 
     doc_context = ""
     for i, text in enumerate(similar_texts):
         doc_context += f"Dokument:\n{text['chunk']}\nURL: {text['url']}\nLikhetsscore: {text['score']}\n\n"
+    if search_results is None:
+        doc_context = NO_CONTEXT
 
     # Prepare the prompt for GPT-4o in Swedish
     instructions_prompt = f"""
@@ -351,44 +370,149 @@ def get_result(user_input, user_history, chat_id, MAX_INPUT_CHAR):
         messages.append({"role": role, "content": content})
 
     messages.append({"role": "user", "content": user_input})
-    question_cost += calculate_cost(json.dumps(messages), model="gpt-4o")
+    return messages, question_cost, sources
 
-    if not chat_id or not user_history:
-        logger.info("No chat_id or history found, creating new chat.")
-        chat_data = {}
-        post_response = requests.post(
-            chat_api_url, json=chat_data, headers=headers, params=params
+
+# Producer of an answer stream, shared by all requests attached to it
+def produce_answer(stream, user_input, user_history, MAX_INPUT_CHAR, with_time=True):
+    deadline = Deadline()
+    messages, stream.cost, stream.sources = prepare_answer(
+        user_input, user_history, MAX_INPUT_CHAR, deadline, with_time
+    )
+
+    # Answer Generation, the upstream stream is closed once every client is gone
+    prompt = json.dumps(messages)
+    answer_model = route_model("answer", count_tokens(prompt, "gpt-4o"))
+    started = time.monotonic()
+    # The answer has to start streaming within what is left of the budget
+    completion = stream_chat_completion(
+        messages,
+        answer_model,
+        stop_event=stream.abandoned,
+        timeout=(CHAT_TIMEOUT[0], max(CHAT_TIMEOUT[0], deadline.remaining())),
+    )
+    try:
+        for text_chunk in completion:
+            stream.append(text_chunk)
+    finally:
+        completion.close()
+        full_response = "".join(stream.chunks)
+        stream.cost += account_model_call(
+            "answer", answer_model, started, prompt, full_response
+        )
+        record_completion(
+            count_tokens(full_response, answer_model), aborted=stream.abandoned.is_set()
         )
-        if post_response.status_code != 200:
-            logger.error(f"Error creating chat: {post_response.json()}")
-            chat_id = None
-        else:
-            chat_id = post_response.json().get("data", {}).get("chat_id")
-            logger.info(f"New chat created with ID: {chat_id}")
 
-    collected_response = []
 
-    def generate():
-        nonlocal question_cost
+# Answer a question without a client (FAQ precompute), returns (answer, sources, cost)
+def answer_offline(question, MAX_INPUT_CHAR=1000):
+    stream = FanoutStream()
+    produce_answer(stream, question, [], MAX_INPUT_CHAR, with_time=False)
+    return "".join(stream.chunks), stream.sources, stream.cost
+
+
+def refresh_faqs(questions, asked=None):
+    """(Re)generate FAQ answers, asked is {question: times asked}."""
+    refreshed = 0
+    for question in questions:
+        try:
+            answer, sources, cost = answer_offline(question)
+        except Exception as e:
+            logger.error(f"FAQ answer failed for '{question}': {e}")
+            continue
+        if not answer or not sources:
+            # Retrieval timed out or found nothing, an answer without context is not worth keeping
+            logger.warning(f"FAQ answer for '{question}' not stored, no sources retrieved")
+            continue
+        get_faq_cache().put(
+            question, answer, sources, cost, asked=(asked or {}).get(question)
+        )
+        refreshed += 1
+        logger.info(f"FAQ answer stored for '{question}' ({len(sources)} sources, {cost:.4f} USD)")
+    return refreshed
 
-        yield json.dumps({"chat_id": chat_id}) + "\n<END_OF_JSON>\n"
 
-        # GPT-4o Generation
-        completion = openai.ChatCompletion.create(
-            model=GPT_MODEL,
-            messages=messages,
-            stream=True,
+def refresh_stale_faqs():
+    """Regenerate stale answers one claim at a time, returns how many were stored."""
+    refreshed = 0
+    while True:
+        question = get_faq_cache().claim_stale()
+        if question is None:
+            return refreshed
+        logger.info(f"Regenerating stale FAQ answer for '{question}'")
+        refreshed += refresh_faqs([question])
+
+
+def faq_refresh_loop():
+    # Answers whose source chunks changed are regenerated in the background
+    while True:
+        time.sleep(FAQ_REFRESH_SECONDS)
+        try:
+            increment("faq_regenerated", refresh_stale_faqs())
+        except Exception as e:
+            logger.error(f"FAQ refresh failed: {e}")
+
+
+# Start
+def get_result(user_input, user_history, chat_id, MAX_INPUT_CHAR):
+    chat_ready = threading.Event()  # Set once the chat exists (or could not be created)
+
+    def book_cost(stream):
+        # The generation is paid once it has ended, by the chat of the request that started it
+        RATE_LIMITER.charge(stream.cost)
+        if not chat_ready.wait(CHAT_READY_TIMEOUT):
+            logger.error(f"Chat not created in time, cost {stream.cost} USD not stored")
+            return
+        if chat_id:
+            add_chat_cost(chat_id, stream.cost)
+
+    # Frequent first questions are answered from the precomputed FAQ
+    faq = get_faq_cache().match(user_input) if not user_history else None
+    if faq is not None:
+        increment("faq_hits")
+        logger.info(f"Answered from FAQ: {faq['question']}")
+        stream, leader = FanoutStream.completed(faq["answer"]), True
+    else:
+        # Identical first questions asked at the same time share one generation
+        flight_key = normalize_question(user_input) if not user_history else None
+        stream, leader = CHAT_FLIGHTS.join(
+            flight_key,
+            lambda stream: produce_answer(stream, user_input, user_history, MAX_INPUT_CHAR),
+            on_done=book_cost,
         )
+        if not leader:
+            increment("chat_coalesced")
+            logger.info(f"Attached to in-flight answer for: {flight_key}")
 
-        for chunk in completion:
-            if chunk.choices[0].delta.get("content"):
-                text_chunk = chunk.choices[0].delta["content"]
-                collected_response.append(text_chunk)
-                yield text_chunk
+    if not chat_id or not user_history:
+        logger.info("No chat_id or history found, creating new chat.")
+        chat_data = {}
+        try:
+            post_response = directus_session.post(
+                chat_api_url,
+                json=chat_data,
+                headers=headers,
+                params=params,
+                timeout=DIRECTUS_TIMEOUT,
+            )
+            if post_response.status_code != 200:
+                logger.error(f"Error creating chat: {post_response.text}")
+                chat_id = None
+            else:
+                chat_id = post_response.json().get("data", {}).get("chat_id")
+                logger.info(f"New chat created with ID: {chat_id}")
+        except requests.exceptions.RequestException as e:
+            # The answer is still streamed, it just isn't stored
+            logger.error(f"Error creating chat: {e}")
+            chat_id = None
+    chat_ready.set()
 
-        # When the stream ends, we can finalize the response
-        full_response = "".join(collected_response)
-        question_cost += calculate_cost(full_response, "gpt-4o", is_input=False)
+    def save_answer(full_response, aborted):
+        if aborted:
+            logger.info(
+                f"Client disconnected, stopped answer after {len(full_response)} characters"
+            )
         full_response_no_emojis = remove_emojis(full_response)
         user_input_no_emoji = remove_emojis(user_input)
         if chat_id:
@@ -398,89 +522,150 @@ def get_result(user_input, user_history, chat_id, MAX_INPUT_CHAR):
                 "prompt": user_input_no_emoji,
                 "response": full_response_no_emojis,
             }
-            message_response = requests.post(
-                message_api_url, json=message_data, headers=headers, params=params
-            )
-
-            if message_response.status_code > 299:
-                logger.error(
-                    f"Error sending msg to API. Full request: {message_api_url}, {message_data}, {headers}, {params}"
-                )
-
-            # Get chat cost
-            update_chat_api_url = f"{chat_api_url}/{chat_id}"
-
-            total_chat_cost = directus_get_cost(chat_id)
-            total_chat_cost += question_cost
-
-            cost_data = {"cost_usd": total_chat_cost}
-
-            chat_cost_params = params
-            chat_cost_params["filter[chat_id][_eq]"] = chat_id
-
-            # Update the chat cost in Directus
             try:
-                response = requests.patch(
-                    update_chat_api_url,
-                    json=cost_data,
+                message_response = directus_session.post(
+                    message_api_url,
+                    json=message_data,
                     headers=headers,
-                    params=chat_cost_params,
+                    params=params,
+                    timeout=DIRECTUS_TIMEOUT,
                 )
+                if message_response.status_code > 299:
+                    logger.error(
+                        f"Error sending msg to API. Full request: {message_api_url}, {message_data}, {headers}, {params}"
+                    )
+            except requests.exceptions.RequestException as e:
+                logger.error(f"Network error saving message: {str(e)}")
 
-                if response.status_code == 200:
-                    logger.info(f"Cost updated for ID: {chat_id}")
-                else:
-                    logger.error(f"Error updating cost: {response.text}")
+    def generate():
+        increment("chat_requests")
+        disconnected = get_disconnect_event()
 
-            except requests.exceptions.RequestException as e:
-                logger.error(f"Network error updating cost: {str(e)}")
+        yield json.dumps({"chat_id": chat_id}) + "\n<END_OF_JSON>\n"
+
+        collected_response = []
+        answer = stream.read(stop_event=disconnected)
+        try:
+            for text_chunk in answer:
+                collected_response.append(text_chunk)
+                yield text_chunk
+            if stream.error is not None:
+                # The status is already sent, the client gets the error as the end of the answer
+                increment("chat_failed")
+                yield ANSWER_ERROR
+        finally:
+            answer.close()
+            # When the stream ends (or the client is gone), save the (partial) answer
+            full_response = "".join(collected_response)
+            if full_response:
+                save_answer(full_response, aborted=disconnected.is_set() or not stream.done)
+            else:
+                logger.warning("No answer generated, nothing saved")
 
     return generate
 
 
-def remove_qdrant(url):
+def remove_qdrant(url, dry_run=False):
     logger.info(f"Attempting to remove Qdrant points for URL: {url}")
-    qdrant_filter = models.Filter(
-        should=[
-            models.FieldCondition(
-                key="metadata.url", match=models.MatchValue(value=url)
-            ),
-            models.FieldCondition(
-                key="metadata.source_url", match=models.MatchValue(value=url)
-            ),
-        ]
+
+    # Documents linked from the page are only removed if no other page links them
+    orphaned_documents = {
+        document_url
+        for document_url in DOCUMENT_REGISTRY.links(url)
+        if not DOCUMENT_REGISTRY.references(document_url) - {url}
+    }
+    linked_points, _ = get_qdrant_client().scroll(
+        collection_name=COLLECTION_NAME,
+        scroll_filter=models.Filter(
+            must=[
+                models.FieldCondition(
+                    key="metadata.source_url", match=models.MatchValue(value=url)
+                )
+            ]
+        ),
+        limit=1000,
+        with_payload=["metadata.url"],
+        with_vectors=False,
     )
+    for point in linked_points:
+        document_url = point.payload["metadata"]["url"]
+        if not DOCUMENT_REGISTRY.references(document_url) - {url}:
+            orphaned_documents.add(document_url)
+    removed_urls = [url, *orphaned_documents]
+
+    if not dry_run:
+        # Text shared with remaining pages is handed over to them, not deleted
+        hand_over_points(get_qdrant_client(), COLLECTION_NAME, removed_urls)
+    summary = delete_urls(get_qdrant_client(), COLLECTION_NAME, removed_urls, dry_run=dry_run)
+    if dry_run:
+        return summary
+
+    # Entries of URLs whose points could not be deleted are kept for a retry
+    failed = set(summary.failed_urls)
+    deleted_documents = orphaned_documents - failed
+    if url not in failed:
+        DOCUMENT_REGISTRY.remove_page(url)
+        CRAWL_STATE.remove(url)
+    DOCUMENT_REGISTRY.remove_documents(deleted_documents)
+    CRAWL_STATE.remove_items([removed for removed in removed_urls if removed not in failed])
+    logger.info(f"Deleted points: {summary}")
+    return summary
 
-    points_selector = models.FilterSelector(filter=qdrant_filter)
 
-    deleted_points = QDRANT_CLIENT.scroll(
-        collection_name=COLLECTION_NAME, scroll_filter=qdrant_filter, limit=1000
-    )
+app = Flask(__name__)
+CORS(app)
+if TRUSTED_PROXY_HOPS > 0:
+    # remote_addr is the client from X-Forwarded-For, as appended by the trusted proxies
+    app.wsgi_app = ProxyFix(app.wsgi_app, x_for=TRUSTED_PROXY_HOPS)
+
+asgi_app = DisconnectMiddleware(WsgiToAsgi(app))
+
 
-    QDRANT_CLIENT.delete(
-        collection_name=COLLECTION_NAME, points_selector=points_selector
+def check_directus():
+    response = directus_session.get(
+        "https://nav.utvecklingfalkenberg.se/server/ping", timeout=DIRECTUS_TIMEOUT
     )
-    logger.info(f"Deleted points count: {len(deleted_points[0])}")
-    return deleted_points
+    response.raise_for_status()
+    return True
 
 
-app = Flask(__name__)
-CORS(app)
-# Limit the API request amount
-limiter = Limiter(app=app, key_func=lambda: "global", storage_uri="memory://")
+# Dependencies are checked (and connections warmed) in the background, never at import
+register_check(
+    "qdrant",
+    lambda: get_qdrant_client().collection_exists(collection_name=COLLECTION_NAME),
+)
+register_check("openai", check_upstream)
+register_check("directus", check_directus)
+register_check(
+    "tiktoken", lambda: bool(get_encoding("gpt-4o") and get_encoding(EMBEDDING_MODEL))
+)
+register_check("intranet_cookie", validate_cookie, critical=False)
+start_warm_up()
 
-asgi_app = WsgiToAsgi(app)
+if FAQ_REFRESH_SECONDS > 0:
+    threading.Thread(target=faq_refresh_loop, name="faq-refresh", daemon=True).start()
 
 
 @app.route("/generate", methods=["POST"])
-@limiter.limit("100 per hour")
 def generate():
     data = request.get_json()
     if not data or "user_input" not in data:
         logger.warning("Generate request missing user_input")
         return jsonify({"error": "Ingen användarinput inmatad"}), 400
 
+    # Limit the API request amount, per client and in total
+    allowed, reason, retry_after = RATE_LIMITER.check(request.remote_addr or "unknown")
+    if not allowed:
+        increment(f"rate_limited_{reason}")
+        logger.warning(f"Rate limited ({reason}) {request.remote_addr}, retry in {retry_after}s")
+        response = jsonify(
+            {"error": "För många förfrågningar, försök igen senare.", "retry_after": retry_after}
+        )
+        response.headers["Retry-After"] = str(retry_after)
+        return response, 429
+
     user_input = data["user_input"]
+    bind_log_context(request_id=uuid.uuid4().hex[:12])
 
     if "user_history" in data and "chat_id" in data and data["chat_id"] != "":
         history_list = data["user_history"]
@@ -500,7 +685,11 @@ def generate():
 
 
 # Load Update Key
-UPDATE_API_KEY = load_api_key("UPDATE_API_KEY")
+UPDATE_API_KEY = get_secret("UPDATE_API_KEY")
+
+
+# Ingest jobs are processed by ingest_worker.py
+INGEST_QUEUE = IngestQueue()
 
 
 # Update Qdrant Datapoints (Currently not allowing pdf inputs)
@@ -515,18 +704,20 @@ def update_qdrant():
             return jsonify({"error": "URL is required"}), 400
 
         url = data["url"]
-        logger.info(f"Starting Qdrant Update for: {url}")
-
-        result = update_url(url)
+        source = data.get("source", "webhook")
+        priority = PRIORITIES.get(source, PRIORITY_WEBHOOK)
+        job_id, coalesced = INGEST_QUEUE.enqueue(url, priority=priority, source=source)
+        logger.info(f"Queued Qdrant Update for: {url}, job: {job_id}, coalesced: {coalesced}")
 
         return (
             jsonify(
                 {
-                    "message": "Successfully updated Qdrant",
-                    "result": f"Cost: {result} SEK",
+                    "message": "Qdrant update queued",
+                    "job_id": job_id,
+                    "coalesced": coalesced,
                 }
             ),
-            200,
+            202,
         )
 
     except Exception as e:
@@ -534,6 +725,56 @@ def update_qdrant():
         return jsonify({"error": str(e)}), 500
 
 
+# Status of a queued Qdrant update
+@app.route("/update-qdrant/<job_id>", methods=["GET"])
+def update_qdrant_status(job_id):
+    if request.args.get("api_key") != UPDATE_API_KEY:
+        return jsonify({"error": "Invalid or missing API key"}), 401
+
+    job = INGEST_QUEUE.get(job_id)
+    if job is None:
+        return jsonify({"error": "Job not found"}), 404
+
+    return (
+        jsonify(
+            {
+                "job_id": job["id"],
+                "url": job["url"],
+                "status": job["status"],
+                "source": job["source"],
+                "requests": job["requests"],
+                "created_at": job["created_at"],
+                "started_at": job["started_at"],
+                "finished_at": job["finished_at"],
+                "result": job["result"],
+                "error": job["error"],
+            }
+        ),
+        200,
+    )
+
+
+# Process metrics (chat aborts, estimated tokens saved)
+@app.route("/metrics", methods=["GET"])
+def get_process_metrics():
+    if request.args.get("api_key") != UPDATE_API_KEY:
+        return jsonify({"error": "Invalid or missing API key"}), 401
+    return jsonify(get_metrics()), 200
+
+
+# Liveness, answers without touching any dependency
+@app.route("/healthz", methods=["GET"])
+def healthz():
+    return jsonify({"status": "ok", **status()}), 200
+
+
+# Readiness, 503 until every critical dependency answers
+@app.route("/readyz", methods=["GET"])
+def readyz():
+    result = run_checks()
+    return jsonify(result), 200 if result["ready"] else 503
+
+
 # Remove Qdrant datapoints linked to URL
 @app.route("/remove-qdrant", methods=["POST"])
 def remove_qdrant_url():
@@ -545,16 +786,21 @@ def remove_qdrant_url():
             return jsonify({"error": "URL is required"}), 400
 
         url = data["url"]
-        response = remove_qdrant(url)
+        dry_run = bool(data.get("dry_run", False))
+        summary = remove_qdrant(url, dry_run=dry_run)
 
         return (
             jsonify(
                 {
-                    "message": "Successfully removed URL from Qdrant",
-                    "result": str(response),
+                    "message": "Dry run, nothing removed"
+                    if dry_run
+                    else "Successfully removed URL from Qdrant"
+                    if summary.ok
+                    else "Removal failed, the URL is kept for a retry",
+                    "result": summary.as_dict(),
                 }
             ),
-            200,
+            200 if summary.ok else 500,
         )
 
     except Exception as e:
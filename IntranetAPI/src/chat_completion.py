@@ -0,0 +1,58 @@
+import json
+import logging
+
+import openai
+import requests
+
+# Setup Logging
+logger = logging.getLogger(__name__)
+
+CHAT_TIMEOUT = (10, 60)  # Connect, read (between streamed chunks)
+
+_session = requests.Session()
+
+
+def stream_chat_completion(messages, model, stop_event=None, timeout=CHAT_TIMEOUT):
+    """Yield the content deltas of a streamed chat completion.
+
+    The HTTP response is closed when the generator is closed or stop_event is
+    set, which makes OpenAI stop generating (and billing) the answer.
+    """
+    response = _session.post(
+        f"{openai.api_base.rstrip('/')}/chat/completions",
+        json={"model": model, "messages": messages, "stream": True},
+        headers={"Authorization": f"Bearer {openai.api_key}"},
+        stream=True,
+        timeout=timeout,
+    )
+    try:
+        if response.status_code != 200:
+            raise openai.error.APIError(
+                f"Chat completion failed: {response.status_code} {response.text[:200]}",
+                http_status=response.status_code,
+            )
+        for line in response.iter_lines():
+            if stop_event is not None and stop_event.is_set():
+                logger.info("Chat completion stopped, closing upstream stream")
+                return
+            if not line.startswith(b"data: "):
+                continue
+            data = line[len(b"data: ") :]
+            if data == b"[DONE]":
+                return
+            choices = json.loads(data).get("choices")
+            if choices and choices[0].get("delta", {}).get("content"):
+                yield choices[0]["delta"]["content"]
+    finally:
+        response.close()
+
+
+def check_upstream(timeout=5):
+    """Readiness check of the OpenAI API, also opens the session's connection."""
+    response = _session.get(
+        f"{openai.api_base.rstrip('/')}/models",
+        headers={"Authorization": f"Bearer {openai.api_key}"},
+        timeout=timeout,
+    )
+    response.raise_for_status()
+    return True
@@ -0,0 +1,136 @@
+import hashlib
+import re
+
+from essential_methods import get_encoding
+
+# Chunk Size Constants (tokens, text-embedding-3-large encoding)
+MIN_CHUNK_TOKENS = 300
+TARGET_CHUNK_TOKENS = 700
+MAX_CHUNK_TOKENS = 1000
+OVERLAP_TOKENS = 60
+ANCHOR_DIVISOR = 4  # On average every 4th segment past the minimum is a cut point
+
+# Structural boundaries, strongest first
+HEADING_PATTERN = re.compile(r"^(#{1,6}\s|[A-ZÅÄÖ0-9][^.!?\n]{0,80}:?$)")
+PARAGRAPH_SPLIT = re.compile(r"\n\s*\n")
+LINE_SPLIT = re.compile(r"\n")
+SENTENCE_SPLIT = re.compile(r"(?<=[.!?:;])\s+(?=\S)")
+WORD_SPLIT = re.compile(r"(?<=\s)(?=\S)")
+
+
+def _anchor_hash(segment):
+    # Stable across processes (unlike hash()), only depends on the segment itself
+    return int.from_bytes(hashlib.blake2b(segment.encode(), digest_size=4).digest(), "big")
+
+
+class _Segment:
+    __slots__ = ("text", "tokens", "strength")
+
+    def __init__(self, text, tokens, strength):
+        self.text = text
+        self.tokens = tokens
+        # 3 = heading/paragraph start, 2 = line, 1 = sentence, 0 = word run
+        self.strength = strength
+
+
+def _split_oversized(text, encoding, max_tokens):
+    """Split a segment longer than max_tokens at word boundaries, never mid-word."""
+    words = WORD_SPLIT.split(text)
+    part, part_tokens = [], 0
+    for word in words:
+        tokens = len(encoding.encode(word))
+        if part and part_tokens + tokens > max_tokens:
+            yield "".join(part), part_tokens
+            part, part_tokens = [], 0
+        part.append(word)
+        part_tokens += tokens
+    if part:
+        yield "".join(part), part_tokens
+
+
+def _segments(pieces, encoding, max_tokens):
+    """Yield sentence-level segments tagged with the strength of the boundary before them."""
+    for piece in pieces:
+        for paragraph in PARAGRAPH_SPLIT.split(piece):
+            if not paragraph.strip():
+                continue
+            for line_index, line in enumerate(LINE_SPLIT.split(paragraph)):
+                if not line.strip():
+                    continue
+                if line_index == 0 or HEADING_PATTERN.match(line.strip()):
+                    line_strength = 3
+                else:
+                    line_strength = 2
+                for sentence_index, sentence in enumerate(SENTENCE_SPLIT.split(line)):
+                    strength = line_strength if sentence_index == 0 else 1
+                    tokens = len(encoding.encode(sentence))
+                    if tokens <= max_tokens:
+                        yield _Segment(sentence, tokens, strength)
+                        continue
+                    for index, (part, part_tokens) in enumerate(
+                        _split_oversized(sentence, encoding, max_tokens)
+                    ):
+                        yield _Segment(part, part_tokens, strength if index == 0 else 0)
+
+
+def _join(segments):
+    text = ""
+    for segment in segments:
+        if not text:
+            text = segment.text
+        elif segment.strength >= 2:
+            text += "\n" + segment.text
+        else:
+            text += " " + segment.text
+    return text.strip()
+
+
+def iter_chunks(
+    pieces,
+    min_tokens=MIN_CHUNK_TOKENS,
+    target_tokens=TARGET_CHUNK_TOKENS,
+    max_tokens=MAX_CHUNK_TOKENS,
+    overlap_tokens=OVERLAP_TOKENS,
+    model="text-embedding-3-large",
+):
+    """Content-defined chunking over a stream of text pieces (e.g. PDF pages).
+
+    A chunk ends before a segment once it holds at least min_tokens and the
+    segment starts a heading/paragraph, or its content hash hits the anchor
+    condition, or the chunk would pass target/max size. The decision only
+    depends on the segments since the previous cut, so an edit moves at most
+    the boundaries up to the next anchor and every later chunk keeps its hash.
+    """
+    if isinstance(pieces, str):
+        pieces = [pieces]
+    encoding = get_encoding(model)
+
+    current, current_tokens = [], 0
+    for segment in _segments(pieces, encoding, max_tokens):
+        if current and current_tokens >= min_tokens:
+            is_anchor = segment.strength >= 3 or (
+                _anchor_hash(segment.text) % ANCHOR_DIVISOR == 0
+            )
+            over_target = current_tokens >= target_tokens and segment.strength >= 1
+            if is_anchor or over_target or current_tokens + segment.tokens > max_tokens:
+                yield _join(current)
+                current, current_tokens = _overlap(current, overlap_tokens)
+        elif current and current_tokens + segment.tokens > max_tokens:
+            yield _join(current)
+            current, current_tokens = _overlap(current, overlap_tokens)
+        current.append(segment)
+        current_tokens += segment.tokens
+
+    if current:
+        yield _join(current)
+
+
+def _overlap(segments, overlap_tokens):
+    """Carry whole trailing sentences of the previous chunk into the next one."""
+    kept, kept_tokens = [], 0
+    for segment in reversed(segments):
+        if kept_tokens + segment.tokens > overlap_tokens:
+            break
+        kept.insert(0, segment)
+        kept_tokens += segment.tokens
+    return kept, kept_tokens
@@ -0,0 +1,106 @@
+import logging
+import os
+import threading
+
+from dotenv import dotenv_values
+
+# Setup Logging
+logger = logging.getLogger(__name__)
+
+API_KEYS_PATH = "../data/API_KEYS.env"
+COOKIE_PATH = "../data/COOKIE.env"
+
+# Intranet, overridable for a staging copy or the ingestion benchmark's local server
+INTRANET_URL = os.getenv("INTRANET_URL", "https://intranet.falkenberg.se")
+
+# Qdrant
+QDRANT_URL = "https://qdrant.utvecklingfalkenberg.se"
+QDRANT_PORT = 443
+QDRANT_TIMEOUT = 10
+COLLECTION_NAME = "IntranetFalkenbergHemsida_RAG"
+VECTOR_SIZE = 3072
+
+_lock = threading.Lock()
+_files = {}
+_qdrant_client = None
+_collection_checked = False
+
+
+def _read_env_file(path):
+    # Each file is parsed once per process, environment variables take precedence
+    with _lock:
+        if path not in _files:
+            _files[path] = dotenv_values(path) if os.path.exists(path) else None
+        return _files[path]
+
+
+def get_secret(key_variable, required=True):
+    value = os.getenv(key_variable)
+    if value is None:
+        values = _read_env_file(API_KEYS_PATH)
+        if values is None and required:
+            raise FileNotFoundError(f"{API_KEYS_PATH} file not found.")
+        value = (values or {}).get(key_variable)
+    if value is None and required:
+        raise ValueError(
+            f"API key {key_variable} was not found!, Make sure the environment variable is set."
+        )
+    return value
+
+
+def get_cookie():
+    """(COOKIE_NAME, COOKIE_VALUE) for the intranet, (None, None) if not configured."""
+    values = _read_env_file(COOKIE_PATH) or {}
+    return (
+        os.getenv("COOKIE_NAME") or values.get("COOKIE_NAME"),
+        os.getenv("COOKIE_VALUE") or values.get("COOKIE_VALUE"),
+    )
+
+
+def get_qdrant_client():
+    """Shared Qdrant client, created on first use."""
+    global _qdrant_client
+    with _lock:
+        if _qdrant_client is None:
+            from qdrant_client import QdrantClient
+
+            _qdrant_client = QdrantClient(
+                url=QDRANT_URL,
+                port=QDRANT_PORT,
+                https=True,
+                api_key=get_secret("QDRANT_API_KEY"),
+                timeout=QDRANT_TIMEOUT,
+            )
+        return _qdrant_client
+
+
+def ensure_collection():
+    """Create the collection if it is missing, checked once per process (ingestion only)."""
+    global _collection_checked
+    if _collection_checked:
+        return
+    from qdrant_client import models
+
+    client = get_qdrant_client()
+    if not client.collection_exists(collection_name=COLLECTION_NAME):
+        logger.info(f"Collection {COLLECTION_NAME} not found. Creating...")
+        try:
+            client.create_collection(
+                collection_name=COLLECTION_NAME,
+                vectors_config=models.VectorParams(
+                    size=VECTOR_SIZE, distance=models.Distance.COSINE
+                ),
+            )
+        except Exception as e:
+            logger.error(f"Error creating collection: {e}")
+            return
+    else:
+        logger.info(f"Collection {COLLECTION_NAME} exists. Proceeding.")
+    _collection_checked = True
+
+
+def configure_openai():
+    import openai
+
+    if not openai.api_key:
+        openai.api_key = get_secret("OPENAI_API_KEY")
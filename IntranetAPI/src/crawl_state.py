@@ -0,0 +1,414 @@
+import argparse
+import logging
+import sqlite3
+import threading
+from datetime import datetime, timezone
+
+# Setup Logging
+logger = logging.getLogger(__name__)
+
+CRAWL_STATE_PATH = "../data/crawl_state.db"
+SQLITE_MAX_VARS = 900
+
+
+def utc_now():
+    return datetime.now(timezone.utc).replace(microsecond=0)
+
+
+def parse_datetime(value):
+    """Parse a W3C/ISO datetime (sitemap lastmod or stored value) to aware UTC."""
+    if not value:
+        return None
+    value = value.strip()
+    try:
+        parsed = datetime.fromisoformat(value.replace("Z", "+00:00"))
+    except ValueError:
+        logger.warning(f"Could not parse datetime: {value}")
+        return None
+    if parsed.tzinfo is None:
+        parsed = parsed.replace(tzinfo=timezone.utc)
+    return parsed.astimezone(timezone.utc)
+
+
+class CrawlState:
+    """Local record of when each URL was last indexed and what it contained.
+
+    Also the manifest of indexed items (pages and linked documents) and their
+    chunk IDs, so ingestion and cleanup never have to scroll the collection.
+    """
+
+    def __init__(self, db_path=CRAWL_STATE_PATH):
+        self.db_path = db_path
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(db_path, check_same_thread=False, timeout=30)
+        self.conn.row_factory = sqlite3.Row
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute(
+            """CREATE TABLE IF NOT EXISTS pages (
+                url TEXT PRIMARY KEY,
+                lastmod TEXT,
+                content_hash TEXT,
+                indexed_at TEXT NOT NULL
+            )"""
+        )
+        self.conn.execute(
+            """CREATE TABLE IF NOT EXISTS items (
+                url TEXT PRIMARY KEY,
+                is_document INTEGER NOT NULL,
+                content_hash TEXT,
+                indexed_at TEXT NOT NULL
+            )"""
+        )
+        self.conn.execute(
+            """CREATE TABLE IF NOT EXISTS chunks (
+                chunk_id TEXT NOT NULL,
+                url TEXT NOT NULL,
+                chunk_info TEXT,
+                PRIMARY KEY (url, chunk_id)
+            )"""
+        )
+        self.conn.execute("CREATE INDEX IF NOT EXISTS chunks_id ON chunks (chunk_id)")
+        # Title and linking page of an item, needed to hand shared points over to it
+        columns = {row["name"] for row in self.conn.execute("PRAGMA table_info(items)")}
+        for column in ("title", "source_url"):
+            if column not in columns:
+                self.conn.execute(f"ALTER TABLE items ADD COLUMN {column} TEXT")
+        self.conn.execute(
+            "CREATE INDEX IF NOT EXISTS items_document ON items (is_document, url)"
+        )
+        self.conn.execute(
+            """CREATE TABLE IF NOT EXISTS meta (
+                key TEXT PRIMARY KEY,
+                value TEXT
+            )"""
+        )
+        self.conn.commit()
+
+    def manifest_reconciled_at(self):
+        """When the manifest was last reconciled with Qdrant, None if it never was.
+
+        Items indexed before the manifest existed are only in Qdrant until then.
+        """
+        with self.lock:
+            row = self.conn.execute(
+                "SELECT value FROM meta WHERE key = 'manifest_reconciled_at'"
+            ).fetchone()
+        return parse_datetime(row["value"]) if row else None
+
+    def get(self, url):
+        with self.lock:
+            row = self.conn.execute(
+                "SELECT url, lastmod, content_hash, indexed_at FROM pages WHERE url = ?",
+                (url,),
+            ).fetchone()
+        if row is None:
+            return None
+        return {
+            "url": row["url"],
+            "lastmod": parse_datetime(row["lastmod"]),
+            "content_hash": row["content_hash"],
+            "indexed_at": parse_datetime(row["indexed_at"]),
+        }
+
+    def get_all(self):
+        with self.lock:
+            rows = self.conn.execute(
+                "SELECT url, lastmod, content_hash, indexed_at FROM pages"
+            ).fetchall()
+        return {
+            row["url"]: {
+                "url": row["url"],
+                "lastmod": parse_datetime(row["lastmod"]),
+                "content_hash": row["content_hash"],
+                "indexed_at": parse_datetime(row["indexed_at"]),
+            }
+            for row in rows
+        }
+
+    def mark_indexed(self, url, content_hash, lastmod=None):
+        # Keep the previously seen lastmod when the caller doesn't know it (webhook updates)
+        lastmod_str = lastmod.isoformat() if lastmod else None
+        with self.lock:
+            self.conn.execute(
+                """INSERT INTO pages (url, lastmod, content_hash, indexed_at)
+                VALUES (?, ?, ?, ?)
+                ON CONFLICT(url) DO UPDATE SET
+                    lastmod = COALESCE(excluded.lastmod, pages.lastmod),
+                    content_hash = excluded.content_hash,
+                    indexed_at = excluded.indexed_at""",
+                (url, lastmod_str, content_hash, utc_now().isoformat()),
+            )
+            self.conn.commit()
+
+    def remove(self, urls):
+        if isinstance(urls, str):
+            urls = [urls]
+        with self.lock:
+            self.conn.executemany(
+                "DELETE FROM pages WHERE url = ?", [(url,) for url in urls]
+            )
+            self.conn.commit()
+
+    # Manifest
+    def get_item(self, url):
+        with self.lock:
+            row = self.conn.execute(
+                "SELECT * FROM items WHERE url = ?", (url,)
+            ).fetchone()
+            if row is None:
+                return None
+            chunks = self.conn.execute(
+                "SELECT chunk_id, chunk_info FROM chunks WHERE url = ?", (url,)
+            ).fetchall()
+        return {
+            "url": row["url"],
+            "is_document": bool(row["is_document"]),
+            "content_hash": row["content_hash"],
+            "indexed_at": parse_datetime(row["indexed_at"]),
+            "title": row["title"],
+            "source_url": row["source_url"],
+            "chunks": {chunk["chunk_id"]: chunk["chunk_info"] for chunk in chunks},
+        }
+
+    def set_item(self, url, is_document, content_hash, chunks, title=None, source_url=None):
+        """Replace an item's manifest entry, chunks is {chunk_id: chunk_info}.
+
+        A chunk ID can be listed by several items (same text on several pages),
+        its point is only deleted when the last of them drops it.
+        """
+        with self.lock:
+            self.conn.execute(
+                """INSERT INTO items
+                    (url, is_document, content_hash, indexed_at, title, source_url)
+                VALUES (?, ?, ?, ?, ?, ?)
+                ON CONFLICT(url) DO UPDATE SET
+                    is_document = excluded.is_document,
+                    content_hash = excluded.content_hash,
+                    indexed_at = excluded.indexed_at,
+                    title = COALESCE(excluded.title, items.title),
+                    source_url = COALESCE(excluded.source_url, items.source_url)""",
+                (url, int(is_document), content_hash, utc_now().isoformat(), title, source_url),
+            )
+            self.conn.execute("DELETE FROM chunks WHERE url = ?", (url,))
+            self.conn.executemany(
+                "INSERT INTO chunks (chunk_id, url, chunk_info) VALUES (?, ?, ?)",
+                [(chunk_id, url, info) for chunk_id, info in chunks.items()],
+            )
+            self.conn.commit()
+
+    def existing_chunk_ids(self, chunk_ids):
+        """Return the subset of chunk IDs indexed for any URL."""
+        chunk_ids = list(chunk_ids)
+        found = set()
+        with self.lock:
+            for start in range(0, len(chunk_ids), SQLITE_MAX_VARS):
+                part = chunk_ids[start : start + SQLITE_MAX_VARS]
+                rows = self.conn.execute(
+                    f"SELECT DISTINCT chunk_id FROM chunks WHERE chunk_id IN ({','.join('?' * len(part))})",
+                    part,
+                ).fetchall()
+                found.update(row["chunk_id"] for row in rows)
+        return found
+
+    def claim_chunks(self, url, chunks):
+        """Add chunk IDs to an item without replacing its entry, chunks is {chunk_id: info}."""
+        with self.lock:
+            self.conn.executemany(
+                "INSERT OR IGNORE INTO chunks (chunk_id, url, chunk_info) VALUES (?, ?, ?)",
+                [(chunk_id, url, info) for chunk_id, info in chunks.items()],
+            )
+            self.conn.commit()
+
+    def chunk_owners(self, chunk_ids, exclude_urls=()):
+        """{chunk_id: {url: chunk_info}} of the items listing each chunk ID."""
+        chunk_ids = list(chunk_ids)
+        exclude_urls = set(exclude_urls)
+        owners = {}
+        with self.lock:
+            for start in range(0, len(chunk_ids), SQLITE_MAX_VARS):
+                part = chunk_ids[start : start + SQLITE_MAX_VARS]
+                rows = self.conn.execute(
+                    "SELECT chunk_id, url, chunk_info FROM chunks "
+                    f"WHERE chunk_id IN ({','.join('?' * len(part))}) ORDER BY url",
+                    part,
+                ).fetchall()
+                for row in rows:
+                    if row["url"] not in exclude_urls:
+                        owners.setdefault(row["chunk_id"], {})[row["url"]] = row["chunk_info"]
+        return owners
+
+    def release_chunks(self, url, chunk_ids):
+        """Drop chunk IDs from an item, returns (IDs no item lists any more, {ID: owners})."""
+        chunk_ids = list(chunk_ids)
+        with self.lock:
+            self.conn.executemany(
+                "DELETE FROM chunks WHERE url = ? AND chunk_id = ?",
+                [(url, chunk_id) for chunk_id in chunk_ids],
+            )
+            self.conn.commit()
+        owners = self.chunk_owners(chunk_ids)
+        return {chunk_id for chunk_id in chunk_ids if chunk_id not in owners}, owners
+
+    def page_urls(self):
+        with self.lock:
+            rows = self.conn.execute(
+                "SELECT url FROM items WHERE is_document = 0"
+            ).fetchall()
+        return {row["url"] for row in rows}
+
+    def remove_items(self, urls):
+        if isinstance(urls, str):
+            urls = [urls]
+        with self.lock:
+            self.conn.executemany(
+                "DELETE FROM items WHERE url = ?", [(url,) for url in urls]
+            )
+            self.conn.executemany(
+                "DELETE FROM chunks WHERE url = ?", [(url,) for url in urls]
+            )
+            self.conn.commit()
+
+    def reconcile(self, qdrant_client, collection_name, dry_run=False, batch_size=1000):
+        """Repair drift between the manifest and Qdrant (Qdrant is the truth)."""
+        qdrant_items = {}
+        offset = None
+        while True:
+            points, offset = qdrant_client.scroll(
+                collection_name=collection_name,
+                limit=batch_size,
+                offset=offset,
+                with_payload=[
+                    "metadata.url",
+                    "metadata.source_url",
+                    "metadata.chunk_info",
+                    "metadata.title",
+                ],
+                with_vectors=False,
+            )
+            for point in points:
+                metadata = point.payload.get("metadata", {})
+                url = metadata.get("url")
+                if not url:
+                    continue
+                item = qdrant_items.setdefault(
+                    url,
+                    {
+                        "is_document": bool(metadata.get("source_url")),
+                        "title": metadata.get("title"),
+                        "source_url": metadata.get("source_url"),
+                        "chunks": {},
+                    },
+                )
+                item["chunks"][str(point.id)] = metadata.get("chunk_info")
+            if offset is None:
+                break
+
+        with self.lock:
+            manifest_urls = {
+                row["url"] for row in self.conn.execute("SELECT url FROM items")
+            }
+        point_ids = {
+            chunk_id for item in qdrant_items.values() for chunk_id in item["chunks"]
+        }
+        report = {"missing": 0, "changed": 0, "removed": 0, "ok": 0}
+        stale_urls = set()
+        for url in set(qdrant_items) | manifest_urls:
+            known = self.get_item(url) if url in manifest_urls else None
+            item = qdrant_items.get(url)
+            if known is None:
+                report["missing"] += 1
+                chunks = item["chunks"]
+            else:
+                # Points carry one owner URL, chunks shared with other items are kept
+                chunks = {
+                    chunk_id: info
+                    for chunk_id, info in known["chunks"].items()
+                    if chunk_id in point_ids
+                }
+                chunks.update(item["chunks"] if item else {})
+                if not chunks:
+                    stale_urls.add(url)
+                    continue
+                if known["chunks"] == chunks:
+                    report["ok"] += 1
+                    continue
+                report["changed"] += 1
+            if not dry_run:
+                is_document = item["is_document"] if item else known["is_document"]
+                # Unknown content hash makes the next ingest re-check the item
+                self.set_item(
+                    url,
+                    is_document,
+                    None,
+                    chunks,
+                    title=item["title"] if item else None,
+                    source_url=item["source_url"] if item else None,
+                )
+                with self.lock:
+                    self.conn.execute(
+                        "UPDATE pages SET content_hash = NULL WHERE url = ?", (url,)
+                    )
+                    self.conn.commit()
+        report["removed"] = len(stale_urls)
+        if stale_urls and not dry_run:
+            self.remove_items(stale_urls)
+        if not dry_run:
+            with self.lock:
+                self.conn.execute(
+                    "INSERT OR REPLACE INTO meta (key, value) VALUES ('manifest_reconciled_at', ?)",
+                    (utc_now().isoformat(),),
+                )
+                self.conn.commit()
+        logger.info(f"Manifest reconcile ({'dry-run' if dry_run else 'applied'}): {report}")
+        return report
+
+
+_crawl_state = None
+_crawl_state_lock = threading.Lock()
+
+
+def get_crawl_state():
+    global _crawl_state
+    with _crawl_state_lock:
+        if _crawl_state is None:
+            _crawl_state = CrawlState()
+        return _crawl_state
+
+
+def needs_update(lastmod, state, max_age=None):
+    """Decide if a sitemap entry has to be re-scraped.
+
+    Returns a reason string ("new", "modified", "stale") or None if the page is up to date.
+    """
+    if state is None:
+        return "new"
+    if lastmod is not None:
+        if state["lastmod"] is not None:
+            if lastmod > state["lastmod"]:
+                return "modified"
+        elif state["indexed_at"] is None or lastmod > state["indexed_at"]:
+            return "modified"
+        return None
+    # No lastmod in the sitemap, fall back to age of the last index
+    if max_age is not None and (
+        state["indexed_at"] is None or utc_now() - state["indexed_at"] > max_age
+    ):
+        return "stale"
+    return None
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(message)s")
+
+    parser = argparse.ArgumentParser(description="Crawl state and chunk manifest tools.")
+    parser.add_argument("command", choices=["reconcile"])
+    parser.add_argument("--dry-run", action="store_true")
+    args = parser.parse_args()
+
+    from config import COLLECTION_NAME, get_qdrant_client
+
+    print(
+        get_crawl_state().reconcile(
+            get_qdrant_client(), COLLECTION_NAME, dry_run=args.dry_run
+        )
+    )
@@ -0,0 +1,161 @@
+import contextvars
+import logging
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+
+from metrics import increment
+
+# Setup Logging
+logger = logging.getLogger(__name__)
+
+# Latency budget of one chat answer (until the answer stream starts) and per stage caps
+REQUEST_BUDGET = float(os.getenv("CHAT_LATENCY_BUDGET", "20"))
+STAGE_DEADLINES = {
+    "rewrite": float(os.getenv("DEADLINE_REWRITE", "8")),
+    "embed": float(os.getenv("DEADLINE_EMBED", "4")),
+    "search": float(os.getenv("DEADLINE_SEARCH", "4")),
+}
+
+# Hedging, a duplicate request is sent after the stage's p95 latency
+HEDGE_MIN_DELAY = 0.3
+HEDGE_MAX_DELAY = 2.0
+HEDGE_DEFAULT_DELAY = 1.0  # Until enough samples are collected
+HEDGE_MIN_SAMPLES = 20
+LATENCY_WINDOW = 200
+
+# Hedge attempts only, sized like the thread pool that serves the requests (asyncio's default)
+HEDGE_WORKERS = int(os.getenv("HEDGE_WORKERS", str(min(32, (os.cpu_count() or 1) + 4))))
+
+_hedge_pool = ThreadPoolExecutor(max_workers=HEDGE_WORKERS, thread_name_prefix="hedge")
+
+
+class DeadlineExceeded(Exception):
+    pass
+
+
+class Deadline:
+    def __init__(self, seconds=REQUEST_BUDGET):
+        self.expires = time.monotonic() + seconds
+
+    def remaining(self, stage=None):
+        """Seconds left, capped by the stage deadline."""
+        remaining = max(0.0, self.expires - time.monotonic())
+        if stage in STAGE_DEADLINES:
+            remaining = min(remaining, STAGE_DEADLINES[stage])
+        return remaining
+
+
+class LatencyTracker:
+    """Rolling latency window per stage, used to derive hedge delays."""
+
+    def __init__(self, window=LATENCY_WINDOW):
+        self.lock = threading.Lock()
+        self.samples = {}
+        self.window = window
+
+    def record(self, stage, seconds):
+        with self.lock:
+            self.samples.setdefault(stage, deque(maxlen=self.window)).append(seconds)
+
+    def percentile(self, stage, q=0.95):
+        with self.lock:
+            samples = sorted(self.samples.get(stage, ()))
+        if len(samples) < HEDGE_MIN_SAMPLES:
+            return None
+        return samples[min(len(samples) - 1, int(q * len(samples)))]
+
+    def hedge_delay(self, stage):
+        p95 = self.percentile(stage)
+        if p95 is None:
+            return HEDGE_DEFAULT_DELAY
+        return min(HEDGE_MAX_DELAY, max(HEDGE_MIN_DELAY, p95))
+
+
+latency_tracker = LatencyTracker()
+
+
+def _start_primary(function, timeout):
+    """Run the first attempt of a hedged call in its own thread, never queued behind others."""
+    future = Future()
+
+    def run():
+        try:
+            future.set_result(function(timeout))
+        except Exception as e:
+            future.set_exception(e)
+
+    context = contextvars.copy_context()
+    threading.Thread(target=context.run, args=(run,), name="hedged-call", daemon=True).start()
+    return future
+
+
+def _run_hedge(function, stage_deadline):
+    # A hedge that waited in the pool past the deadline is not sent at all
+    remaining = stage_deadline - time.monotonic()
+    if remaining <= 0:
+        raise DeadlineExceeded("Hedge started after the deadline")
+    return function(remaining)
+
+
+def call_with_deadline(stage, function, deadline: Deadline, hedge=False):
+    """Run function(timeout) within the stage deadline, first successful response wins.
+
+    Calls run in the request thread. With hedge=True (idempotent calls only) the
+    call runs in its own thread instead, and a duplicate request is started from
+    the hedge pool when the first hasn't answered after the stage's p95 latency.
+    """
+    timeout = deadline.remaining(stage)
+    if timeout <= 0:
+        increment(f"deadline_exceeded_{stage}")
+        raise DeadlineExceeded(f"No time left for {stage}")
+
+    started = time.monotonic()
+    if not hedge:
+        try:
+            result = function(timeout)
+        except Exception as e:
+            # The call's own timeout fired, reported like any exceeded deadline
+            if time.monotonic() - started >= timeout:
+                increment(f"deadline_exceeded_{stage}")
+                raise DeadlineExceeded(f"{stage} exceeded {timeout:.1f}s") from e
+            raise
+        latency_tracker.record(stage, time.monotonic() - started)
+        return result
+
+    stage_deadline = started + timeout
+    futures = {_start_primary(function, timeout): "primary"}
+    hedge_at = started + latency_tracker.hedge_delay(stage)
+    last_error = None
+    try:
+        while futures:
+            now = time.monotonic()
+            if now >= stage_deadline:
+                break
+            wake_at = min(stage_deadline, hedge_at) if hedge_at else stage_deadline
+            done, _ = wait(futures, timeout=max(0, wake_at - now), return_when=FIRST_COMPLETED)
+            for future in done:
+                kind = futures.pop(future)
+                if future.exception() is None:
+                    latency_tracker.record(stage, time.monotonic() - started)
+                    if kind == "hedge":
+                        increment(f"hedge_wins_{stage}")
+                    return future.result()
+                last_error = future.exception()
+                logger.warning(f"{stage} {kind} request failed: {last_error}")
+            if hedge_at and time.monotonic() >= hedge_at:
+                hedge_at = None
+                if stage_deadline > time.monotonic():
+                    increment(f"hedged_{stage}")
+                    futures[_hedge_pool.submit(_run_hedge, function, stage_deadline)] = "hedge"
+    finally:
+        # A losing hedge still waiting for a pool thread is dropped
+        for future in futures:
+            future.cancel()
+
+    if futures or last_error is None:
+        increment(f"deadline_exceeded_{stage}")
+        raise DeadlineExceeded(f"{stage} exceeded {timeout:.1f}s")
+    raise last_error
@@ -0,0 +1,272 @@
+import logging
+import multiprocessing
+import os
+import re
+import tempfile
+import threading
+import time
+from concurrent.futures import (
+    CancelledError,
+    ProcessPoolExecutor,
+    TimeoutError as FutureTimeoutError,
+)
+from concurrent.futures.process import BrokenProcessPool
+
+import docx
+import pdfplumber
+import pypdfium2
+import requests
+
+from ingest_profiler import stage
+
+# Setup Logging
+logging.getLogger("pdfminer").setLevel(logging.ERROR)
+logger = logging.getLogger(__name__)
+
+# Document Limits
+MAX_DOCUMENT_BYTES = 50 * 1024 * 1024
+MAX_PAGES = 300
+DOCUMENT_TIMEOUT = 120  # Seconds per document (download + extraction)
+DOWNLOAD_TIMEOUT = (10, 30)  # Connect, read
+DOWNLOAD_CHUNK_BYTES = 256 * 1024
+
+# Parallel Extraction
+EXTRACT_PROCESSES = min(4, os.cpu_count() or 1)
+PAGES_PER_TASK = 16
+GARBLED_RATIO = 0.1  # Share of unreadable characters that triggers the pdfplumber fallback
+
+LEADER_PATTERN = re.compile(r"[\.\-_]{3,}")
+GARBLED_PATTERN = re.compile(r"�|\(cid:\d+\)|[\x00-\x08\x0e-\x1f]")
+
+DOCX_CONTENT_TYPES = (
+    "application/vnd.openxmlformats-officedocument.wordprocessingml.document",
+    "application/msword",
+    "application/octet-stream",
+)
+
+
+class DocumentTooLarge(Exception):
+    pass
+
+
+# Throughput metrics for the lifetime of the process
+metrics = {
+    "documents": 0,
+    "pages": 0,
+    "fallback_pages": 0,
+    "bytes": 0,
+    "seconds": 0.0,
+    "failed": 0,
+}
+_metrics_lock = threading.Lock()
+
+
+def _record(pages=0, fallback_pages=0, size=0, seconds=0.0, failed=False):
+    with _metrics_lock:
+        metrics["documents"] += 1
+        metrics["pages"] += pages
+        metrics["fallback_pages"] += fallback_pages
+        metrics["bytes"] += size
+        metrics["seconds"] += seconds
+        metrics["failed"] += int(failed)
+
+
+def get_metrics():
+    with _metrics_lock:
+        snapshot = dict(metrics)
+    seconds = snapshot["seconds"] or 1e-9
+    snapshot["pages_per_second"] = round(snapshot["pages"] / seconds, 1)
+    snapshot["mb_per_second"] = round(snapshot["bytes"] / 1024 / 1024 / seconds, 2)
+    return snapshot
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def _get_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            # Forked workers could inherit locks held by the ingest threads (logging,
+            # embedding dispatcher), the forkserver starts them from a clean process
+            _pool = ProcessPoolExecutor(
+                max_workers=EXTRACT_PROCESSES,
+                mp_context=multiprocessing.get_context("forkserver"),
+            )
+        return _pool
+
+
+def _recycle_pool(pool):
+    """Stop the workers of a pool, running tasks can't be cancelled any other way."""
+    global _pool
+    with _pool_lock:
+        if _pool is pool:
+            _pool = None
+    for process in list((pool._processes or {}).values()):
+        process.terminate()
+    pool.shutdown(wait=False, cancel_futures=True)
+
+
+# 1 Stream download to a temp file with a byte cap
+def download_document(url, cookies=None, max_bytes=MAX_DOCUMENT_BYTES):
+    with requests.get(url, cookies=cookies, timeout=DOWNLOAD_TIMEOUT, stream=True) as response:
+        response.raise_for_status()
+        content_type = response.headers.get("Content-Type", "").lower()
+        declared = response.headers.get("Content-Length")
+        if declared and declared.isdigit() and int(declared) > max_bytes:
+            raise DocumentTooLarge(f"{url} is {declared} bytes, max {max_bytes}")
+
+        size = 0
+        spool = tempfile.NamedTemporaryFile(prefix="intranet_doc_", delete=False)
+        try:
+            for block in response.iter_content(DOWNLOAD_CHUNK_BYTES):
+                size += len(block)
+                if size > max_bytes:
+                    raise DocumentTooLarge(f"{url} exceeds {max_bytes} bytes")
+                spool.write(block)
+            spool.close()
+        except Exception:
+            spool.close()
+            os.remove(spool.name)
+            raise
+    return spool.name, content_type, size
+
+
+def _clean(text):
+    return LEADER_PATTERN.sub("", text)
+
+
+def _is_garbled(text):
+    if not text.strip():
+        return True
+    return len(GARBLED_PATTERN.findall(text)) / len(text) > GARBLED_RATIO
+
+
+# 2 Worker: extract a page range with pdfium, pdfplumber only for pages it gets wrong
+def _extract_pdf_pages(path, start, end):
+    pages = []
+    fallback_pages = 0
+    pdf = pypdfium2.PdfDocument(path)
+    plumber = None
+    try:
+        for index in range(start, end):
+            page = pdf[index]
+            textpage = page.get_textpage()
+            text = textpage.get_text_range().replace("\r\n", "\n")
+            textpage.close()
+            page.close()
+
+            if _is_garbled(text):
+                if plumber is None:
+                    plumber = pdfplumber.open(path)
+                fallback_text = plumber.pages[index].extract_text() or ""
+                if fallback_text.strip():
+                    text = fallback_text
+                    fallback_pages += 1
+            pages.append(_clean(text) if text.strip() else "")
+    finally:
+        if plumber is not None:
+            plumber.close()
+        pdf.close()
+    return pages, fallback_pages
+
+
+def _pdf_page_count(path):
+    pdf = pypdfium2.PdfDocument(path)
+    try:
+        return len(pdf)
+    finally:
+        pdf.close()
+
+
+def extract_pdf(path, max_pages=MAX_PAGES, timeout=DOCUMENT_TIMEOUT):
+    # Every pdfium call runs in a worker process, so the deadline also holds inside C code
+    deadline = time.monotonic() + timeout
+    for attempt in range(2):
+        pool = _get_pool()
+        try:
+            page_count = pool.submit(_pdf_page_count, path).result(
+                timeout=max(0, deadline - time.monotonic())
+            )
+            if page_count > max_pages:
+                logger.warning(
+                    f"PDF has {page_count} pages, only extracting the first {max_pages}"
+                )
+                page_count = max_pages
+            futures = [
+                pool.submit(
+                    _extract_pdf_pages, path, start, min(start + PAGES_PER_TASK, page_count)
+                )
+                for start in range(0, page_count, PAGES_PER_TASK)
+            ]
+            pages = []
+            fallback_pages = 0
+            for future in futures:
+                part, part_fallback = future.result(timeout=max(0, deadline - time.monotonic()))
+                pages.extend(part)
+                fallback_pages += part_fallback
+            return pages, fallback_pages
+        except FutureTimeoutError:
+            logger.warning(f"PDF extraction exceeded {timeout:.0f}s, restarting the workers")
+            _recycle_pool(pool)
+            raise
+        except (BrokenProcessPool, CancelledError):
+            # Another document's timeout restarted the workers, retry once on new ones
+            _recycle_pool(pool)
+            if attempt or time.monotonic() >= deadline:
+                raise
+
+
+def extract_docx(path):
+    doc = docx.Document(path)
+    text_content = []
+    for para in doc.paragraphs:
+        text_content.append(_clean(para.text))
+
+    for table in doc.tables:
+        for row in table.rows:
+            for cell in row.cells:
+                text_content.append(_clean(cell.text))
+    return " ".join(text_content) if text_content else None
+
+
+# Main, Download and extract text from a linked PDF/DOCX
+def extract_document(url, cookies=None):
+    started = time.monotonic()
+    path = None
+    try:
+        with stage("download") as downloaded:
+            path, content_type, size = download_document(url, cookies)
+            downloaded.bytes = size
+
+        if any(docx_type in content_type for docx_type in DOCX_CONTENT_TYPES):
+            with stage("docx_parse", size):
+                text = extract_docx(path)
+            _record(size=size, seconds=time.monotonic() - started)
+            return text
+        elif "pdf" in content_type:
+            remaining = DOCUMENT_TIMEOUT - (time.monotonic() - started)
+            with stage("pdf_parse", size):
+                pages, fallback_pages = extract_pdf(path, timeout=remaining)
+            seconds = time.monotonic() - started
+            _record(len(pages), fallback_pages, size, seconds)
+            logger.info(
+                f"Extracted {len(pages)} pages ({fallback_pages} via pdfplumber) from {url} "
+                f"in {seconds:.1f}s, {len(pages) / max(seconds, 1e-9):.1f} pages/s"
+            )
+            pages = [page for page in pages if page]
+            # Page breaks are kept as paragraph breaks for the chunker
+            return "\n\n".join(pages) if pages else None
+        return None
+    except FutureTimeoutError:
+        logger.warning(f"Extraction of {url} exceeded {DOCUMENT_TIMEOUT}s, skipped")
+        _record(seconds=time.monotonic() - started, failed=True)
+        return None
+    except (requests.exceptions.RequestException, Exception) as e:
+        logger.info(f"Error fetching or processing PDF/DOCX from {url}: {str(e)}")
+        _record(seconds=time.monotonic() - started, failed=True)
+        return None
+    finally:
+        if path and os.path.exists(path):
+            os.remove(path)
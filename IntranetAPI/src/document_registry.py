@@ -0,0 +1,150 @@
+import logging
+import sqlite3
+import threading
+from datetime import timedelta
+
+from crawl_state import parse_datetime, utc_now
+
+# Setup Logging
+logger = logging.getLogger(__name__)
+
+DOCUMENT_REGISTRY_PATH = "../data/document_registry.db"
+DOCUMENT_RECHECK = timedelta(hours=20)  # Linked documents are downloaded at most this often
+
+
+class DocumentRegistry:
+    """Linked documents and the pages that link them (many-to-many).
+
+    A document is indexed once per content version and its points are only
+    removed when no page references it any more.
+    """
+
+    def __init__(self, db_path=DOCUMENT_REGISTRY_PATH):
+        self.db_path = db_path
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(db_path, check_same_thread=False, timeout=30)
+        self.conn.row_factory = sqlite3.Row
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute(
+            """CREATE TABLE IF NOT EXISTS documents (
+                url TEXT PRIMARY KEY,
+                content_hash TEXT,
+                indexed_at TEXT,
+                checked_at TEXT
+            )"""
+        )
+        self.conn.execute(
+            """CREATE TABLE IF NOT EXISTS page_documents (
+                page_url TEXT NOT NULL,
+                document_url TEXT NOT NULL,
+                PRIMARY KEY (page_url, document_url)
+            )"""
+        )
+        self.conn.execute(
+            "CREATE INDEX IF NOT EXISTS page_documents_document ON page_documents (document_url)"
+        )
+        self.conn.commit()
+
+    def get(self, url):
+        with self.lock:
+            row = self.conn.execute(
+                "SELECT * FROM documents WHERE url = ?", (url,)
+            ).fetchone()
+        if row is None:
+            return None
+        return {
+            "url": row["url"],
+            "content_hash": row["content_hash"],
+            "indexed_at": parse_datetime(row["indexed_at"]),
+            "checked_at": parse_datetime(row["checked_at"]),
+        }
+
+    def is_fresh(self, url, recheck=DOCUMENT_RECHECK):
+        """True if the document was downloaded recently and can be skipped."""
+        document = self.get(url)
+        return bool(
+            document
+            and document["content_hash"]
+            and document["checked_at"]
+            and utc_now() - document["checked_at"] < recheck
+        )
+
+    def mark_indexed(self, url, content_hash):
+        now = utc_now().isoformat()
+        with self.lock:
+            self.conn.execute(
+                """INSERT INTO documents (url, content_hash, indexed_at, checked_at)
+                VALUES (?, ?, ?, ?)
+                ON CONFLICT(url) DO UPDATE SET
+                    content_hash = excluded.content_hash,
+                    indexed_at = excluded.indexed_at,
+                    checked_at = excluded.checked_at""",
+                (url, content_hash, now, now),
+            )
+            self.conn.commit()
+
+    def mark_checked(self, url):
+        with self.lock:
+            self.conn.execute(
+                "UPDATE documents SET checked_at = ? WHERE url = ?",
+                (utc_now().isoformat(), url),
+            )
+            self.conn.commit()
+
+    def references(self, url):
+        with self.lock:
+            rows = self.conn.execute(
+                "SELECT page_url FROM page_documents WHERE document_url = ?", (url,)
+            ).fetchall()
+        return {row["page_url"] for row in rows}
+
+    def links(self, page_url):
+        with self.lock:
+            rows = self.conn.execute(
+                "SELECT document_url FROM page_documents WHERE page_url = ?", (page_url,)
+            ).fetchall()
+        return {row["document_url"] for row in rows}
+
+    def set_page_links(self, page_url, document_urls):
+        """Replace the documents linked from a page, returns documents left unreferenced."""
+        document_urls = set(document_urls)
+        with self.lock:
+            previous = {
+                row["document_url"]
+                for row in self.conn.execute(
+                    "SELECT document_url FROM page_documents WHERE page_url = ?",
+                    (page_url,),
+                )
+            }
+            self.conn.executemany(
+                "DELETE FROM page_documents WHERE page_url = ? AND document_url = ?",
+                [(page_url, url) for url in previous - document_urls],
+            )
+            self.conn.executemany(
+                "INSERT OR IGNORE INTO page_documents (page_url, document_url) VALUES (?, ?)",
+                [(page_url, url) for url in document_urls - previous],
+            )
+            self.conn.commit()
+        return self._unreferenced(previous - document_urls)
+
+    def remove_page(self, page_url):
+        """Drop all links from a page, returns documents left unreferenced."""
+        return self.set_page_links(page_url, [])
+
+    def _unreferenced(self, urls):
+        with self.lock:
+            return {
+                url
+                for url in urls
+                if self.conn.execute(
+                    "SELECT 1 FROM page_documents WHERE document_url = ? LIMIT 1", (url,)
+                ).fetchone()
+                is None
+            }
+
+    def remove_documents(self, urls):
+        with self.lock:
+            self.conn.executemany(
+                "DELETE FROM documents WHERE url = ?", [(url,) for url in urls]
+            )
+            self.conn.commit()
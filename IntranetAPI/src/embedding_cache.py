@@ -0,0 +1,165 @@
+import argparse
+import logging
+import sqlite3
+import threading
+
+import numpy as np
+
+# Setup Logging
+logger = logging.getLogger(__name__)
+
+EMBEDDING_CACHE_PATH = "../data/embedding_cache.db"
+STORE_DTYPE = np.float32  # np.float16 halves the size at ~1e-3 precision
+SQLITE_MAX_VARS = 900
+
+
+class EmbeddingCache:
+    """Persistent embedding store keyed by (chunk hash, model)."""
+
+    def __init__(self, db_path=EMBEDDING_CACHE_PATH, dtype=STORE_DTYPE):
+        self.db_path = db_path
+        self.dtype = np.dtype(dtype)
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.conn = sqlite3.connect(db_path, check_same_thread=False, timeout=30)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute(
+            """CREATE TABLE IF NOT EXISTS embeddings (
+                chunk_hash TEXT NOT NULL,
+                model TEXT NOT NULL,
+                dtype TEXT NOT NULL,
+                vector BLOB NOT NULL,
+                PRIMARY KEY (chunk_hash, model)
+            )"""
+        )
+        self.conn.commit()
+
+    def get_many(self, chunk_hashes, model):
+        """Return {chunk_hash: float32 vector} for the hashes found in the cache."""
+        found = {}
+        chunk_hashes = list(dict.fromkeys(chunk_hashes))
+        with self.lock:
+            for start in range(0, len(chunk_hashes), SQLITE_MAX_VARS):
+                part = chunk_hashes[start : start + SQLITE_MAX_VARS]
+                rows = self.conn.execute(
+                    f"""SELECT chunk_hash, dtype, vector FROM embeddings
+                    WHERE model = ? AND chunk_hash IN ({",".join("?" * len(part))})""",
+                    (model, *part),
+                ).fetchall()
+                for chunk_hash, dtype, blob in rows:
+                    found[chunk_hash] = np.frombuffer(blob, dtype=dtype).astype(
+                        np.float32
+                    )
+            self.hits += len(found)
+            self.misses += len(chunk_hashes) - len(found)
+        return found
+
+    def put_many(self, items, model):
+        """Store (chunk_hash, vector) pairs."""
+        rows = [
+            (
+                chunk_hash,
+                model,
+                self.dtype.name,
+                np.asarray(vector, dtype=self.dtype).tobytes(),
+            )
+            for chunk_hash, vector in items
+        ]
+        with self.lock:
+            self.conn.executemany(
+                "INSERT OR REPLACE INTO embeddings VALUES (?, ?, ?, ?)", rows
+            )
+            self.conn.commit()
+
+    def stats(self):
+        with self.lock:
+            total = self.hits + self.misses
+            rows = self.conn.execute(
+                "SELECT model, COUNT(*) FROM embeddings GROUP BY model"
+            ).fetchall()
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0,
+            "stored": dict(rows),
+        }
+
+    # Bulk export/import for offline rebuilds
+    def export_npz(self, path, model):
+        with self.lock:
+            rows = self.conn.execute(
+                "SELECT chunk_hash, dtype, vector FROM embeddings WHERE model = ?",
+                (model,),
+            ).fetchall()
+        chunk_hashes = np.array([row[0] for row in rows])
+        vectors = np.stack(
+            [np.frombuffer(row[2], dtype=row[1]).astype(self.dtype) for row in rows]
+        ) if rows else np.empty((0, 0), dtype=self.dtype)
+        np.savez(path, chunk_hashes=chunk_hashes, vectors=vectors, model=model)
+        logger.info(f"Exported {len(rows)} embeddings to {path}")
+        return len(rows)
+
+    def import_npz(self, path):
+        with np.load(path) as data:
+            model = str(data["model"])
+            chunk_hashes = data["chunk_hashes"].tolist()
+            self.put_many(zip(chunk_hashes, data["vectors"]), model)
+        logger.info(f"Imported {len(chunk_hashes)} embeddings from {path}")
+        return len(chunk_hashes)
+
+    def import_qdrant(self, qdrant_client, collection_name, model, batch_size=256):
+        """Seed the cache from an existing collection (point IDs are chunk hashes)."""
+        count = 0
+        offset = None
+        while True:
+            points, offset = qdrant_client.scroll(
+                collection_name=collection_name,
+                limit=batch_size,
+                offset=offset,
+                with_payload=False,
+                with_vectors=True,
+            )
+            self.put_many(
+                [(str(point.id), point.vector) for point in points if point.vector],
+                model,
+            )
+            count += len(points)
+            logger.info(f"Imported {count} embeddings from {collection_name}")
+            if offset is None:
+                break
+        return count
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_embedding_cache():
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = EmbeddingCache()
+        return _cache
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(message)s")
+
+    parser = argparse.ArgumentParser(description="Manage the local embedding cache.")
+    parser.add_argument("command", choices=["stats", "export", "import", "import-qdrant"])
+    parser.add_argument("path", nargs="?", help="npz file for export/import")
+    parser.add_argument("--model", default="text-embedding-3-large")
+    args = parser.parse_args()
+
+    cache = get_embedding_cache()
+    if args.command == "stats":
+        print(cache.stats())
+    elif args.command == "export":
+        cache.export_npz(args.path, args.model)
+    elif args.command == "import":
+        cache.import_npz(args.path)
+    elif args.command == "import-qdrant":
+        from config import COLLECTION_NAME, get_qdrant_client
+
+        cache.import_qdrant(get_qdrant_client(), COLLECTION_NAME, args.model)
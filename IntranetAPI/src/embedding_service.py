@@ -0,0 +1,287 @@
+import logging
+import queue
+import re
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+
+import openai
+import requests
+
+from essential_methods import get_encoding
+
+# Setup Logging
+logger = logging.getLogger(__name__)
+
+EMBEDDING_MODEL = "text-embedding-3-large"
+
+# Batch Constants
+MAX_BATCH_TOKENS = 100000  # OpenAI allows max 300k tokens per request
+MAX_BATCH_INPUTS = 1000  # OpenAI allows max 2048 inputs per request
+MAX_INPUT_TOKENS = 8191
+MAX_CONCURRENT_REQUESTS = 4
+LINGER_SECONDS = 0.05  # Wait for more callers before sending a partial batch
+
+# Rate Limits (tier defaults, corrected from response headers)
+TOKENS_PER_MINUTE = 1000000
+REQUESTS_PER_MINUTE = 3000
+MAX_RETRIES = 5
+
+DURATION_PATTERN = re.compile(r"(\d+(?:\.\d+)?)(ms|s|m|h)")
+DURATION_UNITS = {"ms": 0.001, "s": 1, "m": 60, "h": 3600}
+
+
+def parse_reset_duration(value):
+    """Parse OpenAI reset headers like "6m0s", "1.5s" or "120ms" to seconds."""
+    if not value:
+        return None
+    seconds = 0.0
+    for amount, unit in DURATION_PATTERN.findall(value):
+        seconds += float(amount) * DURATION_UNITS[unit]
+    return seconds
+
+
+class TokenBucket:
+    """Token bucket refilled continuously up to a per-minute capacity."""
+
+    def __init__(self, per_minute):
+        self.capacity = float(per_minute)
+        self.level = float(per_minute)
+        self.rate = per_minute / 60.0
+        self.updated = time.monotonic()
+
+    def refill(self, now):
+        self.level = min(self.capacity, self.level + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, amount):
+        # Requests larger than the whole bucket are let through once it is full
+        amount = min(amount, self.capacity)
+        if self.level >= amount:
+            return 0.0
+        return (amount - self.level) / self.rate
+
+
+class RateLimiter:
+    """Request- and token-per-minute limiter shared by all embedding requests."""
+
+    def __init__(
+        self, tokens_per_minute=TOKENS_PER_MINUTE, requests_per_minute=REQUESTS_PER_MINUTE
+    ):
+        self.tokens = TokenBucket(tokens_per_minute)
+        self.requests = TokenBucket(requests_per_minute)
+        self.paused_until = 0.0
+        self.condition = threading.Condition()
+
+    def acquire(self, tokens):
+        with self.condition:
+            while True:
+                now = time.monotonic()
+                self.tokens.refill(now)
+                self.requests.refill(now)
+                wait = max(
+                    self.paused_until - now,
+                    self.tokens.wait_time(tokens),
+                    self.requests.wait_time(1),
+                )
+                if wait <= 0:
+                    self.tokens.level -= min(tokens, self.tokens.capacity)
+                    self.requests.level -= 1
+                    return
+                self.condition.wait(wait)
+
+    def pause(self, seconds):
+        with self.condition:
+            self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+
+    def update_from_headers(self, headers):
+        """Align the local buckets with what the API reports as remaining."""
+        with self.condition:
+            now = time.monotonic()
+            for bucket, kind in ((self.tokens, "tokens"), (self.requests, "requests")):
+                limit = headers.get(f"x-ratelimit-limit-{kind}")
+                remaining = headers.get(f"x-ratelimit-remaining-{kind}")
+                if limit and limit.isdigit() and float(limit) != bucket.capacity:
+                    bucket.capacity = float(limit)
+                    bucket.rate = bucket.capacity / 60.0
+                if remaining and remaining.isdigit():
+                    bucket.refill(now)
+                    bucket.level = min(bucket.level, float(remaining))
+                    if int(remaining) == 0:
+                        reset = parse_reset_duration(
+                            headers.get(f"x-ratelimit-reset-{kind}")
+                        )
+                        if reset:
+                            self.paused_until = max(self.paused_until, now + reset)
+            self.condition.notify_all()
+
+
+class _EmbeddingRequest:
+    def __init__(self, texts):
+        self.future = Future()
+        self.embeddings = [None] * len(texts)
+        self.remaining = len(texts)
+        self.lock = threading.Lock()
+
+    def fill(self, index, embedding):
+        with self.lock:
+            self.embeddings[index] = embedding
+            self.remaining -= 1
+            done = self.remaining == 0
+        if done and not self.future.done():
+            self.future.set_result(self.embeddings)
+
+    def fail(self, error):
+        if not self.future.done():
+            self.future.set_exception(error)
+
+
+class EmbeddingService:
+    """Gathers texts from many callers into token-sized batches.
+
+    Batches are sent concurrently under a shared rate limiter, and every
+    caller gets a Future with its own embeddings in input order.
+    """
+
+    def __init__(
+        self,
+        model=EMBEDDING_MODEL,
+        max_batch_tokens=MAX_BATCH_TOKENS,
+        max_batch_inputs=MAX_BATCH_INPUTS,
+        max_concurrent_requests=MAX_CONCURRENT_REQUESTS,
+        rate_limiter=None,
+    ):
+        self.model = model
+        self.max_batch_tokens = max_batch_tokens
+        self.max_batch_inputs = max_batch_inputs
+        self.rate_limiter = rate_limiter or RateLimiter()
+        self.encoding = get_encoding(model)
+        self.session = requests.Session()
+        self.pending = queue.Queue()
+        self.held_over = None  # Input that didn't fit the last batch, it starts the next one
+        self.executor = ThreadPoolExecutor(
+            max_workers=max_concurrent_requests, thread_name_prefix="embedding"
+        )
+        self.slots = threading.Semaphore(max_concurrent_requests)
+        self.dispatcher = threading.Thread(
+            target=self._dispatch_loop, name="embedding-dispatcher", daemon=True
+        )
+        self.dispatcher.start()
+
+    def submit(self, texts):
+        request = _EmbeddingRequest(texts)
+        if not texts:
+            request.future.set_result([])
+            return request.future
+        # Every input is checked before any is queued, a rejected request sends nothing
+        items = []
+        for index, text in enumerate(texts):
+            tokens = len(self.encoding.encode(text))
+            if tokens > MAX_INPUT_TOKENS:
+                request.fail(
+                    ValueError(f"Input {index} has {tokens} tokens, max {MAX_INPUT_TOKENS}")
+                )
+                return request.future
+            items.append((request, index, text, tokens))
+        for item in items:
+            self.pending.put(item)
+        return request.future
+
+    def embed(self, texts, timeout=None):
+        return self.submit(texts).result(timeout=timeout)
+
+    # Collect queued inputs into one batch, lingering briefly for other callers
+    def _next_batch(self):
+        if self.held_over is not None:
+            batch, self.held_over = [self.held_over], None
+        else:
+            batch = [self.pending.get()]
+        batch_tokens = batch[0][3]
+        deadline = time.monotonic() + LINGER_SECONDS
+        while len(batch) < self.max_batch_inputs:
+            timeout = deadline - time.monotonic()
+            try:
+                item = (
+                    self.pending.get(timeout=timeout)
+                    if timeout > 0
+                    else self.pending.get_nowait()
+                )
+            except queue.Empty:
+                break
+            if batch_tokens + item[3] > self.max_batch_tokens:
+                # Kept in order, it goes first in the next batch
+                self.held_over = item
+                break
+            batch.append(item)
+            batch_tokens += item[3]
+        return batch, batch_tokens
+
+    def _dispatch_loop(self):
+        while True:
+            batch, batch_tokens = self._next_batch()
+            self.slots.acquire()
+            self.executor.submit(self._send_batch, batch, batch_tokens)
+
+    def _send_batch(self, batch, batch_tokens):
+        try:
+            embeddings = self._post_with_retry([item[2] for item in batch], batch_tokens)
+            for (request, index, _, _), embedding in zip(batch, embeddings):
+                request.fill(index, embedding)
+        except Exception as e:
+            logger.error(f"Embedding batch of {len(batch)} inputs failed: {e}")
+            for request, _, _, _ in batch:
+                request.fail(e)
+        finally:
+            self.slots.release()
+
+    def _post_with_retry(self, texts, batch_tokens):
+        url = f"{openai.api_base.rstrip('/')}/embeddings"
+        headers = {"Authorization": f"Bearer {openai.api_key}"}
+        for attempt in range(MAX_RETRIES + 1):
+            self.rate_limiter.acquire(batch_tokens)
+            try:
+                response = self.session.post(
+                    url,
+                    json={"model": self.model, "input": texts},
+                    headers=headers,
+                    timeout=60,
+                )
+            except requests.exceptions.RequestException as e:
+                if attempt == MAX_RETRIES:
+                    raise
+                backoff = min(2**attempt, 30)
+                logger.warning(f"Embedding request error: {e}, retrying in {backoff}s")
+                time.sleep(backoff)
+                continue
+
+            self.rate_limiter.update_from_headers(response.headers)
+            if response.status_code == 429 or response.status_code >= 500:
+                if attempt == MAX_RETRIES:
+                    response.raise_for_status()
+                retry_after = response.headers.get("retry-after")
+                backoff = (
+                    float(retry_after)
+                    if retry_after and retry_after.replace(".", "", 1).isdigit()
+                    else min(2**attempt, 30)
+                )
+                logger.warning(
+                    f"Embedding request got {response.status_code}, retrying in {backoff}s"
+                )
+                self.rate_limiter.pause(backoff)
+                continue
+            response.raise_for_status()
+
+            data = sorted(response.json()["data"], key=lambda e: e["index"])
+            return [e["embedding"] for e in data]
+
+
+_service = None
+_service_lock = threading.Lock()
+
+
+def get_embedding_service():
+    global _service
+    with _service_lock:
+        if _service is None:
+            _service = EmbeddingService()
+        return _service
@@ -1,7 +1,9 @@
 import hashlib
 import uuid
 import logging
-from datetime import datetime, timezone
+import time
+from functools import lru_cache
+from datetime import datetime
 from zoneinfo import ZoneInfo
 import tiktoken
 
@@ -12,9 +14,39 @@ def generate_uuid(text):
     return str(uuid.UUID(hash_object.hexdigest()))
 
 
+# Content Hash (page + linked documents)
+def content_hash(texts):
+    hash_object = hashlib.md5()
+    for text in texts:
+        hash_object.update(text.encode())
+        hash_object.update(b"\0")
+    return hash_object.hexdigest()
+
+
+# USD per 1000 tokens (input, output)
+MODEL_PRICES = {
+    "gpt-4o": (0.0025, 0.0100),
+    "gpt-4o-mini": (0.00015, 0.0006),
+    "gpt-4.1": (0.0020, 0.0080),
+    "gpt-4.1-mini": (0.0004, 0.0016),
+    "gpt-4.1-nano": (0.0001, 0.0004),
+    "text-embedding-3-large": (0.00013, 0.0),
+    "text-embedding-3-small": (0.00002, 0.0),
+}
+
+
 # Token Count/Calc
+@lru_cache(maxsize=None)
+def get_encoding(model="text-embedding-3-large"):
+    try:
+        return tiktoken.encoding_for_model(model)
+    except KeyError:
+        # Models newer than the installed tiktoken use the gpt-4o encoding
+        return tiktoken.get_encoding("o200k_base")
+
+
 def count_tokens(texts, model="text-embedding-3-large"):
-    encoding = tiktoken.encoding_for_model(model)
+    encoding = get_encoding(model)
     if isinstance(texts, str):
         texts = [texts]
     total_tokens = 0
@@ -29,24 +61,28 @@ def calculate_cost(texts, model="text-embedding-3-large", is_input=True):
     num_tokens = count_tokens(texts, model)
 
     # Calculation per 1000 tokens USD
-    if model == "gpt-4o":
-        if is_input:
-            cost_per_1000_tokens = 0.0025  # USD
-        else:
-            cost_per_1000_tokens = 0.0100  # USD
-    elif model == "text-embedding-3-large":
-        cost_per_1000_tokens = 0.00013  # USD
-    else:
-        raise ValueError("Unsupported model")
+    if model not in MODEL_PRICES:
+        raise ValueError(f"Unsupported model: {model}")
+    input_price, output_price = MODEL_PRICES[model]
+    cost_per_1000_tokens = input_price if is_input else output_price
 
     # Calculate text cost
     cost = (num_tokens / 1000) * cost_per_1000_tokens
     return cost
 
 
+def token_cost(model, input_tokens, output_tokens=0):
+    if model not in MODEL_PRICES:
+        raise ValueError(f"Unsupported model: {model}")
+    input_price, output_price = MODEL_PRICES[model]
+    return (input_tokens * input_price + output_tokens * output_price) / 1000
+
+
 # Swedish Timezone for logging
+SWEDISH_TZ = ZoneInfo("Europe/Stockholm")
+
+
 def swedish_time(*args):
-    utc_dt = datetime.now(timezone.utc)
-    swe_tz = ZoneInfo("Europe/Stockholm")
-    converted = utc_dt.astimezone(swe_tz)
-    return converted.timetuple()
+    # Called with the record timestamp (as Formatter.converter), now otherwise
+    timestamp = args[-1] if args and isinstance(args[-1], (int, float)) else time.time()
+    return datetime.fromtimestamp(timestamp, SWEDISH_TZ).timetuple()
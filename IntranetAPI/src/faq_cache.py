@@ -0,0 +1,230 @@
+import json
+import logging
+import os
+import sqlite3
+import threading
+from datetime import datetime, timedelta
+from zoneinfo import ZoneInfo
+
+from crawl_state import utc_now
+from singleflight import normalize_question
+
+# Setup Logging
+logger = logging.getLogger(__name__)
+
+FAQ_CACHE_PATH = "../data/faq_cache.db"
+FAQ_TIMEZONE = ZoneInfo("Europe/Stockholm")  # Answers are told the date, they expire with it
+FAQ_CLAIM_SECONDS = int(os.getenv("FAQ_CLAIM_SECONDS", "900"))  # Lease of a regeneration claim
+SQLITE_MAX_VARS = 900
+
+
+def today_start():
+    """Start of the current local day, in the UTC format of generated_at."""
+    midnight = datetime.now(FAQ_TIMEZONE).replace(hour=0, minute=0, second=0, microsecond=0)
+    return midnight.astimezone(utc_now().tzinfo).isoformat()
+
+
+class FaqCache:
+    """Precomputed answers to frequent first questions and the chunks they were built from.
+
+    An answer is marked stale as soon as one of its source chunks (or the page
+    it belongs to) changes, and is not served again until it is regenerated.
+    Answers also expire when the date they were generated on has passed.
+    Stale answers are claimed before they are regenerated, so API workers sharing
+    the file don't all regenerate the same answer.
+    """
+
+    def __init__(self, db_path=FAQ_CACHE_PATH):
+        self.db_path = db_path
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(db_path, check_same_thread=False, timeout=30)
+        self.conn.row_factory = sqlite3.Row
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute(
+            """CREATE TABLE IF NOT EXISTS faqs (
+                question_key TEXT PRIMARY KEY,
+                question TEXT NOT NULL,
+                answer TEXT,
+                cost REAL,
+                asked INTEGER NOT NULL DEFAULT 0,
+                stale INTEGER NOT NULL DEFAULT 1,
+                generated_at TEXT,
+                regenerating_at TEXT
+            )"""
+        )
+        columns = {row["name"] for row in self.conn.execute("PRAGMA table_info(faqs)")}
+        if "regenerating_at" not in columns:
+            self.conn.execute("ALTER TABLE faqs ADD COLUMN regenerating_at TEXT")
+        self.conn.execute(
+            """CREATE TABLE IF NOT EXISTS faq_sources (
+                question_key TEXT NOT NULL,
+                chunk_id TEXT NOT NULL,
+                url TEXT,
+                source_url TEXT,
+                PRIMARY KEY (question_key, chunk_id)
+            )"""
+        )
+        self.conn.execute(
+            "CREATE INDEX IF NOT EXISTS faq_sources_chunk ON faq_sources (chunk_id)"
+        )
+        self.conn.execute("CREATE INDEX IF NOT EXISTS faq_sources_url ON faq_sources (url)")
+        self.conn.execute(
+            "CREATE INDEX IF NOT EXISTS faq_sources_source_url ON faq_sources (source_url)"
+        )
+        self.conn.commit()
+
+    def put(self, question, answer, sources, cost=0, asked=None):
+        """Store a fresh answer, sources is a list of {"id", "url", "source_url"}."""
+        key = normalize_question(question)
+        with self.lock:
+            self.conn.execute(
+                """INSERT INTO faqs (question_key, question, answer, cost, asked, stale, generated_at)
+                VALUES (?, ?, ?, ?, ?, 0, ?)
+                ON CONFLICT(question_key) DO UPDATE SET
+                    question = excluded.question,
+                    answer = excluded.answer,
+                    cost = excluded.cost,
+                    asked = COALESCE(?, faqs.asked),
+                    stale = 0,
+                    generated_at = excluded.generated_at,
+                    regenerating_at = NULL""",
+                (key, question, answer, cost, asked or 0, utc_now().isoformat(), asked),
+            )
+            self.conn.execute("DELETE FROM faq_sources WHERE question_key = ?", (key,))
+            self.conn.executemany(
+                "INSERT OR IGNORE INTO faq_sources (question_key, chunk_id, url, source_url) VALUES (?, ?, ?, ?)",
+                [
+                    (key, str(source["id"]), source.get("url"), source.get("source_url"))
+                    for source in sources
+                ],
+            )
+            self.conn.commit()
+
+    def set_asked(self, question, asked):
+        with self.lock:
+            self.conn.execute(
+                "UPDATE faqs SET asked = ? WHERE question_key = ?",
+                (asked, normalize_question(question)),
+            )
+            self.conn.commit()
+
+    def match(self, question):
+        """Fresh answer generated today for the same normalized question, else None.
+
+        Only exact matches are served, near-identical questions can differ in a
+        year, a name or "in"/"ut" and need their own answer.
+        """
+        with self.lock:
+            row = self.conn.execute(
+                """SELECT question, answer, generated_at FROM faqs
+                WHERE question_key = ? AND stale = 0 AND answer IS NOT NULL
+                AND generated_at >= ?""",
+                (normalize_question(question), today_start()),
+            ).fetchone()
+        return dict(row) if row is not None else None
+
+    def _mark_stale(self, column, values):
+        values = list(values)
+        keys = set()
+        with self.lock:
+            for start in range(0, len(values), SQLITE_MAX_VARS):
+                part = values[start : start + SQLITE_MAX_VARS]
+                rows = self.conn.execute(
+                    f"SELECT DISTINCT question_key FROM faq_sources WHERE {column} IN ({','.join('?' * len(part))})",
+                    part,
+                ).fetchall()
+                keys.update(row["question_key"] for row in rows)
+            self.conn.executemany(
+                "UPDATE faqs SET stale = 1 WHERE question_key = ?", [(key,) for key in keys]
+            )
+            self.conn.commit()
+        if keys:
+            logger.info(f"Marked {len(keys)} FAQ answers stale: {sorted(keys)}")
+        return len(keys)
+
+    def invalidate_chunks(self, chunk_ids):
+        """Mark answers built from any of the chunks stale, returns how many."""
+        return self._mark_stale("chunk_id", map(str, chunk_ids))
+
+    def invalidate_urls(self, urls):
+        """Mark answers built from the pages (or documents linked from them) stale."""
+        urls = list(urls)
+        return self._mark_stale("url", urls) + self._mark_stale("source_url", urls)
+
+    def stale_questions(self):
+        with self.lock:
+            rows = self.conn.execute(
+                "SELECT question FROM faqs WHERE stale = 1 ORDER BY asked DESC"
+            ).fetchall()
+        return [row["question"] for row in rows]
+
+    def claim_stale(self, lease_seconds=FAQ_CLAIM_SECONDS):
+        """Claim the most asked stale (or expired) question nobody regenerates, else None.
+
+        The claim ends when the answer is stored, or after lease_seconds (failed or
+        crashed regenerations are retried then).
+        """
+        now = utc_now()
+        expired = (now - timedelta(seconds=lease_seconds)).isoformat()
+        with self.lock:
+            self.conn.commit()
+            self.conn.execute("BEGIN IMMEDIATE")
+            try:
+                row = self.conn.execute(
+                    """SELECT question_key, question FROM faqs
+                    WHERE (stale = 1 OR generated_at < ?)
+                    AND (regenerating_at IS NULL OR regenerating_at < ?)
+                    ORDER BY asked DESC LIMIT 1""",
+                    (today_start(), expired),
+                ).fetchone()
+                if row is not None:
+                    self.conn.execute(
+                        "UPDATE faqs SET regenerating_at = ? WHERE question_key = ?",
+                        (now.isoformat(), row["question_key"]),
+                    )
+                self.conn.commit()
+            except Exception:
+                self.conn.rollback()
+                raise
+        return row["question"] if row is not None else None
+
+    def questions(self):
+        with self.lock:
+            rows = self.conn.execute(
+                "SELECT question, asked, stale, generated_at FROM faqs ORDER BY asked DESC"
+            ).fetchall()
+        return [dict(row) for row in rows]
+
+    def retain(self, questions):
+        """Drop answers to questions that are no longer frequent."""
+        keep = {normalize_question(question) for question in questions}
+        with self.lock:
+            removed = [
+                row["question_key"]
+                for row in self.conn.execute("SELECT question_key FROM faqs")
+                if row["question_key"] not in keep
+            ]
+            self.conn.executemany(
+                "DELETE FROM faqs WHERE question_key = ?", [(key,) for key in removed]
+            )
+            self.conn.executemany(
+                "DELETE FROM faq_sources WHERE question_key = ?", [(key,) for key in removed]
+            )
+            self.conn.commit()
+        return removed
+
+
+_faq_cache = None
+_faq_cache_lock = threading.Lock()
+
+
+def get_faq_cache():
+    global _faq_cache
+    with _faq_cache_lock:
+        if _faq_cache is None:
+            _faq_cache = FaqCache()
+        return _faq_cache
+
+
+if __name__ == "__main__":
+    print(json.dumps(get_faq_cache().questions(), indent=2, ensure_ascii=False))
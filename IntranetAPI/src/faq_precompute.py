@@ -0,0 +1,124 @@
+import argparse
+import logging
+import os
+from collections import Counter, defaultdict
+from datetime import timedelta
+
+from crawl_state import utc_now
+from singleflight import normalize_question
+
+# Setup Logging
+logger = logging.getLogger(__name__)
+
+FAQ_SIZE = 50  # Questions kept in the FAQ
+FAQ_MIN_ASKED = 3  # Chats that must have started with the question
+PAGE_SIZE = 1000
+
+
+# 1 Stored prompts from Directus, in the order they were asked
+def iter_messages(days=None):
+    from chat_api import (
+        DIRECTUS_TIMEOUT,
+        directus_session,
+        headers,
+        message_api_url,
+        params,
+    )
+
+    query = {**params, "fields": "chat_id,prompt", "sort": "id", "limit": PAGE_SIZE}
+    if days:
+        query["filter[date_created][_gte]"] = (utc_now() - timedelta(days=days)).isoformat()
+    page = 1
+    while True:
+        response = directus_session.get(
+            message_api_url,
+            headers=headers,
+            params={**query, "page": page},
+            timeout=DIRECTUS_TIMEOUT,
+        )
+        response.raise_for_status()
+        rows = response.json().get("data", [])
+        yield from rows
+        if len(rows) < PAGE_SIZE:
+            return
+        page += 1
+
+
+# 2 Count the first question of each chat, follow-ups depend on their history
+def mine_questions(messages, top=FAQ_SIZE, min_asked=FAQ_MIN_ASKED):
+    first_prompts = {}
+    for message in messages:
+        chat_id, prompt = message.get("chat_id"), (message.get("prompt") or "").strip()
+        if chat_id is not None and prompt and chat_id not in first_prompts:
+            first_prompts[chat_id] = prompt
+
+    counts = Counter()
+    spellings = defaultdict(Counter)
+    for prompt in first_prompts.values():
+        key = normalize_question(prompt)
+        counts[key] += 1
+        spellings[key][prompt] += 1
+    logger.info(f"{len(first_prompts)} chats, {len(counts)} distinct first questions")
+
+    # The most common spelling of each question is the one answered
+    return [
+        (spellings[key].most_common(1)[0][0], asked)
+        for key, asked in counts.most_common(top)
+        if asked >= min_asked
+    ]
+
+
+# Main, Refresh the FAQ from the query log
+def main():
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
+
+    parser = argparse.ArgumentParser(description="Precompute answers to the most asked questions.")
+    parser.add_argument("--top", type=int, default=FAQ_SIZE)
+    parser.add_argument("--min-asked", type=int, default=FAQ_MIN_ASKED)
+    parser.add_argument("--days", type=int, default=None, help="Only mine this many days back")
+    parser.add_argument("--stale-only", action="store_true", help="Only regenerate stale answers")
+    parser.add_argument("--force", action="store_true", help="Regenerate fresh answers too")
+    parser.add_argument("--dry-run", action="store_true", help="Print the mined questions")
+    args = parser.parse_args()
+
+    # This run regenerates the answers itself, no background refresher in the CLI
+    os.environ["FAQ_REFRESH_SECONDS"] = "0"
+    from chat_api import refresh_faqs, refresh_stale_faqs
+    from faq_cache import get_faq_cache, today_start
+
+    faq_cache = get_faq_cache()
+    if args.stale_only:
+        logger.info(f"Regenerated {refresh_stale_faqs()} stale answers")
+        return
+
+    mined = mine_questions(iter_messages(args.days), args.top, args.min_asked)
+    for question, asked in mined:
+        logger.info(f"{asked:>5}  {question}")
+    if args.dry_run:
+        return
+
+    removed = faq_cache.retain(question for question, _ in mined)
+    if removed:
+        logger.info(f"Removed {len(removed)} questions that are no longer frequent")
+
+    # Fresh answers (generated today) are kept, only their counts are updated
+    fresh = {
+        normalize_question(row["question"]): row
+        for row in faq_cache.questions()
+        if not row["stale"] and (row["generated_at"] or "") >= today_start()
+    }
+    asked = dict(mined)
+    to_generate = [
+        question
+        for question, _ in mined
+        if args.force or normalize_question(question) not in fresh
+    ]
+    for question, count in mined:
+        if question not in to_generate:
+            faq_cache.set_asked(question, count)
+    logger.info(f"Generating {len(to_generate)} of {len(mined)} FAQ answers")
+    logger.info(f"Stored {refresh_faqs(to_generate, asked)} FAQ answers")
+
+
+if __name__ == "__main__":
+    main()
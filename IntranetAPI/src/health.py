@@ -0,0 +1,98 @@
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, wait
+
+from crawl_state import utc_now
+
+# Setup Logging
+logger = logging.getLogger(__name__)
+
+CHECK_TIMEOUT = 5  # Seconds a readiness check may take
+CHECK_MAX_AGE = 15  # Results are reused this long, /readyz never hammers dependencies
+
+_checks = {}
+_lock = threading.Lock()
+_pool = ThreadPoolExecutor(max_workers=8, thread_name_prefix="health")
+_started = time.monotonic()
+
+
+def register_check(name, check, critical=True):
+    """check() raises or returns False when the dependency is unavailable."""
+    with _lock:
+        _checks[name] = {
+            "check": check,
+            "critical": critical,
+            "ok": None,
+            "error": None,
+            "latency_ms": None,
+            "checked_at": None,
+            "checked": 0.0,
+        }
+
+
+def _run(name):
+    state = _checks[name]
+    started = time.monotonic()
+    try:
+        ok = state["check"]() is not False
+        error = None if ok else "check failed"
+    except Exception as e:
+        ok, error = False, str(e)
+    with _lock:
+        state.update(
+            ok=ok,
+            error=error,
+            latency_ms=round((time.monotonic() - started) * 1000),
+            checked_at=utc_now().isoformat(),
+            checked=time.monotonic(),
+        )
+    if not ok:
+        logger.warning(f"Dependency {name} not ready: {error}")
+
+
+def run_checks(max_age=CHECK_MAX_AGE, timeout=CHECK_TIMEOUT):
+    """Re-run checks older than max_age (in parallel) and return the status."""
+    now = time.monotonic()
+    with _lock:
+        due = [
+            name
+            for name, state in _checks.items()
+            if state["ok"] is None or now - state["checked"] > max_age
+        ]
+    futures = [_pool.submit(_run, name) for name in due]
+    wait(futures, timeout=timeout)
+    return status()
+
+
+def status():
+    with _lock:
+        dependencies = {
+            name: {
+                "ok": state["ok"],
+                "critical": state["critical"],
+                "error": state["error"],
+                "latency_ms": state["latency_ms"],
+                "checked_at": state["checked_at"],
+            }
+            for name, state in _checks.items()
+        }
+    ready = all(
+        dependency["ok"] for dependency in dependencies.values() if dependency["critical"]
+    )
+    return {
+        "ready": ready,
+        "uptime_seconds": round(time.monotonic() - _started, 1),
+        "dependencies": dependencies,
+    }
+
+
+def start_warm_up():
+    """Run all checks once in the background, which also opens their TLS connections."""
+
+    def warm_up():
+        started = time.monotonic()
+        run_checks(max_age=0, timeout=None)
+        logger.info(f"Warm-up done in {time.monotonic() - started:.1f}s: {status()['ready']}")
+
+    threading.Thread(target=warm_up, name="warm-up", daemon=True).start()
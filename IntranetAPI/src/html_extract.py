@@ -0,0 +1,175 @@
+import re
+
+import lxml.html
+from lxml import etree
+
+UNWANTED_TAGS = frozenset(  # Due to site having no main element and inconsistency
+    [
+        "header",
+        "footer",
+        "nav",
+        "aside",
+        "script",
+        "style",
+        "noscript",
+        "iframe",
+    ]
+)
+UNWANTED_CLASSES = [
+    "tm-header",
+    "tm-header-mobile",
+    "tm-footer",
+    "tm-sidebar",
+    "uk-nav",
+    "cookie",
+    "search",
+    "sidebarmenu",
+]
+UNWANTED_IDS = frozenset(["tm-header", "tm-footer", "tm-sidebar", "cookie", "assistant"])
+
+# Precompiled selectors
+UNWANTED_CLASS_PATTERN = re.compile("|".join(map(re.escape, UNWANTED_CLASSES)))
+COOKIE_ID_PATTERN = re.compile("cookie", re.IGNORECASE)
+DOCUMENT_LINK_PATTERN = re.compile(
+    r"(^/alla-dokument/|^https://intranet\.falkenberg\.se/alla-dokument/|\.pdf$)",
+    re.IGNORECASE,
+)
+# Strings inside these are not page text (same as BeautifulSoup's string containers)
+NON_TEXT_TAGS = frozenset(["template", "rt", "rp"])
+
+MAIN_XPATH = etree.XPath("//div[@id='tm-main']")
+PAGE_XPATH = etree.XPath(
+    "//div[contains(concat(' ', normalize-space(@class), ' '), ' tm-page ')]"
+)
+TITLE_XPATH = etree.XPath("//title")
+HTML_PARSER = lxml.html.HTMLParser(encoding="utf-8", remove_comments=False)
+
+_END = object()
+
+
+def _find_main(root):
+    for xpath in (MAIN_XPATH, PAGE_XPATH):
+        found = xpath(root)
+        if found:
+            return found[0]
+    return root.find("body")
+
+
+def extract_page(content):
+    """Extract title, main text and document links from a rendered page.
+
+    Boilerplate is dropped and links collected in one traversal. The output
+    matches extract_page_legacy: texts is main content's stripped strings
+    joined by spaces, links are (href, link text) of document links outside
+    removed elements.
+    """
+    root = lxml.html.document_fromstring(content.encode("utf-8"), parser=HTML_PARSER)
+
+    title_elements = TITLE_XPATH(root)
+    title = title_elements[0].text if title_elements else "No title found"
+
+    main = _find_main(root)
+    texts = []
+    links = []
+    open_links = []
+
+    def emit(text, in_main, text_ok):
+        if not text or not text_ok:
+            return
+        if in_main:
+            stripped = text.strip()
+            if stripped:
+                texts.append(stripped)
+        for link in open_links:
+            link[1].append(text)
+
+    # Frames are (element, in_main, text_ok, link_ok) of the parent context
+    stack = [(root, False, True, True)]
+    while stack:
+        frame = stack.pop()
+        if frame[0] is _END:
+            _, element, in_main, text_ok, link = frame
+            if link is not None:
+                open_links.remove(link)
+            emit(element.tail, in_main, text_ok)
+            continue
+
+        element, parent_in_main, parent_text_ok, link_ok = frame
+        tag = element.tag
+        if not isinstance(tag, str):  # Comments and processing instructions
+            emit(element.tail, parent_in_main, parent_text_ok)
+            continue
+
+        element_class = element.get("class")
+        if element_class and UNWANTED_CLASS_PATTERN.search(element_class):
+            # Removed anywhere in the page, a matching main leaves no text (as legacy)
+            emit(element.tail, parent_in_main, parent_text_ok)
+            continue
+        if element is main:
+            in_main = True
+        else:
+            in_main = parent_in_main
+            element_id = element.get("id")
+            if in_main and (
+                tag in UNWANTED_TAGS
+                or element_id in UNWANTED_IDS
+                or (tag == "div" and element_id and COOKIE_ID_PATTERN.search(element_id))
+            ):
+                emit(element.tail, parent_in_main, parent_text_ok)
+                continue
+        text_ok = parent_text_ok and tag not in NON_TEXT_TAGS
+
+        link = None
+        if tag == "a" and link_ok:
+            href = element.get("href")
+            if href is not None and DOCUMENT_LINK_PATTERN.search(href):
+                link = (href, [])
+                open_links.append(link)
+                links.append(link)
+
+        emit(element.text, in_main, text_ok)
+        stack.append((_END, element, parent_in_main, parent_text_ok, link))
+        for child in reversed(element):
+            stack.append((child, in_main, text_ok, link_ok))
+
+    links = [(href, "".join(parts)) for href, parts in links]
+    if main is None:
+        return title, "Main or Page not found or empty.", links
+    return title, " ".join(texts), links
+
+
+def extract_page_legacy(content):
+    """Original BeautifulSoup implementation, kept to verify extract_page."""
+    from bs4 import BeautifulSoup
+
+    soup = BeautifulSoup(content, "html.parser")
+
+    title = soup.title.string if soup.title else "No title found"
+
+    main_content = soup.find("div", id="tm-main")
+    if not main_content:
+        main_content = soup.find("div", class_="tm-page") or soup.find("body")
+
+    # Filter unnecessary elements
+    for tag in UNWANTED_TAGS:
+        for match in main_content.find_all(tag):
+            match.decompose()
+    for class_name in UNWANTED_CLASSES:
+        for match in soup.find_all(class_=lambda c: c and class_name in c):
+            match.decompose()
+    for id in UNWANTED_IDS:
+        for match in main_content.find_all(id=id):
+            match.decompose()
+
+    if main_content:
+        for cookie_div in main_content.find_all("div", id=COOKIE_ID_PATTERN):
+            cookie_div.decompose()
+        texts = " ".join(main_content.stripped_strings)
+    else:
+        texts = "Main or Page not found or empty."
+
+    links = [
+        (link["href"], link.text)
+        for link in soup.find_all("a", href=DOCUMENT_LINK_PATTERN)
+    ]
+    return title, texts, links
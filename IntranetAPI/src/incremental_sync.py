@@ -0,0 +1,120 @@
+import argparse
+from datetime import timedelta
+import logging
+import sys
+
+from config import get_cookie
+from logging_setup import setup_logging
+from sitemap import get_sitemap_entries, is_excluded
+from crawl_state import needs_update
+from individual_update_url import update_url, crawl_state
+from ingest_queue import IngestQueue, PRIORITY_BULK
+
+# Setup Logging
+log_file = "../data/incremental_sync_logg.txt"
+logger = logging.getLogger(__name__)
+
+# Load environment variables
+COOKIE_NAME, COOKIE_VALUE = get_cookie()
+
+
+# Pick the sitemap entries that are new or changed since they were last indexed
+def get_pending_entries(entries, max_age=None):
+    known = crawl_state.get_all()
+    pending = []
+    for entry in entries:
+        if is_excluded(entry["loc"]):
+            continue
+        reason = needs_update(entry["lastmod"], known.get(entry["loc"]), max_age)
+        if reason:
+            pending.append({**entry, "reason": reason})
+    return pending
+
+
+def run_incremental_sync(
+    max_age=None, limit=None, dry_run=False, enqueue=False, entries=None
+):
+    if entries is None:
+        entries = get_sitemap_entries(COOKIE_NAME, COOKIE_VALUE)
+    pending = get_pending_entries(entries, max_age)
+
+    reasons = {}
+    for entry in pending:
+        reasons[entry["reason"]] = reasons.get(entry["reason"], 0) + 1
+    logger.info(
+        f"{len(pending)} of {len(entries)} sitemap URLs need update: {reasons}"
+    )
+
+    if limit is not None:
+        pending = pending[:limit]
+
+    if dry_run:
+        for entry in pending:
+            logger.info(f"[dry-run] {entry['reason']}: {entry['loc']}")
+        return 0
+
+    if enqueue:
+        # Hand the pages to ingest_worker.py as low priority bulk jobs
+        queue = IngestQueue()
+        for entry in pending:
+            queue.enqueue(
+                entry["loc"],
+                priority=PRIORITY_BULK,
+                source="bulk",
+                options={
+                    "lastmod": entry["lastmod"].isoformat() if entry["lastmod"] else None,
+                    "skip_unchanged": True,
+                    "reuse_fresh_documents": True,
+                },
+            )
+        logger.info(f"Queued {len(pending)} bulk jobs")
+        return 0
+
+    total_cost_SEK = 0
+    for count, entry in enumerate(pending, start=1):
+        logger.info(
+            f"[{count}/{len(pending)}] {entry['reason']}: {entry['loc']}"
+        )
+        try:
+            total_cost_SEK += update_url(
+                entry["loc"],
+                lastmod=entry["lastmod"],
+                skip_unchanged=True,
+                reuse_fresh_documents=True,
+            )
+        except Exception as e:
+            logger.error(f"Failed to update {entry['loc']}: {e}")
+
+    logger.info(f"Incremental sync finished. Total cost = {total_cost_SEK} SEK")
+    return total_cost_SEK
+
+
+if __name__ == "__main__":
+    setup_logging(log_file)
+
+    parser = argparse.ArgumentParser(
+        description="Re-index sitemap pages that are new or changed since last index."
+    )
+    parser.add_argument(
+        "--max-age-days",
+        type=float,
+        default=None,
+        help="Re-check pages without <lastmod> when last indexed longer ago than this.",
+    )
+    parser.add_argument("--limit", type=int, default=None)
+    parser.add_argument("--dry-run", action="store_true")
+    parser.add_argument(
+        "--enqueue",
+        action="store_true",
+        help="Queue bulk jobs for ingest_worker.py instead of updating inline.",
+    )
+    args = parser.parse_args()
+
+    if not COOKIE_NAME or not COOKIE_VALUE:
+        logger.error("COOKIE.env is missing cookie credentials.")
+        sys.exit(1)
+
+    max_age = timedelta(days=args.max_age_days) if args.max_age_days else None
+    run_incremental_sync(
+        max_age=max_age, limit=args.limit, dry_run=args.dry_run, enqueue=args.enqueue
+    )
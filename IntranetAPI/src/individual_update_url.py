@@ -1,68 +1,153 @@
+import contextvars
 import logging
-import os
-from dotenv import load_dotenv
-import qdrant_client
-from qdrant_client.http import models
-from qdrant_client.http.models import VectorParams, Distance, PointStruct
+from concurrent.futures import ThreadPoolExecutor
 
-from scrap import scrap_site
+from config import COLLECTION_NAME, ensure_collection, get_cookie, get_qdrant_client
+from scrap import scrap_pdf, scrap_site
 from process_item import process_item
+from crawl_state import get_crawl_state
+from document_registry import DocumentRegistry
+from embedding_cache import get_embedding_cache
+from essential_methods import content_hash
+from qdrant_delete import delete_urls, hand_over_points
+from ingest_profiler import profile_run
 
 
-# Setup Cookies
-load_dotenv("../data/COOKIE.env")
-COOKIE_NAME = os.getenv("COOKIE_NAME")
-COOKIE_VALUE = os.getenv("COOKIE_VALUE")
-
 # Setup Logging
 logger = logging.getLogger(__name__)
 
-# Load API Keys
-load_dotenv(dotenv_path="../data/API_KEYS.env")
-qdrant_api_key = os.getenv("QDRANT_API_KEY")
-
-# Qdrant Constants And Setup
-QDRANT_URL = "https://qdrant.utvecklingfalkenberg.se"
-QDRANT_PORT = 443
-VECTOR_SIZE = 3072
-COLLECTION_NAME = "IntranetFalkenbergHemsida_RAG"
-
-qdrant_client = qdrant_client.QdrantClient(
-    url=QDRANT_URL, port=QDRANT_PORT, https=True, api_key=qdrant_api_key
-)
-
-# Ensure Collection Exists
-if not qdrant_client.collection_exists(collection_name=COLLECTION_NAME):
-    logger.info(f"Collection {COLLECTION_NAME} not found. Creating...")
-    vectors_config = models.VectorParams(
-        size=VECTOR_SIZE, distance=models.Distance.COSINE
-    )
-    try:
-        qdrant_client.create_collection(
-            collection_name=COLLECTION_NAME, vectors_config=vectors_config
-        )
-    except Exception as e:
-        logger.error(f"Error creating collection: {e}")
-else:
-    logger.info(f"Collection {COLLECTION_NAME} exists. Proceeding.")
+# Setup Cookies
+COOKIE_NAME, COOKIE_VALUE = get_cookie()
+
+ITEM_WORKERS = 4  # Items processed in parallel so their chunks share embedding batches
+
+crawl_state = get_crawl_state()
+document_registry = DocumentRegistry()
 
 
 # Main
-def update_url(url):
-    page_chunks = scrap_site(url, COOKIE_NAME, COOKIE_VALUE)
-    point_count = 0
-    total_update_cost_SEK = 0
-    for chunk in page_chunks:
-        point_count += 1
-        logger.info(f"{point_count} av {len(page_chunks)}")
-        total_update_cost_SEK += process_item(
-            chunk, qdrant_client, COLLECTION_NAME=COLLECTION_NAME
+def update_url(url, lastmod=None, skip_unchanged=False, reuse_fresh_documents=False):
+    """Scrape and index a page and its linked documents.
+
+    reuse_fresh_documents skips documents checked recently (scheduled runs),
+    explicit and webhook updates always download the documents again.
+    """
+    # Stage times and memory of the whole update go to the ingest profile
+    with profile_run("update_url", url):
+        return _update_url(url, lastmod, skip_unchanged, reuse_fresh_documents)
+
+
+def _update_url(url, lastmod, skip_unchanged, reuse_fresh_documents):
+    ensure_collection()
+    page_chunks = scrap_site(
+        url,
+        COOKIE_NAME,
+        COOKIE_VALUE,
+        skip_document=document_registry.is_fresh if reuse_fresh_documents else None,
+    )
+    if not page_chunks:
+        logger.warning(f"Nothing scraped for url: {url}")
+        return 0
+
+    page_item = page_chunks[0]
+    documents = {}
+    for chunk in page_chunks[1:]:
+        if chunk["url"] not in documents or documents[chunk["url"]].get("failed"):
+            documents[chunk["url"]] = chunk
+
+    # Documents downloaded now are hashed, skipped and failed ones use their registered hash
+    document_hashes = {}
+    for document_url, document in documents.items():
+        registered = document_registry.get(document_url) if document["texts"] is None else None
+        if document["texts"] is None and registered is None and not document.get("failed"):
+            # Unregistered since it was checked, download it after all
+            document["texts"] = scrap_pdf(document_url, COOKIE_NAME, COOKIE_VALUE) or None
+            document["failed"] = document["texts"] is None
+        if document["texts"] is not None:
+            document_hashes[document_url] = content_hash([document["texts"]])
+        else:
+            document_hashes[document_url] = registered["content_hash"] if registered else ""
+    failed_documents = [
+        document_url for document_url, document in documents.items() if document.get("failed")
+    ]
+
+    page_hash = content_hash(
+        [page_item["url"] + page_item["texts"]]
+        + [document_url + document_hashes[document_url] for document_url in sorted(documents)]
+    )
+    orphaned_documents = document_registry.set_page_links(url, documents.keys())
+
+    if skip_unchanged:
+        state = crawl_state.get(url)
+        if state and state["content_hash"] == page_hash:
+            logger.info(f"Content unchanged since last index, skipping: {url}")
+            crawl_state.mark_indexed(url, page_hash, lastmod)
+            remove_unreferenced_documents(orphaned_documents)
+            return 0
+
+    # Only new content versions of shared documents are processed
+    items = [page_item]
+    for document_url, document in documents.items():
+        registered = document_registry.get(document_url)
+        if document["texts"] is None:
+            continue
+        if registered and registered["content_hash"] == document_hashes[document_url]:
+            document_registry.mark_checked(document_url)
+            continue
+        items.append(document)
+
+    dead_lettered = set()
+
+    def process(numbered_chunk):
+        point_count, chunk = numbered_chunk
+        logger.debug("%s av %s", point_count, len(items), extra={"sample": "item_progress"})
+        cost_SEK = process_item(
+            chunk,
+            get_qdrant_client(),
+            COLLECTION_NAME=COLLECTION_NAME,
+            on_dead_letter=dead_lettered.add,
+        )
+        if chunk["url"] not in dead_lettered and "source_url" in chunk:
+            document_registry.mark_indexed(chunk["url"], document_hashes[chunk["url"]])
+        return cost_SEK
+
+    # Items log with the job's context (job ID, URL)
+    context = contextvars.copy_context()
+    with ThreadPoolExecutor(max_workers=ITEM_WORKERS) as executor:
+        results = list(
+            executor.map(
+                lambda item: context.copy().run(process, item), enumerate(items, start=1)
+            )
         )
+    total_update_cost_SEK = sum(results)
 
+    remove_unreferenced_documents(orphaned_documents)
+    # Dead-lettered items or failed downloads leave the page unindexed for the next run
+    if failed_documents:
+        logger.warning(f"Documents of {url} failed to download, not marked as indexed")
+    elif not dead_lettered:
+        crawl_state.mark_indexed(url, page_hash, lastmod)
+    else:
+        logger.warning(f"Upload failed for items of {url}, not marked as indexed")
     logger.info(f"Total URL Update Cost = {total_update_cost_SEK} SEK")
+    logger.info(f"Embedding cache stats: {get_embedding_cache().stats()}")
     return total_update_cost_SEK
 
 
+# Remove documents no page links to any more
+def remove_unreferenced_documents(document_urls):
+    if not document_urls:
+        return
+    logger.info(f"Removing unreferenced documents: {document_urls}")
+    hand_over_points(get_qdrant_client(), COLLECTION_NAME, document_urls)
+    summary = delete_urls(
+        get_qdrant_client(), COLLECTION_NAME, document_urls, only_documents=True
+    )
+    logger.info(f"Removed unreferenced documents: {summary}")
+    document_registry.remove_documents(document_urls)
+    crawl_state.remove_items(document_urls)
+
+
 if __name__ == "__main__":
     logging.basicConfig(
         filename="../data/update_logg.txt",
@@ -0,0 +1,268 @@
+import argparse
+import contextvars
+import json
+import logging
+import os
+import resource
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+from crawl_state import utc_now
+
+# Setup Logging
+logger = logging.getLogger(__name__)
+
+# Set INGEST_PROFILE=0 to turn the stage timers off
+PROFILE_ENABLED = os.getenv("INGEST_PROFILE", "1") != "0"
+PROFILE_LOG_PATH = os.getenv("INGEST_PROFILE_LOG", "../data/ingest_profile.jsonl")
+PROFILE_LOG_MAX_BYTES = 10 * 1024 * 1024  # Rotated once to .1 beyond this
+MAX_SAMPLES = 1000  # Durations kept per stage for percentiles
+
+PAGE_SIZE = os.sysconf("SC_PAGE_SIZE") if hasattr(os, "sysconf") else 4096
+
+# The update_url/process_item run the current thread/task is part of
+_current_run = contextvars.ContextVar("ingest_run", default=None)
+
+_lock = threading.Lock()
+_stages = {}
+_runs = {}
+
+
+def rss_bytes():
+    """Resident memory of the process, peak RSS where /proc is missing."""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * PAGE_SIZE
+    except OSError:
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+class Run:
+    """Stage totals of one update_url/process_item call (items run in parallel threads)."""
+
+    def __init__(self, kind, url):
+        self.kind = kind
+        self.url = url
+        self.lock = threading.Lock()
+        self.stages = {}
+        self.started = time.perf_counter()
+        self.rss_start = rss_bytes()
+        self.rss_peak = self.rss_start
+
+    def add(self, name, seconds, rss_delta, size, rss):
+        with self.lock:
+            stage = self.stages.setdefault(
+                name, {"calls": 0, "seconds": 0.0, "rss_delta": 0, "bytes": 0}
+            )
+            stage["calls"] += 1
+            stage["seconds"] += seconds
+            stage["rss_delta"] += rss_delta
+            stage["bytes"] += size
+            self.rss_peak = max(self.rss_peak, rss)
+
+    def to_dict(self):
+        wall = time.perf_counter() - self.started
+        with self.lock:
+            stages = {
+                name: {**stage, "seconds": round(stage["seconds"], 4)}
+                for name, stage in self.stages.items()
+            }
+        return {
+            "time": utc_now().isoformat(),
+            "kind": self.kind,
+            "url": self.url,
+            "seconds": round(wall, 4),
+            "rss_start": self.rss_start,
+            "rss_peak": self.rss_peak,
+            "stages": stages,
+        }
+
+
+def _record_stage(name, seconds, rss_delta, size):
+    with _lock:
+        stage = _stages.setdefault(
+            name,
+            {
+                "calls": 0,
+                "seconds": 0.0,
+                "rss_delta": 0,
+                "bytes": 0,
+                "samples": deque(maxlen=MAX_SAMPLES),
+            },
+        )
+        stage["calls"] += 1
+        stage["seconds"] += seconds
+        stage["rss_delta"] += rss_delta
+        stage["bytes"] += size
+        stage["samples"].append(seconds)
+
+
+class _Stage:
+    __slots__ = ("bytes",)
+
+    def __init__(self, size):
+        self.bytes = size
+
+
+@contextmanager
+def stage(name, size=0):
+    """Time a stage and its RSS change, set .bytes on the yielded object when known later."""
+    if not PROFILE_ENABLED:
+        yield _Stage(size)
+        return
+    measured = _Stage(size)
+    rss_before = rss_bytes()
+    started = time.perf_counter()
+    try:
+        yield measured
+    finally:
+        seconds = time.perf_counter() - started
+        rss_after = rss_bytes()
+        _record_stage(name, seconds, rss_after - rss_before, measured.bytes)
+        run = _current_run.get()
+        if run is not None:
+            run.add(name, seconds, rss_after - rss_before, measured.bytes, rss_after)
+
+
+@contextmanager
+def profile_run(kind, url):
+    """Group the stages of one update_url/process_item call, nested calls join the outer run."""
+    if not PROFILE_ENABLED or _current_run.get() is not None:
+        yield _current_run.get()
+        return
+    run = Run(kind, url)
+    token = _current_run.set(run)
+    try:
+        yield run
+    finally:
+        _current_run.reset(token)
+        entry = run.to_dict()
+        with _lock:
+            totals = _runs.setdefault(kind, {"runs": 0, "seconds": 0.0, "rss_peak": 0})
+            totals["runs"] += 1
+            totals["seconds"] += entry["seconds"]
+            totals["rss_peak"] = max(totals["rss_peak"], entry["rss_peak"])
+        write_run(entry)
+
+
+def write_run(entry, path=None):
+    path = path or PROFILE_LOG_PATH
+    if not path:
+        return
+    try:
+        if os.path.exists(path) and os.path.getsize(path) > PROFILE_LOG_MAX_BYTES:
+            os.replace(path, f"{path}.1")
+        with open(path, "a", encoding="utf-8") as f:
+            f.write(json.dumps(entry, ensure_ascii=False) + "\n")
+    except OSError as e:
+        logger.warning(f"Could not write ingest profile to {path}: {e}")
+
+
+def _percentile(samples, share):
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(share * len(ordered)))] if ordered else 0.0
+
+
+def summary():
+    """Stage totals since the process started (or the last reset).
+
+    Items of a page are processed in parallel, so stage seconds can add up to
+    more than the wall time of the runs.
+    """
+    with _lock:
+        stages = {
+            name: dict(stage, samples=list(stage["samples"])) for name, stage in _stages.items()
+        }
+        runs = {kind: dict(totals) for kind, totals in _runs.items()}
+    total = sum(stage["seconds"] for stage in stages.values()) or 1e-9
+    report = {"runs": runs, "stages": {}}
+    for name, stage in sorted(stages.items(), key=lambda item: -item[1]["seconds"]):
+        samples = stage.pop("samples")
+        mb = stage["bytes"] / 1024 / 1024
+        report["stages"][name] = {
+            "calls": stage["calls"],
+            "seconds": round(stage["seconds"], 3),
+            "share": round(stage["seconds"] / total, 3),
+            "avg_ms": round(stage["seconds"] / stage["calls"] * 1000, 2),
+            "p95_ms": round(_percentile(samples, 0.95) * 1000, 2),
+            "rss_delta_mb": round(stage["rss_delta"] / 1024 / 1024, 1),
+            "mb": round(mb, 2),
+            "mb_per_second": round(mb / max(stage["seconds"], 1e-9), 2) if mb else None,
+        }
+    return report
+
+
+def reset():
+    with _lock:
+        _stages.clear()
+        _runs.clear()
+
+
+def summarize_log(path=None, kind=None):
+    """Same report built from the per-run lines of the profile log."""
+    totals = {}
+    runs = {}
+    with open(path or PROFILE_LOG_PATH, encoding="utf-8") as f:
+        for line in f:
+            entry = json.loads(line)
+            if kind and entry["kind"] != kind:
+                continue
+            run = runs.setdefault(entry["kind"], {"runs": 0, "seconds": 0.0, "rss_peak": 0})
+            run["runs"] += 1
+            run["seconds"] += entry["seconds"]
+            run["rss_peak"] = max(run["rss_peak"], entry["rss_peak"])
+            for name, stage in entry["stages"].items():
+                total = totals.setdefault(
+                    name, {"calls": 0, "seconds": 0.0, "rss_delta": 0, "bytes": 0}
+                )
+                for key in total:
+                    total[key] += stage[key]
+    total_seconds = sum(stage["seconds"] for stage in totals.values()) or 1e-9
+    return {
+        "runs": runs,
+        "stages": {
+            name: {
+                "calls": stage["calls"],
+                "seconds": round(stage["seconds"], 3),
+                "share": round(stage["seconds"] / total_seconds, 3),
+                "avg_ms": round(stage["seconds"] / stage["calls"] * 1000, 2),
+                "rss_delta_mb": round(stage["rss_delta"] / 1024 / 1024, 1),
+                "mb": round(stage["bytes"] / 1024 / 1024, 2),
+            }
+            for name, stage in sorted(totals.items(), key=lambda item: -item[1]["seconds"])
+        },
+    }
+
+
+def format_report(report):
+    lines = []
+    for kind, run in report["runs"].items():
+        lines.append(
+            f"{kind}: {run['runs']} runs, {run['seconds']:.1f}s, "
+            f"peak RSS {run['rss_peak'] / 1024 / 1024:.0f} MB"
+        )
+    lines.append(
+        f"{'stage':<18}{'calls':>7}{'seconds':>10}{'share':>7}{'avg ms':>10}"
+        f"{'p95 ms':>10}{'RSS Δ MB':>10}{'MB':>8}"
+    )
+    for name, stage in report["stages"].items():
+        # The log only keeps per-run totals, no percentiles
+        p95 = f"{stage['p95_ms']:.1f}" if "p95_ms" in stage else "-"
+        lines.append(
+            f"{name:<18}{stage['calls']:>7}{stage['seconds']:>10.2f}{stage['share']:>7.0%}"
+            f"{stage['avg_ms']:>10.1f}{p95:>10}{stage['rss_delta_mb']:>10.1f}{stage['mb']:>8.2f}"
+        )
+    return "\n".join(lines)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Summarize the ingestion stage profile.")
+    parser.add_argument("--log", default=PROFILE_LOG_PATH)
+    parser.add_argument("--kind", choices=["update_url", "process_item"], default=None)
+    parser.add_argument("--json", action="store_true")
+    args = parser.parse_args()
+
+    report = summarize_log(args.log, args.kind)
+    print(json.dumps(report, indent=2) if args.json else format_report(report))
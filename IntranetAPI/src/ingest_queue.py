@@ -0,0 +1,166 @@
+import json
+import logging
+import sqlite3
+import threading
+import uuid
+
+from crawl_state import utc_now
+
+# Setup Logging
+logger = logging.getLogger(__name__)
+
+INGEST_QUEUE_PATH = "../data/ingest_jobs.db"
+
+# Lower value is handled first
+PRIORITY_WEBHOOK = 0
+PRIORITY_BULK = 10
+PRIORITIES = {"webhook": PRIORITY_WEBHOOK, "bulk": PRIORITY_BULK}
+
+
+class IngestQueue:
+    """SQLite backed job queue shared by the API and the ingest workers.
+
+    Pending jobs for the same URL are coalesced into one, and a job is only
+    claimed when no other job for its URL is running (per-URL lock).
+    """
+
+    def __init__(self, db_path=INGEST_QUEUE_PATH):
+        self.db_path = db_path
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(
+            db_path, check_same_thread=False, timeout=30, isolation_level=None
+        )
+        self.conn.row_factory = sqlite3.Row
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute(
+            """CREATE TABLE IF NOT EXISTS jobs (
+                id TEXT PRIMARY KEY,
+                url TEXT NOT NULL,
+                priority INTEGER NOT NULL,
+                status TEXT NOT NULL,
+                source TEXT,
+                options TEXT,
+                created_at TEXT NOT NULL,
+                started_at TEXT,
+                finished_at TEXT,
+                requests INTEGER NOT NULL DEFAULT 1,
+                result TEXT,
+                error TEXT
+            )"""
+        )
+        self.conn.execute(
+            "CREATE INDEX IF NOT EXISTS jobs_status ON jobs (status, priority, created_at)"
+        )
+        self.conn.execute("CREATE INDEX IF NOT EXISTS jobs_url ON jobs (url, status)")
+
+    def enqueue(self, url, priority=PRIORITY_WEBHOOK, source="webhook", options=None):
+        """Add a job, or attach to the pending job for the same URL.
+
+        Returns (job_id, coalesced).
+        """
+        with self.lock:
+            self.conn.execute("BEGIN IMMEDIATE")
+            try:
+                pending = self.conn.execute(
+                    "SELECT id FROM jobs WHERE url = ? AND status = 'pending'", (url,)
+                ).fetchone()
+                if pending:
+                    # The most urgent request decides priority and options
+                    self.conn.execute(
+                        """UPDATE jobs SET
+                            options = CASE WHEN ? <= priority THEN ? ELSE options END,
+                            priority = MIN(priority, ?),
+                            requests = requests + 1
+                        WHERE id = ?""",
+                        (priority, json.dumps(options or {}), priority, pending["id"]),
+                    )
+                    self.conn.execute("COMMIT")
+                    return pending["id"], True
+
+                job_id = str(uuid.uuid4())
+                self.conn.execute(
+                    """INSERT INTO jobs (id, url, priority, status, source, options, created_at)
+                    VALUES (?, ?, ?, 'pending', ?, ?, ?)""",
+                    (
+                        job_id,
+                        url,
+                        priority,
+                        source,
+                        json.dumps(options or {}),
+                        utc_now().isoformat(),
+                    ),
+                )
+                self.conn.execute("COMMIT")
+                return job_id, False
+            except Exception:
+                self.conn.execute("ROLLBACK")
+                raise
+
+    def claim(self):
+        """Mark the highest priority runnable job as running and return it."""
+        with self.lock:
+            self.conn.execute("BEGIN IMMEDIATE")
+            try:
+                row = self.conn.execute(
+                    """SELECT * FROM jobs AS job WHERE status = 'pending'
+                    AND NOT EXISTS (
+                        SELECT 1 FROM jobs AS running
+                        WHERE running.url = job.url AND running.status = 'running'
+                    )
+                    ORDER BY priority, created_at LIMIT 1"""
+                ).fetchone()
+                if row is None:
+                    self.conn.execute("COMMIT")
+                    return None
+                self.conn.execute(
+                    "UPDATE jobs SET status = 'running', started_at = ? WHERE id = ?",
+                    (utc_now().isoformat(), row["id"]),
+                )
+                self.conn.execute("COMMIT")
+            except Exception:
+                self.conn.execute("ROLLBACK")
+                raise
+        job = dict(row)
+        job["options"] = json.loads(job["options"] or "{}")
+        return job
+
+    def finish(self, job_id, result=None, error=None):
+        with self.lock:
+            self.conn.execute(
+                """UPDATE jobs SET status = ?, finished_at = ?, result = ?, error = ?
+                WHERE id = ?""",
+                (
+                    "failed" if error else "done",
+                    utc_now().isoformat(),
+                    None if result is None else json.dumps(result),
+                    error,
+                    job_id,
+                ),
+            )
+
+    def get(self, job_id):
+        with self.lock:
+            row = self.conn.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        if row is None:
+            return None
+        job = dict(row)
+        job["options"] = json.loads(job["options"] or "{}")
+        job["result"] = json.loads(job["result"]) if job["result"] else None
+        return job
+
+    def requeue_running(self):
+        """Put jobs left running by a crashed worker back in the queue."""
+        with self.lock:
+            cursor = self.conn.execute(
+                "UPDATE jobs SET status = 'pending', started_at = NULL WHERE status = 'running'"
+            )
+        if cursor.rowcount:
+            logger.warning(f"Requeued {cursor.rowcount} interrupted jobs")
+        return cursor.rowcount
+
+    def counts(self):
+        with self.lock:
+            rows = self.conn.execute(
+                "SELECT status, COUNT(*) FROM jobs GROUP BY status"
+            ).fetchall()
+        return {status: count for status, count in rows}
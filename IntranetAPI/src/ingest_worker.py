@@ -0,0 +1,79 @@
+import logging
+import os
+import threading
+import time
+
+from logging_setup import log_context, setup_logging
+
+# Setup Logging (own file, rotation can't be shared between processes)
+log_file = "../data/ingest_logg.txt"
+setup_logging(log_file)
+logger = logging.getLogger(__name__)
+
+from crawl_state import parse_datetime
+from ingest_queue import IngestQueue
+from individual_update_url import update_url
+
+INGEST_WORKERS = int(os.getenv("INGEST_WORKERS", "2"))
+POLL_INTERVAL = 1.0
+
+
+def run_job(job):
+    options = job["options"]
+    return update_url(
+        job["url"],
+        lastmod=parse_datetime(options.get("lastmod")),
+        skip_unchanged=options.get("skip_unchanged", False),
+        reuse_fresh_documents=options.get("reuse_fresh_documents", False),
+    )
+
+
+def worker_loop(queue: IngestQueue, stop: threading.Event):
+    while not stop.is_set():
+        job = queue.claim()
+        if job is None:
+            stop.wait(POLL_INTERVAL)
+            continue
+
+        with log_context(job_id=job["id"], url=job["url"]):
+            logger.info(f"Job {job['id']} ({job['source']}, priority {job['priority']}): {job['url']}")
+            started = time.monotonic()
+            try:
+                cost_SEK = run_job(job)
+                queue.finish(
+                    job["id"],
+                    result={"cost_sek": cost_SEK, "seconds": round(time.monotonic() - started, 1)},
+                )
+                logger.info(f"Job {job['id']} done, cost {cost_SEK} SEK")
+            except Exception as e:
+                logger.error(f"Job {job['id']} failed: {e}")
+                queue.finish(job["id"], error=str(e))
+
+
+def main():
+    queue = IngestQueue()
+    queue.requeue_running()
+    stop = threading.Event()
+
+    threads = [
+        threading.Thread(
+            target=worker_loop, args=(queue, stop), name=f"ingest-{index}", daemon=True
+        )
+        for index in range(INGEST_WORKERS)
+    ]
+    for thread in threads:
+        thread.start()
+    logger.info(f"Ingest worker started with {INGEST_WORKERS} threads")
+
+    try:
+        while True:
+            time.sleep(60)
+            logger.info(f"Ingest queue: {queue.counts()}")
+    except KeyboardInterrupt:
+        stop.set()
+        for thread in threads:
+            thread.join()
+
+
+if __name__ == "__main__":
+    main()
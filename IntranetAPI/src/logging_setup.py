@@ -0,0 +1,153 @@
+import atexit
+import contextvars
+import copy
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime
+
+from essential_methods import SWEDISH_TZ, swedish_time
+
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+LOG_FORMAT = os.getenv("LOG_FORMAT", "json")  # File format, "json" or "text"
+LOG_MAX_BYTES = int(os.getenv("LOG_MAX_BYTES", str(20 * 1024 * 1024)))
+LOG_BACKUPS = int(os.getenv("LOG_BACKUPS", "5"))
+TEXT_FORMAT = "%(asctime)s - %(levelname)s - %(message)s"
+
+# Sampled records (extra={"sample": key}) pass at most this often per key
+SAMPLE_INTERVAL = float(os.getenv("LOG_SAMPLE_INTERVAL", "5"))
+
+# Request/job fields added to every record logged in the current context
+_log_fields = contextvars.ContextVar("log_fields", default={})
+
+_listener = None
+_setup_lock = threading.Lock()
+
+
+@contextmanager
+def log_context(**fields):
+    token = _log_fields.set({**_log_fields.get(), **fields})
+    try:
+        yield
+    finally:
+        _log_fields.reset(token)
+
+
+def bind_log_context(**fields):
+    """Add fields for the rest of the current context (a request's thread/task)."""
+    _log_fields.set({**_log_fields.get(), **fields})
+
+
+class ContextFilter(logging.Filter):
+    """Copies the context fields onto the record in the logging thread."""
+
+    def filter(self, record):
+        record.fields = _log_fields.get()
+        return True
+
+
+class SampleFilter(logging.Filter):
+    """Rate limits records marked with extra={"sample": key}, counts what was dropped."""
+
+    def __init__(self, interval=SAMPLE_INTERVAL):
+        super().__init__()
+        self.interval = interval
+        self.lock = threading.Lock()
+        self.last = {}
+        self.dropped = {}
+
+    def filter(self, record):
+        key = getattr(record, "sample", None)
+        if key is None:
+            return True
+        now = time.monotonic()
+        with self.lock:
+            if now - self.last.get(key, -self.interval) < self.interval:
+                self.dropped[key] = self.dropped.get(key, 0) + 1
+                return False
+            self.last[key] = now
+            record.sampled_dropped = self.dropped.pop(key, 0)
+        return True
+
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record):
+        entry = {
+            "time": datetime.fromtimestamp(record.created, SWEDISH_TZ).isoformat(
+                timespec="milliseconds"
+            ),
+            "level": record.levelname,
+            "logger": record.name,
+            "thread": record.threadName,
+            "message": record.getMessage(),
+            **getattr(record, "fields", {}),
+        }
+        if getattr(record, "sampled_dropped", 0):
+            entry["sampled_dropped"] = record.sampled_dropped
+        if record.exc_text:
+            entry["exception"] = record.exc_text
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+class TextFormatter(logging.Formatter):
+    converter = staticmethod(swedish_time)
+
+    def format(self, record):
+        message = super().format(record)
+        fields = getattr(record, "fields", {})
+        if fields:
+            message += " [" + " ".join(f"{key}={value}" for key, value in fields.items()) + "]"
+        return message
+
+
+class _QueueHandler(logging.handlers.QueueHandler):
+    # Message and traceback are rendered in the caller, the record then crosses threads
+    def prepare(self, record):
+        record = copy.copy(record)
+        record.message = record.getMessage()
+        record.msg, record.args = record.message, None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+
+def setup_logging(log_file, level=LOG_LEVEL, console=True):
+    """Log through a queue, file (rotated) and console I/O happen on a listener thread."""
+    global _listener
+    with _setup_lock:
+        if _listener is not None:
+            return
+
+        handlers = []
+        file_handler = logging.handlers.RotatingFileHandler(
+            log_file, maxBytes=LOG_MAX_BYTES, backupCount=LOG_BACKUPS, encoding="utf-8"
+        )
+        file_handler.setFormatter(
+            JsonFormatter() if LOG_FORMAT == "json" else TextFormatter(TEXT_FORMAT)
+        )
+        handlers.append(file_handler)
+        if console:
+            console_handler = logging.StreamHandler()
+            console_handler.setFormatter(TextFormatter(TEXT_FORMAT))
+            handlers.append(console_handler)
+
+        log_queue = queue.SimpleQueue()
+        queue_handler = _QueueHandler(log_queue)
+        queue_handler.addFilter(ContextFilter())
+        queue_handler.addFilter(SampleFilter())
+
+        root = logging.getLogger()
+        for handler in root.handlers[:]:
+            root.removeHandler(handler)
+        root.addHandler(queue_handler)
+        root.setLevel(level)
+
+        _listener = logging.handlers.QueueListener(log_queue, *handlers)
+        _listener.start()
+        atexit.register(_listener.stop)
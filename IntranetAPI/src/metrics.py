@@ -0,0 +1,70 @@
+import threading
+
+# Chat metrics for the lifetime of the process
+metrics = {
+    "chat_requests": 0,
+    "chat_completed": 0,
+    "chat_aborted": 0,
+    "completion_tokens": 0,
+    "aborted_completion_tokens": 0,
+    "tokens_saved_estimate": 0,
+}
+# Calls, tokens, cost and latency per stage and model
+model_metrics = {}
+_metrics_lock = threading.Lock()
+
+
+def increment(name, value=1):
+    with _metrics_lock:
+        metrics[name] = metrics.get(name, 0) + value
+
+
+def record_completion(tokens, aborted=False):
+    """Count a finished or aborted answer, aborts save about an average answer's remainder."""
+    with _metrics_lock:
+        if aborted:
+            metrics["chat_aborted"] += 1
+            metrics["aborted_completion_tokens"] += tokens
+            completed = metrics["chat_completed"]
+            average = metrics["completion_tokens"] / completed if completed else 0
+            metrics["tokens_saved_estimate"] += max(0, round(average) - tokens)
+        else:
+            metrics["chat_completed"] += 1
+            metrics["completion_tokens"] += tokens
+
+
+def record_model_call(stage, model, seconds, input_tokens, output_tokens, cost_usd):
+    with _metrics_lock:
+        entry = model_metrics.setdefault(
+            (stage, model),
+            {
+                "calls": 0,
+                "input_tokens": 0,
+                "output_tokens": 0,
+                "cost_usd": 0.0,
+                "seconds": 0.0,
+            },
+        )
+        entry["calls"] += 1
+        entry["input_tokens"] += input_tokens
+        entry["output_tokens"] += output_tokens
+        entry["cost_usd"] += cost_usd
+        entry["seconds"] += seconds
+
+
+def get_metrics():
+    with _metrics_lock:
+        snapshot = dict(metrics)
+        models = {
+            f"{stage}/{model}": dict(entry)
+            for (stage, model), entry in model_metrics.items()
+        }
+    for entry in models.values():
+        entry["average_seconds"] = round(entry["seconds"] / entry["calls"], 3)
+        entry["cost_usd"] = round(entry["cost_usd"], 6)
+    snapshot["models"] = models
+    completed = snapshot["chat_completed"]
+    snapshot["average_completion_tokens"] = (
+        round(snapshot["completion_tokens"] / completed, 1) if completed else 0
+    )
+    return snapshot
@@ -0,0 +1,50 @@
+import logging
+import os
+
+from essential_methods import MODEL_PRICES
+
+# Setup Logging
+logger = logging.getLogger(__name__)
+
+# Model per pipeline stage, each field can be overridden with MODEL_<STAGE>[_ESCALATE[_TOKENS]]
+MODEL_ROUTES = {
+    # CSV query rewrite, a small structured task
+    "rewrite": {"model": "gpt-4o-mini", "escalate_model": None, "escalate_above_tokens": None},
+    # Final answer, escalated to the larger model when the prompt is long
+    "answer": {"model": "gpt-4o", "escalate_model": None, "escalate_above_tokens": None},
+}
+
+
+def _load_routes():
+    routes = {}
+    for stage, route in MODEL_ROUTES.items():
+        prefix = f"MODEL_{stage.upper()}"
+        tokens = os.getenv(f"{prefix}_ESCALATE_TOKENS")
+        routes[stage] = {
+            "model": os.getenv(prefix, route["model"]),
+            "escalate_model": os.getenv(f"{prefix}_ESCALATE", route["escalate_model"]),
+            "escalate_above_tokens": int(tokens) if tokens else route["escalate_above_tokens"],
+        }
+        for model in (routes[stage]["model"], routes[stage]["escalate_model"]):
+            if model and model not in MODEL_PRICES:
+                raise ValueError(f"No price for model {model} (stage {stage})")
+    return routes
+
+
+ROUTES = _load_routes()
+
+
+def route_model(stage, prompt_tokens=None):
+    """Model for a pipeline stage, escalated when the prompt exceeds the stage's limit."""
+    route = ROUTES[stage]
+    if (
+        route["escalate_model"]
+        and route["escalate_above_tokens"] is not None
+        and prompt_tokens is not None
+        and prompt_tokens > route["escalate_above_tokens"]
+    ):
+        logger.info(
+            f"{stage}: {prompt_tokens} prompt tokens, escalating to {route['escalate_model']}"
+        )
+        return route["escalate_model"]
+    return route["model"]
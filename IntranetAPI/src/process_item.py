@@ -1,52 +1,111 @@
 from datetime import datetime, timezone
 import logging
-import os
-import time
+import threading
 from zoneinfo import ZoneInfo
 
-from dotenv import load_dotenv
-import openai
+import numpy as np
 
 from qdrant_client import QdrantClient
 from qdrant_client import models
 
-from essential_methods import calculate_cost, generate_uuid
+from config import configure_openai
+from essential_methods import calculate_cost, content_hash, generate_uuid
+from crawl_state import get_crawl_state
+from chunking import iter_chunks
+from embedding_service import get_embedding_service
+from embedding_cache import get_embedding_cache
+from qdrant_upload import upload_points
+from qdrant_delete import delete_ids, hand_over_points
+from faq_cache import get_faq_cache
+from ingest_profiler import profile_run, stage
 
 # Setup Logging
 logger = logging.getLogger(__name__)
 
-# Batch Constants
-BATCH_SIZE = 1000
-SLEEP_TIME = 2
 EMBEDDING_MODEL = "text-embedding-3-large"
 
+# Serializes "chunk exists elsewhere, claim it" against "last owner dropped it, delete it"
+# between the items processed in parallel by this process
+_ownership_lock = threading.Lock()
+
 # Setup Openai
-load_dotenv(dotenv_path="../data/API_KEYS.env")
-openai_api_key = os.getenv("OPENAI_API_KEY")
-openai.api_key = openai_api_key
+configure_openai()
 
 
 # Main, Process Item and upload to Qqdrant
 def process_item(
-    item, qdrant_client: QdrantClient, COLLECTION_NAME="IntranetFalkenbergHemsida_RAG"
+    item,
+    qdrant_client: QdrantClient,
+    COLLECTION_NAME="IntranetFalkenbergHemsida_RAG",
+    wait=True,
+    on_dead_letter=None,
 ):
+    """Returns the cost in SEK, on_dead_letter(url) is called if the upload was dead-lettered."""
+    # Stages join the update_url run when called from there
+    with profile_run("process_item", item["url"]):
+        return _process_item(item, qdrant_client, COLLECTION_NAME, wait, on_dead_letter)
+
+
+def _process_item(item, qdrant_client: QdrantClient, COLLECTION_NAME, wait, on_dead_letter):
+    manifest = get_crawl_state()
+    item_hash = content_hash([item["texts"]])
+    known = manifest.get_item(item["url"])
+    if known and known["content_hash"] == item_hash:
+        logger.info(f"Content unchanged, skipping item: {item['url']}")
+        return 0
+
     logger.info("Dividing to chunks")
-    chunks = get_item_chunks(item)
+    with stage("chunking", len(item["texts"].encode())):
+        chunks = get_item_chunks(item)
+    if not chunks:
+        logger.info("Empty input data - no chunks to update")
+        return 0
 
     logger.info(f"Getting chunks in need of update, url: {item['url']}")
-    db_hashes = get_db_chunk_hashes(chunks, qdrant_client, COLLECTION_NAME)
-    new_chunks = get_new_chunks(chunks, db_hashes)
-    old_urls = get_old_urls(chunks, db_hashes)
+    item_chunks = {chunk["chunk_hash"]: chunk["chunk_info"] for chunk in chunks}
+    with stage("db_hashes"), _ownership_lock:
+        db_hashes = get_db_chunk_hashes(chunks, qdrant_client, COLLECTION_NAME, known)
+        new_chunks, stale_ids, moved_chunks = get_chunk_delta(chunks, db_hashes)
+        # Chunks already indexed for other URLs are shared, this item becomes an owner too
+        foreign_ids = {db_hash["id"] for db_hash in db_hashes if not db_hash["in_scope"]}
+        manifest.claim_chunks(
+            item["url"],
+            {chunk_id: item_chunks[chunk_id] for chunk_id in foreign_ids & item_chunks.keys()},
+        )
 
-    if new_chunks == None or len(new_chunks) == 0:
+    if not new_chunks and not stale_ids and not moved_chunks:
         logger.info("No Update needed for this item.")
+        set_manifest_item(manifest, item, item_hash, item_chunks)
         return 0
-    logger.info("Embedding chunks")
-    embeddings, chunk_cost_SEK = create_embeddings(new_chunks)
-    logger.info("Removing old chunks")
-    remove_old_datapoints(new_chunks, qdrant_client, COLLECTION_NAME, old_urls)
-    logger.info("Uploading Embeddings")
-    upsert_to_qdrant(new_chunks, embeddings, qdrant_client, COLLECTION_NAME)
+
+    chunk_cost_SEK = 0
+    if new_chunks:
+        logger.info("Embedding chunks")
+        with stage("embedding", sum(len(chunk["chunk"].encode()) for chunk in new_chunks)):
+            embeddings, chunk_cost_SEK = create_embeddings(new_chunks)
+        logger.info("Uploading Embeddings")
+        with stage("upsert", embeddings.nbytes):
+            uploaded = upsert_to_qdrant(
+                new_chunks, embeddings, qdrant_client, COLLECTION_NAME, wait=wait
+            )
+        if not uploaded:
+            # Keep the old points searchable rather than leaving a gap
+            logger.error("Upload failed, keeping old chunks for this item.")
+            if on_dead_letter is not None:
+                on_dead_letter(item["url"])
+            return chunk_cost_SEK
+    if moved_chunks:
+        with stage("chunk_info"):
+            update_chunk_info(moved_chunks, qdrant_client, COLLECTION_NAME)
+    if stale_ids:
+        logger.info("Removing old chunks")
+        with stage("delete"):
+            remove_old_datapoints(item["url"], stale_ids, qdrant_client, COLLECTION_NAME)
+    # FAQ answers built from changed or removed chunks are regenerated
+    get_faq_cache().invalidate_chunks(
+        [*stale_ids, *(chunk["chunk_hash"] for chunk in moved_chunks)]
+    )
+    set_manifest_item(manifest, item, item_hash, item_chunks)
     logger.info("Processing Done")
     return chunk_cost_SEK
 
@@ -54,7 +113,7 @@ def process_item(
 # 1 Create into Chunks
 def get_item_chunks(item):
     all_chunks = []
-    text_chunks = chunk_text(item["texts"], 4000, 300)
+    text_chunks = list(iter_chunks(item["texts"]))
     num_chunks = len(text_chunks)
     for index, chunk in enumerate(text_chunks):
         chunk_data = {
@@ -71,28 +130,15 @@ def get_item_chunks(item):
     return all_chunks
 
 
-def chunk_text(text, chunk_size, overlap):
-    length = len(text)
-    chunks = []
-    start = 0
-    while start < length:
-        end = start + chunk_size
-        if end > length:
-            end = length
-        chunks.append(text[start:end])
-        start = end - overlap
-        if end == length:
-            break
-    return chunks
-
+# 2 Get DB Chunk Hashes (from the local manifest, Qdrant only for unknown items)
+def get_db_chunk_hashes(chunks, qdrant_client: QdrantClient, COLLECTION_NAME, known=None):
+    if known is not None:
+        return get_manifest_chunk_hashes(chunks, known)
 
-# 2 Get DB Chunk Hashes
-def get_db_chunk_hashes(chunks, qdrant_client: QdrantClient, COLLECTION_NAME):
     db_hashes = []
     chunk_source_url = chunks[0]["source_url"] if "source_url" in chunks[0] else None
     url = chunks[0]["url"]
 
-    logger.info(f"{url},{chunks[0]['chunk_hash']}")
 
     # if Site
     url_filter = models.Filter(
@@ -106,19 +152,20 @@ def get_db_chunk_hashes(chunks, qdrant_client: QdrantClient, COLLECTION_NAME):
         ]
     )
 
-    # if Linked Document
+    # if Linked Document (shared between pages, identified by its own URL only)
     link_filter = None
     if chunk_source_url:
         link_filter = models.Filter(
             must=[
-                models.FieldCondition(
-                    key="metadata.source_url",
-                    match=models.MatchValue(value=chunk_source_url),
-                ),
                 models.FieldCondition(
                     key="metadata.url", match=models.MatchValue(value=url)
                 ),
-            ]
+            ],
+            must_not=[
+                models.IsEmptyCondition(
+                    is_empty=models.PayloadField(key="metadata.source_url")
+                ),
+            ],
         )
 
     # Hash filter
@@ -135,108 +182,161 @@ def get_db_chunk_hashes(chunks, qdrant_client: QdrantClient, COLLECTION_NAME):
         qdrant_filter = models.Filter(should=[url_filter, hash_filter])
 
     db_points, _ = qdrant_client.scroll(
-        collection_name=COLLECTION_NAME, scroll_filter=qdrant_filter, limit=3000
+        collection_name=COLLECTION_NAME,
+        scroll_filter=qdrant_filter,
+        limit=3000,
+        with_payload=["metadata"],
     )
 
     for point in db_points:
-        point_id = point.id
-        point_url = point.payload.get("metadata")["url"]
-        db_hash = {"id": point_id, "url": point_url}
-        if "source_url" in point.payload.get("metadata"):
-            db_hash["source_url"] = point.payload.get("metadata")["source_url"]
+        metadata = point.payload.get("metadata")
+        db_hash = {
+            "id": str(point.id),
+            "url": metadata["url"],
+            "chunk_info": metadata.get("chunk_info"),
+            # Point belongs to this item (not just a hash match from another URL)
+            "in_scope": metadata["url"] == url
+            and bool(metadata.get("source_url")) == bool(chunk_source_url),
+        }
+        if "source_url" in metadata:
+            db_hash["source_url"] = metadata["source_url"]
         db_hashes.append(db_hash)
 
-    logger.info(f"Database Hashes found for url: {db_hashes}, {len(db_hashes)} stycken")
+    logger.info(f"Database Hashes found for url: {len(db_hashes)} stycken")
+    logger.debug("Database Hashes for %s: %s", url, db_hashes, extra={"sample": "db_hashes"})
 
     return db_hashes
 
 
-# 3 Compare new and old chunk hashes( IF new_chunks contain a new chunk hash/document it will be added to the update)
-def get_new_chunks(new_chunks, db_hashes):
-    if not new_chunks:
-        logger.info("Empty input data - no chunks to update")
-        return
-
-    db_hashes_set = {db_point["id"] for db_point in db_hashes}
-
-    urls_needing_update = {
-        chunk["url"] for chunk in new_chunks if chunk["chunk_hash"] not in db_hashes_set
-    }
-
-    chunks_to_update = [
-        chunk for chunk in new_chunks if chunk["url"] in urls_needing_update
+def get_manifest_chunk_hashes(chunks, known):
+    url = chunks[0]["url"]
+    db_hashes = [
+        {"id": chunk_id, "url": url, "chunk_info": chunk_info, "in_scope": True}
+        for chunk_id, chunk_info in known["chunks"].items()
     ]
-
-    logger.info(
-        f"Found {len(urls_needing_update)} URLs needing update with {len(chunks_to_update)} total chunks"
+    # Identical chunks already indexed under other URLs don't need new points
+    other_ids = get_crawl_state().existing_chunk_ids(
+        chunk["chunk_hash"] for chunk in chunks
+    ) - set(known["chunks"])
+    db_hashes.extend(
+        {"id": chunk_id, "url": None, "chunk_info": None, "in_scope": False}
+        for chunk_id in other_ids
     )
-    logger.info(f"URLs to update: {urls_needing_update}")
+    logger.info(f"Manifest hashes found for url: {len(db_hashes)} stycken")
+    return db_hashes
+
 
-    return chunks_to_update
+# 3 Compare new chunk IDs with existing point IDs (exact set difference)
+def get_chunk_delta(new_chunks, db_hashes):
+    db_ids = {db_point["id"] for db_point in db_hashes}
+    new_ids = {chunk["chunk_hash"] for chunk in new_chunks}
 
+    chunks_to_upload = [
+        chunk for chunk in new_chunks if chunk["chunk_hash"] not in db_ids
+    ]
 
-# 3.5 Get pdfs/documents that no longer is linked on page
-def get_old_urls(new_chunks, db_hashes):
-    db_urls_set = {db_point["url"] for db_point in db_hashes}
-    new_urls_set = {chunk["url"] for chunk in new_chunks}
+    # Only points belonging to this item can be stale, hash matches from other URLs are kept
+    item_points = [db_point for db_point in db_hashes if db_point["in_scope"]]
+    stale_ids = [
+        db_point["id"] for db_point in item_points if db_point["id"] not in new_ids
+    ]
 
-    removed_urls = db_urls_set - new_urls_set
+    # Kept chunks whose position (chunk_info) changed only need a payload update
+    item_chunk_info = {
+        db_point["id"]: db_point.get("chunk_info") for db_point in item_points
+    }
+    moved_chunks = [
+        chunk
+        for chunk in new_chunks
+        if chunk["chunk_hash"] in item_chunk_info
+        and item_chunk_info[chunk["chunk_hash"]] != chunk["chunk_info"]
+    ]
 
-    return removed_urls if removed_urls else None
+    logger.info(
+        f"{len(chunks_to_upload)} new, {len(stale_ids)} stale, {len(moved_chunks)} moved "
+        f"of {len(new_chunks)} chunks for url: {new_chunks[0]['url']}"
+    )
+    return chunks_to_upload, stale_ids, moved_chunks
 
 
-# 4 Create Embeddings
+# 4 Create Embeddings (local cache first, then the batched embedding service)
 def create_embeddings(chunks):
-    texts = [chunk["chunk"] for chunk in chunks]
-    embeddings = []
-    total_cost_sek = 0
-    for batch_start in range(0, len(texts), BATCH_SIZE):
-        batch_texts = texts[batch_start : batch_start + BATCH_SIZE]
-        response = openai.Embedding.create(model=EMBEDDING_MODEL, input=batch_texts)
+    cache = get_embedding_cache()
+    cached = cache.get_many([chunk["chunk_hash"] for chunk in chunks], EMBEDDING_MODEL)
+    missing = [chunk for chunk in chunks if chunk["chunk_hash"] not in cached]
+    logger.info(f"Embedding cache: {len(cached)} hits, {len(missing)} misses")
 
-        batch_cost_sek = calculate_cost(batch_texts) * 10  # Ish SEK conversion
-        total_cost_sek += batch_cost_sek
+    total_cost_sek = 0
+    if missing:
+        texts = [chunk["chunk"] for chunk in missing]
+        new_embeddings = get_embedding_service().embed(texts)
+        cache.put_many(
+            zip([chunk["chunk_hash"] for chunk in missing], new_embeddings),
+            EMBEDDING_MODEL,
+        )
+        cached.update(zip([chunk["chunk_hash"] for chunk in missing], new_embeddings))
+        total_cost_sek = calculate_cost(texts, EMBEDDING_MODEL) * 10  # Ish SEK conversion
 
-        batch_embeddings = [e["embedding"] for e in response["data"]]
-        embeddings.extend(batch_embeddings)
-        time.sleep(SLEEP_TIME)
+    embeddings = np.stack(
+        [np.asarray(cached[chunk["chunk_hash"]], dtype=np.float32) for chunk in chunks]
+    )
     return embeddings, total_cost_sek
 
 
-# 5 Remove Old Datapoints
-def remove_old_datapoints(
-    new_chunks, qdrant_client: QdrantClient, COLLECTION_NAME, old_urls=None
-):
-    # Remove url datapoints
-    urls = [chunk["url"] for chunk in new_chunks]
-    if old_urls:
-        urls.extend(old_urls)
+def set_manifest_item(manifest, item, item_hash, item_chunks):
+    manifest.set_item(
+        item["url"],
+        "source_url" in item,
+        item_hash,
+        item_chunks,
+        title=item["title"],
+        source_url=item.get("source_url"),
+    )
 
-    if not urls or len(urls) == 0:
+
+# 5 Remove Old Datapoints (after the new chunks are uploaded), shared ones only lose this owner
+def remove_old_datapoints(url, stale_ids, qdrant_client: QdrantClient, COLLECTION_NAME):
+    if not stale_ids:
         logger.info("No OLD datapoints to remove")
         return
 
-    url_filter = models.Filter(
-        must=[
-            models.FieldCondition(key="metadata.url", match=models.MatchAny(any=urls))
-        ]
+    with _ownership_lock:
+        orphaned_ids, shared = get_crawl_state().release_chunks(url, stale_ids)
+        if shared:
+            hand_over_points(qdrant_client, COLLECTION_NAME, [url], chunk_ids=shared)
+        deleted = delete_ids(qdrant_client, COLLECTION_NAME, sorted(orphaned_ids))
+    logger.info(f"Removed {deleted} OLD datapoints, kept {len(shared)} shared with other URLs")
+
+
+# 5.5 Update position metadata of chunks that were kept
+def update_chunk_info(chunks, qdrant_client: QdrantClient, COLLECTION_NAME):
+    operations = [
+        models.SetPayloadOperation(
+            set_payload=models.SetPayload(
+                payload={"chunk_info": chunk["chunk_info"]},
+                points=[chunk["chunk_hash"]],
+                key="metadata",
+            )
+        )
+        for chunk in chunks
+    ]
+    qdrant_client.batch_update_points(
+        collection_name=COLLECTION_NAME, update_operations=operations
     )
+    logger.info(f"Updated chunk info for {len(chunks)} kept chunks")
 
-    points_selector = models.FilterSelector(filter=url_filter)
-
-    qdrant_client.delete(
-        collection_name=COLLECTION_NAME, points_selector=points_selector
-    )
-    logger.info("Removed OLD datapoints")
 
+# 6 Upsert Embeddings to Qdrant (batched, parallel, retried, dead-lettered on failure)
+def upsert_to_qdrant(
+    chunks, embeddings, qdrant_client: QdrantClient, COLLECTION_NAME, wait=True
+):
+    utc_time = datetime.now(timezone.utc).replace(microsecond=0)
+    update_time = utc_time.astimezone(ZoneInfo("Europe/Stockholm"))
+    update_time_str = update_time.strftime("%Y-%m-%dT%H:%M:%S")
 
-# 6 Upsert Embeddings to Qdrant
-def upsert_to_qdrant(chunks, embeddings, qdrant_client: QdrantClient, COLLECTION_NAME):
-    points = []
-    for i, chunk in enumerate(chunks):
-        utc_time = datetime.now(timezone.utc).replace(microsecond=0)
-        update_time = utc_time.astimezone(ZoneInfo("Europe/Stockholm"))
-        update_time_str = update_time.strftime("%Y-%m-%dT%H:%M:%S")
+    ids = []
+    payloads = []
+    for chunk in chunks:
         payload = {
             "content": chunk["chunk"],
             "metadata": {
@@ -248,14 +348,11 @@ def upsert_to_qdrant(chunks, embeddings, qdrant_client: QdrantClient, COLLECTION
         }
         if "source_url" in chunk:
             payload["metadata"]["source_url"] = chunk["source_url"]
+        ids.append(chunk["chunk_hash"])
+        payloads.append(payload)
 
-        point = models.PointStruct(
-            id=chunk["chunk_hash"], vector=embeddings[i], payload=payload
-        )
-
-        logger.info(f"Chunk uppladdas: {chunk['chunk_hash']}, URL: {chunk['url']}")
-        points.append(point)
-    try:
-        qdrant_client.upsert(collection_name=COLLECTION_NAME, points=points)
-    except Exception as e:
-        logger.error(f"Upsert failed: {e}")
+    result = upload_points(
+        qdrant_client, COLLECTION_NAME, ids, embeddings, payloads, wait=wait
+    )
+    logger.info(f"Chunks uppladdade för URL: {chunks[0]['url']}, {result}")
+    return result.ok
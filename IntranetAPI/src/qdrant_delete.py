@@ -0,0 +1,231 @@
+import logging
+import time
+
+from qdrant_client import QdrantClient
+from qdrant_client import models
+
+from crawl_state import get_crawl_state
+from faq_cache import get_faq_cache
+
+# Setup Logging
+logger = logging.getLogger(__name__)
+
+# Delete Constants
+DELETE_BATCH_URLS = 100  # URLs per filter, keeps MatchAny filters small
+DELETE_BATCH_IDS = 1000
+DELETE_RETRIES = 3
+FACET_LIMIT = 10000
+
+
+class DeleteSummary:
+    def __init__(self, dry_run=False):
+        self.dry_run = dry_run
+        self.per_url = {}
+        self.deleted = 0
+        self.failed_urls = []
+
+    @property
+    def ok(self):
+        return not self.failed_urls
+
+    def as_dict(self):
+        return {
+            "dry_run": self.dry_run,
+            "urls": len(self.per_url),
+            "points": sum(self.per_url.values()),
+            "deleted": self.deleted,
+            "per_url": self.per_url,
+            "failed_urls": self.failed_urls,
+        }
+
+    def __repr__(self):
+        return (
+            f"DeleteSummary(urls={len(self.per_url)}, deleted={self.deleted}, "
+            f"failed={len(self.failed_urls)}, dry_run={self.dry_run})"
+        )
+
+
+def _batches(values, size):
+    values = list(values)
+    for start in range(0, len(values), size):
+        yield values[start : start + size]
+
+
+def url_filter(urls, include_linked=False, only_documents=False, exclude_urls=()):
+    """Points of the given URLs, optionally with documents scraped from them (source_url)."""
+    should = [
+        models.FieldCondition(key="metadata.url", match=models.MatchAny(any=list(urls)))
+    ]
+    if include_linked:
+        should.append(
+            models.FieldCondition(
+                key="metadata.source_url", match=models.MatchAny(any=list(urls))
+            )
+        )
+    must_not = []
+    if only_documents:
+        must_not.append(
+            models.IsEmptyCondition(is_empty=models.PayloadField(key="metadata.source_url"))
+        )
+    if exclude_urls:
+        must_not.append(
+            models.FieldCondition(
+                key="metadata.url", match=models.MatchAny(any=list(exclude_urls))
+            )
+        )
+    return models.Filter(should=should, must_not=must_not or None)
+
+
+def count_points(qdrant_client: QdrantClient, collection_name, qdrant_filter):
+    return qdrant_client.count(
+        collection_name=collection_name, count_filter=qdrant_filter, exact=True
+    ).count
+
+
+def preview_urls(qdrant_client: QdrantClient, collection_name, urls, **filter_options):
+    """Points per URL that a delete would remove, without transferring any points."""
+    counts = {}
+    for batch in _batches(urls, DELETE_BATCH_URLS):
+        qdrant_filter = url_filter(batch, **filter_options)
+        try:
+            # One request per batch, needs the keyword index on metadata.url
+            hits = qdrant_client.facet(
+                collection_name=collection_name,
+                key="metadata.url",
+                facet_filter=qdrant_filter,
+                limit=FACET_LIMIT,
+                exact=True,
+            ).hits
+            counts.update({hit.value: hit.count for hit in hits})
+        except Exception as e:
+            logger.debug(f"Facet unavailable ({e}), counting per URL")
+            for url in batch:
+                count = count_points(
+                    qdrant_client, collection_name, url_filter([url], **filter_options)
+                )
+                if count:
+                    counts[url] = count
+    return counts
+
+
+def delete_urls(
+    qdrant_client: QdrantClient,
+    collection_name,
+    urls,
+    include_linked=False,
+    only_documents=False,
+    exclude_urls=(),
+    wait=True,
+    dry_run=False,
+    batch_size=DELETE_BATCH_URLS,
+):
+    """Delete all points of the given URLs in bounded batches, returns a DeleteSummary."""
+    urls = sorted(set(urls))
+    filter_options = {
+        "include_linked": include_linked,
+        "only_documents": only_documents,
+        "exclude_urls": exclude_urls,
+    }
+    summary = DeleteSummary(dry_run=dry_run)
+    if not urls:
+        return summary
+    summary.per_url = preview_urls(qdrant_client, collection_name, urls, **filter_options)
+    if dry_run:
+        logger.info(f"[dry-run] Would delete {summary.as_dict()['points']} points for {len(urls)} URLs")
+        return summary
+
+    batches = list(_batches(urls, batch_size))
+    for number, batch in enumerate(batches, start=1):
+        qdrant_filter = url_filter(batch, **filter_options)
+        for attempt in range(DELETE_RETRIES + 1):
+            try:
+                count = count_points(qdrant_client, collection_name, qdrant_filter)
+                if count:
+                    qdrant_client.delete(
+                        collection_name=collection_name,
+                        points_selector=models.FilterSelector(filter=qdrant_filter),
+                        wait=wait,
+                    )
+                summary.deleted += count
+                break
+            except Exception as e:
+                if attempt == DELETE_RETRIES:
+                    logger.error(f"Delete of {len(batch)} URLs failed: {e}")
+                    summary.failed_urls.extend(batch)
+                    break
+                backoff = min(2**attempt, 30)
+                logger.warning(f"Delete batch failed ({e}), retrying in {backoff}s")
+                time.sleep(backoff)
+        logger.info(
+            f"Delete progress: batch {number}/{len(batches)}, {summary.deleted} points deleted"
+        )
+    # FAQ answers built from the removed pages are regenerated
+    get_faq_cache().invalidate_urls(urls)
+    return summary
+
+
+def delete_ids(qdrant_client: QdrantClient, collection_name, ids, wait=True):
+    """Delete points by ID in bounded batches, returns the number deleted."""
+    deleted = 0
+    for batch in _batches(ids, DELETE_BATCH_IDS):
+        qdrant_client.delete(
+            collection_name=collection_name,
+            points_selector=models.PointIdsList(points=batch),
+            wait=wait,
+        )
+        deleted += len(batch)
+    return deleted
+
+
+def hand_over_points(
+    qdrant_client: QdrantClient, collection_name, released_urls, chunk_ids=None
+):
+    """Move points other items still list to one of them, returns the number moved.
+
+    A point's payload names one owner URL, so a URL delete (or a stale chunk
+    delete) would otherwise remove text that other pages still contain.
+    """
+    manifest = get_crawl_state()
+    released_urls = set(released_urls)
+    if chunk_ids is None:
+        chunk_ids = set()
+        for url in released_urls:
+            item = manifest.get_item(url)
+            if item:
+                chunk_ids |= set(item["chunks"])
+    owners = manifest.chunk_owners(chunk_ids, exclude_urls=released_urls)
+    moved = 0
+    for batch in _batches(owners, DELETE_BATCH_IDS):
+        operations = []
+        points = qdrant_client.retrieve(
+            collection_name=collection_name, ids=batch, with_payload=True, with_vectors=False
+        )
+        for point in points:
+            metadata = point.payload.get("metadata", {})
+            if metadata.get("url") not in released_urls:
+                continue
+            owner_url, chunk_info = next(iter(owners[str(point.id)].items()))
+            owner = manifest.get_item(owner_url) or {}
+            new_metadata = {
+                key: value for key, value in metadata.items() if key != "source_url"
+            }
+            new_metadata.update(url=owner_url, chunk_info=chunk_info or metadata.get("chunk_info"))
+            if owner.get("title"):
+                new_metadata["title"] = owner["title"]
+            if owner.get("is_document") and owner.get("source_url"):
+                new_metadata["source_url"] = owner["source_url"]
+            operations.append(
+                models.OverwritePayloadOperation(
+                    overwrite_payload=models.SetPayload(
+                        payload={**point.payload, "metadata": new_metadata}, points=[point.id]
+                    )
+                )
+            )
+        if operations:
+            qdrant_client.batch_update_points(
+                collection_name=collection_name, update_operations=operations
+            )
+            moved += len(operations)
+    if moved:
+        logger.info(f"Handed {moved} shared points over to other URLs")
+    return moved
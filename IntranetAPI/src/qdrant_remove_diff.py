@@ -0,0 +1,153 @@
+import logging
+import requests
+
+from datetime import datetime, timezone
+from zoneinfo import ZoneInfo
+
+from sitemap import SITEMAP_URL, get_sitemap_urls
+from qdrant_delete import delete_urls, hand_over_points
+from config import COLLECTION_NAME, get_cookie, get_qdrant_client, get_secret
+from individual_update_url import crawl_state, document_registry
+
+# Setup Logging
+logger = logging.getLogger(__name__)
+
+# Load environment variables
+ping_key = get_secret("HEALTHCHECKS_KEY", required=False)
+COOKIE_NAME, COOKIE_VALUE = get_cookie()
+
+HEALTHCHECKS_URL = "https://healthchecks.utvecklingfalkenberg.se/ping"
+MAX_REMOVALS = 50  # Larger differences have to be handled manually (or forced)
+
+
+# Get page URLs from the web sitemap (exclusions applied)
+def get_web_sitemap_urls(sitemap_url=SITEMAP_URL):
+    return get_sitemap_urls(COOKIE_NAME, COOKIE_VALUE, sitemap_url)
+
+
+def ping_healthcheck(check, fail=False, data=None):
+    if not ping_key:
+        return
+    url = f"{HEALTHCHECKS_URL}/{ping_key}/{check}" + ("/fail" if fail else "")
+    try:
+        requests.post(url, data=data, timeout=10)
+    except requests.exceptions.RequestException as e:
+        logger.warning(f"Healthcheck ping {check} failed: {e}")
+
+
+# Page URLs indexed according to the manifest
+def get_indexed_page_urls():
+    # Pages indexed before the manifest existed are added to it from Qdrant once
+    if crawl_state.manifest_reconciled_at() is None:
+        logger.info("Manifest ej avstämt, fyller det från Qdrant.")
+        crawl_state.reconcile(get_qdrant_client(), COLLECTION_NAME)
+    return crawl_state.page_urls()
+
+
+def remove_web_sitemap_url_diff(force=False, sitemap_urls=None):
+    """Remove indexed pages that are no longer in the sitemap, returns removed URLs."""
+    try:
+        qdrant_urls = get_indexed_page_urls()
+        if sitemap_urls is None:
+            sitemap_urls = get_web_sitemap_urls(SITEMAP_URL)
+        logger.info(f"Totalt {len(qdrant_urls)} URL:er i Qdrant.")
+        logger.info(f"Totalt {len(sitemap_urls)} URL:er i sitemap.")
+
+        # Find urls that are in Qdrant but not in the sitemap
+        missing_urls = qdrant_urls - set(sitemap_urls)
+        logger.info(f"Totalt {len(missing_urls)} URL:er saknas i sitemap.")
+        if len(missing_urls) > MAX_REMOVALS and not force:
+            logger.warning("För många URL:er skiljer sig från sitemap, vänligen kontrollera.")
+            ping_healthcheck(
+                "intern-qdrant-diff-remove",
+                fail=True,
+                data=f"Webb URL Difference Amount= {len(missing_urls)}, Handle manually!",
+            )
+            return set()
+        if missing_urls:
+            logger.info(f"Tas bort från Qdrant: {sorted(missing_urls)}")
+            failed_urls = remove_qdrant_urls(missing_urls)
+            if failed_urls:
+                ping_healthcheck(
+                    "intern-qdrant-diff-remove",
+                    fail=True,
+                    data=f"Delete failed for {len(failed_urls)} URLs, retried next run",
+                )
+                return missing_urls - failed_urls
+        else:
+            logger.info("Alla Webb URL:er i Qdrant finns också i sitemap.")
+        ping_healthcheck("intern-qdrant-diff-remove")
+        return missing_urls
+
+    except Exception as e:
+        logger.error(f"Ett fel inträffade: {e}")
+        ping_healthcheck("intern-qdrant-diff-remove", fail=True, data=str(e))
+        return set()
+
+
+def remove_qdrant_urls(urls):
+    """Delete pages and the documents only they link, returns URLs that failed to delete.
+
+    Registry and manifest entries are only dropped for URLs whose points are gone,
+    so a failed delete is found again by the next diff.
+    """
+    urls = list(urls)
+    removed = set(urls)
+    linked_documents = set()
+    for url in urls:
+        linked_documents |= document_registry.links(url)
+    shared_documents = {
+        document_url
+        for document_url in linked_documents
+        if document_registry.references(document_url) - removed
+    }
+    if shared_documents:
+        logger.info(f"Behåller {len(shared_documents)} dokument som länkas från andra sidor.")
+
+    # Text the removed URLs share with remaining pages is handed over, not deleted
+    hand_over_points(
+        get_qdrant_client(), COLLECTION_NAME, removed | (linked_documents - shared_documents)
+    )
+
+    # Pages with their legacy linked points, then documents no page links any more
+    summary = delete_urls(
+        get_qdrant_client(),
+        COLLECTION_NAME,
+        urls,
+        include_linked=True,
+        exclude_urls=shared_documents,
+    )
+    logger.info(f"Borttaget för sidor: {summary.as_dict()}")
+    failed = set(summary.failed_urls)
+    deleted_pages = [url for url in urls if url not in failed]
+
+    orphaned_documents = set()
+    for url in deleted_pages:
+        orphaned_documents |= document_registry.remove_page(url)
+    if orphaned_documents:
+        document_summary = delete_urls(
+            get_qdrant_client(), COLLECTION_NAME, orphaned_documents, only_documents=True
+        )
+        logger.info(f"Borttaget för dokument: {document_summary.as_dict()}")
+        failed |= set(document_summary.failed_urls)
+    deleted_documents = orphaned_documents - failed
+    document_registry.remove_documents(deleted_documents)
+    crawl_state.remove_items(deleted_pages + list(deleted_documents))
+    crawl_state.remove(deleted_pages)
+    if failed:
+        logger.error(f"Borttagning misslyckades för {len(failed)} URL:er: {sorted(failed)}")
+    return failed
+
+
+# Main function
+def main():
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
+    utc_time = datetime.now(timezone.utc).replace(microsecond=0)
+    current_date_time = utc_time.astimezone(ZoneInfo("Europe/Stockholm"))
+    logger.info(f"Datetime: {current_date_time}")
+    logger.info("Tar bort gamla Webbsitemap URL:er...")
+    remove_web_sitemap_url_diff(force=False)  # True to force removal
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,170 @@
+import argparse
+import json
+import logging
+import os
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+from qdrant_client import QdrantClient
+from qdrant_client import models
+
+# Setup Logging
+logger = logging.getLogger(__name__)
+
+# Upload Constants
+UPLOAD_BATCH_POINTS = 64
+UPLOAD_BATCH_BYTES = 8 * 1024 * 1024  # Approximate JSON request size
+UPLOAD_PARALLEL = 4
+UPLOAD_RETRIES = 4
+JSON_BYTES_PER_FLOAT = 12
+DEAD_LETTER_DIR = "../data/dead_letter"
+
+
+class UploadResult:
+    def __init__(self):
+        self.uploaded = 0
+        self.failed = 0
+        self.dead_letters = []
+
+    @property
+    def ok(self):
+        return self.failed == 0
+
+    def __repr__(self):
+        return (
+            f"UploadResult(uploaded={self.uploaded}, failed={self.failed}, "
+            f"dead_letters={self.dead_letters})"
+        )
+
+
+def iter_batches(ids, vectors, payloads, max_points=UPLOAD_BATCH_POINTS, max_bytes=UPLOAD_BATCH_BYTES):
+    """Yield (ids, vectors, payloads) slices bounded by point count and request size."""
+    vector_bytes = vectors.shape[1] * JSON_BYTES_PER_FLOAT if len(vectors) else 0
+    start = 0
+    batch_bytes = 0
+    for index, payload in enumerate(payloads):
+        point_bytes = vector_bytes + len(json.dumps(payload, ensure_ascii=False))
+        if index > start and (
+            index - start >= max_points or batch_bytes + point_bytes > max_bytes
+        ):
+            yield ids[start:index], vectors[start:index], payloads[start:index]
+            start = index
+            batch_bytes = 0
+        batch_bytes += point_bytes
+    if start < len(payloads):
+        yield ids[start:], vectors[start:], payloads[start:]
+
+
+def _upsert_batch(qdrant_client: QdrantClient, collection_name, ids, vectors, payloads, wait):
+    for attempt in range(UPLOAD_RETRIES + 1):
+        try:
+            qdrant_client.upsert(
+                collection_name=collection_name,
+                points=models.Batch(
+                    ids=list(ids), vectors=vectors.tolist(), payloads=list(payloads)
+                ),
+                wait=wait,
+            )
+            return None
+        except Exception as e:
+            if attempt == UPLOAD_RETRIES:
+                return e
+            backoff = min(2**attempt, 30)
+            logger.warning(
+                f"Upsert of {len(ids)} points failed ({e}), retrying in {backoff}s"
+            )
+            time.sleep(backoff)
+
+
+def write_dead_letter(collection_name, ids, vectors, payloads, error):
+    os.makedirs(DEAD_LETTER_DIR, exist_ok=True)
+    path = os.path.join(DEAD_LETTER_DIR, f"{collection_name}_{uuid.uuid4().hex}.npz")
+    np.savez(
+        path,
+        ids=np.array(ids),
+        vectors=np.asarray(vectors, dtype=np.float32),
+        payloads=np.array(json.dumps(list(payloads), ensure_ascii=False)),
+        collection_name=np.array(collection_name),
+        error=np.array(str(error)),
+    )
+    return path
+
+
+def upload_points(
+    qdrant_client: QdrantClient,
+    collection_name,
+    ids,
+    vectors,
+    payloads,
+    wait=True,
+    parallel=UPLOAD_PARALLEL,
+):
+    """Upsert points in bounded batches with parallel requests.
+
+    Batches that still fail after the retries are written to the dead-letter
+    directory so they can be replayed instead of being lost.
+    """
+    vectors = np.asarray(vectors, dtype=np.float32)
+    result = UploadResult()
+    if not len(ids):
+        return result
+
+    def send(batch):
+        batch_ids, batch_vectors, batch_payloads = batch
+        error = _upsert_batch(
+            qdrant_client, collection_name, batch_ids, batch_vectors, batch_payloads, wait
+        )
+        if error is None:
+            return len(batch_ids), None
+        path = write_dead_letter(
+            collection_name, batch_ids, batch_vectors, batch_payloads, error
+        )
+        logger.error(f"Upsert of {len(batch_ids)} points failed: {error}, saved to {path}")
+        return len(batch_ids), path
+
+    with ThreadPoolExecutor(max_workers=parallel) as executor:
+        for count, dead_letter in executor.map(
+            send, iter_batches(ids, vectors, payloads)
+        ):
+            if dead_letter:
+                result.failed += count
+                result.dead_letters.append(dead_letter)
+            else:
+                result.uploaded += count
+    return result
+
+
+def replay_dead_letters(qdrant_client: QdrantClient, wait=True):
+    """Re-upload all dead-lettered batches, removing the files that succeed."""
+    if not os.path.isdir(DEAD_LETTER_DIR):
+        return 0
+    replayed = 0
+    for name in sorted(os.listdir(DEAD_LETTER_DIR)):
+        path = os.path.join(DEAD_LETTER_DIR, name)
+        with np.load(path) as data:
+            collection_name = str(data["collection_name"])
+            ids = data["ids"].tolist()
+            vectors = data["vectors"]
+            payloads = json.loads(str(data["payloads"]))
+        error = _upsert_batch(qdrant_client, collection_name, ids, vectors, payloads, wait)
+        if error is None:
+            os.remove(path)
+            replayed += len(ids)
+            logger.info(f"Replayed {len(ids)} points from {name}")
+        else:
+            logger.error(f"Replay of {name} failed again: {error}")
+    return replayed
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(message)s")
+
+    parser = argparse.ArgumentParser(description="Qdrant upload dead-letter tools.")
+    parser.add_argument("command", choices=["replay"])
+    args = parser.parse_args()
+
+    from config import get_qdrant_client
+
+    print(f"Replayed {replay_dead_letters(get_qdrant_client())} points")
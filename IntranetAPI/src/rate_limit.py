@@ -0,0 +1,211 @@
+import logging
+import math
+import os
+import re
+import sqlite3
+import threading
+import time
+
+# Setup Logging
+logger = logging.getLogger(__name__)
+
+# "redis://host:6379/0" for several hosts, the SQLite file is shared by all workers on one host
+RATE_LIMIT_STORAGE = os.getenv("RATE_LIMIT_STORAGE", "sqlite:///../data/rate_limit.db")
+RATE_LIMIT_PREFIX = "ratelimit:"
+
+# Limits, "N per second|minute|hour|day" (N is also the burst size)
+USER_LIMIT = os.getenv("RATE_LIMIT_USER", "30 per hour")
+GLOBAL_LIMIT = os.getenv("RATE_LIMIT_GLOBAL", "100 per hour")
+COST_BUDGET = os.getenv("RATE_LIMIT_COST_USD", "5 per hour")  # Model spend of all users
+
+SQLITE_PRUNE_EVERY = 1000  # Updates between removals of idle (full) buckets
+SQLITE_IDLE_SECONDS = 2 * 86400
+NO_MINIMUM = -1e18  # Charges always succeed, the balance is floored at -capacity
+PERIODS = {"second": 1, "minute": 60, "hour": 3600, "day": 86400}
+LIMIT_PATTERN = re.compile(r"^\s*([\d.]+)\s*(?:per|/)\s*(second|minute|hour|day)s?\s*$")
+
+# Token buckets, refilled continuously, taken only if every bucket allows it:
+# KEYS bucket keys, ARGV now, then capacity, rate, amount, minimum per key
+TOKEN_BUCKET_LUA = """
+local now = tonumber(ARGV[1])
+local tokens = {}
+local allowed = 1
+for i, key in ipairs(KEYS) do
+    local base = 2 + (i - 1) * 4
+    local capacity = tonumber(ARGV[base])
+    local rate = tonumber(ARGV[base + 1])
+    local state = redis.call('HMGET', key, 'tokens', 'updated')
+    local current = tonumber(state[1]) or capacity
+    local updated = tonumber(state[2]) or now
+    tokens[i] = math.min(capacity, current + math.max(0, now - updated) * rate)
+    if tokens[i] < tonumber(ARGV[base + 3]) then
+        allowed = 0
+    end
+end
+for i, key in ipairs(KEYS) do
+    local base = 2 + (i - 1) * 4
+    local capacity = tonumber(ARGV[base])
+    if allowed == 1 then
+        tokens[i] = math.max(-capacity, tokens[i] - tonumber(ARGV[base + 2]))
+    end
+    redis.call('HSET', key, 'tokens', tokens[i], 'updated', now)
+    redis.call('EXPIRE', key, math.ceil(capacity / tonumber(ARGV[base + 1])) * 2 + 60)
+    tokens[i] = tostring(tokens[i])
+end
+return {allowed, tokens}
+"""
+
+
+class Limit:
+    def __init__(self, spec):
+        match = LIMIT_PATTERN.match(spec)
+        if not match:
+            raise ValueError(f"Invalid rate limit: {spec}")
+        self.spec = spec
+        self.capacity = float(match.group(1))
+        self.rate = self.capacity / PERIODS[match.group(2)]  # Tokens per second
+
+    def __repr__(self):
+        return f"Limit({self.spec})"
+
+
+class RedisBackend:
+    """Buckets in Redis (or a compatible server), updated atomically by a Lua script."""
+
+    def __init__(self, url):
+        import redis  # Optional dependency, only needed for redis:// storage
+
+        self.client = redis.Redis.from_url(url, socket_timeout=1, socket_connect_timeout=1)
+        self.script = self.client.register_script(TOKEN_BUCKET_LUA)
+
+    def consume(self, buckets):
+        args = [time.time()]
+        for _, limit, amount, minimum in buckets:
+            args += [limit.capacity, limit.rate, amount, minimum]
+        allowed, tokens = self.script(
+            keys=[RATE_LIMIT_PREFIX + key for key, _, _, _ in buckets], args=args
+        )
+        return bool(allowed), [float(value) for value in tokens]
+
+
+class SqliteBackend:
+    """Buckets in a SQLite file, the write lock serializes all workers on the host."""
+
+    def __init__(self, db_path):
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(
+            db_path, check_same_thread=False, timeout=5, isolation_level=None
+        )
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.execute(
+            """CREATE TABLE IF NOT EXISTS buckets (
+                key TEXT PRIMARY KEY,
+                tokens REAL NOT NULL,
+                updated REAL NOT NULL
+            )"""
+        )
+        self.updates = 0
+
+    def consume(self, buckets):
+        now = time.time()
+        with self.lock:
+            self.conn.execute("BEGIN IMMEDIATE")
+            try:
+                tokens = []
+                for key, limit, _, _ in buckets:
+                    row = self.conn.execute(
+                        "SELECT tokens, updated FROM buckets WHERE key = ?", (key,)
+                    ).fetchone()
+                    current, updated = row if row else (limit.capacity, now)
+                    tokens.append(
+                        min(limit.capacity, current + max(0.0, now - updated) * limit.rate)
+                    )
+                allowed = all(
+                    current >= minimum for current, (_, _, _, minimum) in zip(tokens, buckets)
+                )
+                for index, (key, limit, amount, _) in enumerate(buckets):
+                    if allowed:
+                        tokens[index] = max(-limit.capacity, tokens[index] - amount)
+                    self.conn.execute(
+                        "INSERT OR REPLACE INTO buckets (key, tokens, updated) VALUES (?, ?, ?)",
+                        (key, tokens[index], now),
+                    )
+                self.updates += 1
+                if self.updates % SQLITE_PRUNE_EVERY == 0:
+                    self.conn.execute(
+                        "DELETE FROM buckets WHERE updated < ?", (now - SQLITE_IDLE_SECONDS,)
+                    )
+                self.conn.execute("COMMIT")
+            except Exception:
+                self.conn.execute("ROLLBACK")
+                raise
+        return allowed, tokens
+
+
+def create_backend(storage=RATE_LIMIT_STORAGE):
+    if storage.startswith(("redis://", "rediss://", "unix://")):
+        return RedisBackend(storage)
+    if storage.startswith("sqlite:///"):
+        return SqliteBackend(storage[len("sqlite:///") :])
+    raise ValueError(f"Unsupported rate limit storage: {storage}")
+
+
+class RateLimiter:
+    """Per-client request buckets, a global request bucket and a global cost budget.
+
+    Every check is one atomic update of all its buckets in the shared backend,
+    so the limits hold across uvicorn workers (and hosts with Redis).
+    """
+
+    def __init__(
+        self,
+        backend=None,
+        user_limit=USER_LIMIT,
+        global_limit=GLOBAL_LIMIT,
+        cost_budget=COST_BUDGET,
+    ):
+        self.backend = backend or create_backend()
+        self.user_limit = Limit(user_limit)
+        self.global_limit = Limit(global_limit)
+        self.cost_budget = Limit(cost_budget)
+
+    def _consume(self, buckets):
+        """Take from all (key, limit, amount, minimum) buckets or none of them.
+
+        Returns (allowed, index of the first refusing bucket, retry_after_seconds),
+        allows the request if the backend fails.
+        """
+        try:
+            allowed, tokens = self.backend.consume(buckets)
+        except Exception as e:
+            logger.error(f"Rate limit backend failed, allowing request: {e}")
+            return True, None, 0
+        if allowed:
+            return True, None, 0
+        for index, ((_, limit, _, minimum), current) in enumerate(zip(buckets, tokens)):
+            if current < minimum:
+                return False, index, math.ceil((minimum - current) / limit.rate)
+        return False, None, 0
+
+    def check(self, client_key):
+        """Take one request for the client, returns (allowed, reason, retry_after).
+
+        A refused request takes nothing, not even from the buckets that had room.
+        """
+        # The shared cost budget only has to have something left, it is charged afterwards
+        buckets = [
+            ("cost", self.cost_budget, 0, 1e-9),
+            (f"user:{client_key}", self.user_limit, 1, 1),
+            ("global", self.global_limit, 1, 1),
+        ]
+        allowed, refused, retry_after = self._consume(buckets)
+        if allowed:
+            return True, None, 0
+        reason = ("cost", "user", "global")[refused] if refused is not None else "global"
+        return False, reason, retry_after
+
+    def charge(self, cost_usd):
+        """Debit the real cost of an answer from the global budget."""
+        if cost_usd > 0:
+            self._consume([("cost", self.cost_budget, cost_usd, NO_MINIMUM)])
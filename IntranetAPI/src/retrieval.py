@@ -0,0 +1,66 @@
+from qdrant_client import QdrantClient
+from qdrant_client import models
+
+SEARCH_LIMIT = 5
+KEYWORD_LIMIT = 3  # Keyword matches put ahead of the vector results
+
+
+# Full text filter for the keywords of the rewritten question
+def keyword_filter_for(keywords):
+    if not keywords:
+        return None
+    return models.Filter(
+        should=[
+            models.FieldCondition(key="content", match=models.MatchText(text=keyword))
+            for keyword in keywords
+        ]
+    )
+
+
+def search_collection(
+    qdrant_client: QdrantClient,
+    collection_name,
+    user_query_embedding,
+    keyword_filter=None,
+    timeout=None,
+    limit=SEARCH_LIMIT,
+    keyword_limit=KEYWORD_LIMIT,
+):
+    timeout = max(1, int(timeout)) if timeout else None
+    if keyword_filter is None:
+        response = qdrant_client.query_points(
+            collection_name=collection_name,
+            query=user_query_embedding,
+            limit=limit,
+            with_payload=True,
+            timeout=timeout,
+        )
+        return response.points if hasattr(response, "points") else []
+
+    # Get results from vector search and filtered scroll
+    vector_result_obj = qdrant_client.query_points(
+        collection_name=collection_name,
+        query=user_query_embedding,
+        limit=limit,
+        with_payload=True,
+        timeout=timeout,
+    )
+    vector_results = vector_result_obj.points if hasattr(vector_result_obj, "points") else []
+
+    filtered_results, _ = qdrant_client.scroll(
+        collection_name=collection_name,
+        scroll_filter=keyword_filter,
+        limit=keyword_limit,
+        timeout=timeout,
+    )
+
+    filtered_ids = set(point.id for point in filtered_results)
+    combined_results = list(filtered_results)
+
+    for r in vector_results:
+        if r.id not in filtered_ids:
+            combined_results.append(r)
+        if len(combined_results) >= limit:
+            break
+
+    return combined_results[:limit]
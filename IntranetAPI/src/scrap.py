@@ -1,199 +1,132 @@
 import logging
-import re
-from bs4 import BeautifulSoup
-import docx
-import pdfplumber
-from playwright.sync_api import sync_playwright
-from dotenv import load_dotenv
 import os
+from urllib.parse import urlparse
 
 import requests
+from playwright.sync_api import sync_playwright
+
+from config import INTRANET_URL
+from html_extract import extract_page
+from doc_extract import extract_document
+from ingest_profiler import stage
 
 # Setup Logging
-logging.getLogger("pdfminer").setLevel(logging.ERROR)
 logger = logging.getLogger(__name__)
 
-UNWANTED_TAGS = [  # Due to site having no main element and inconsistency
-    "header",
-    "footer",
-    "nav",
-    "aside",
-    "script",
-    "style",
-    "noscript",
-    "iframe",
-]
-UNWANTED_CLASSES = [
-    "tm-header",
-    "tm-header-mobile",
-    "tm-footer",
-    "tm-sidebar",
-    "uk-nav",
-    "cookie",
-    "search",
-    "sidebarmenu",
-]
-UNWANTED_IDS = ["tm-header", "tm-footer", "tm-sidebar", "cookie", "assistant"]
-
-
-def scrap_site(page_url, cookie_name, cookie_value):
+# "browser" renders with Chromium, "http" fetches the HTML as served (no JavaScript)
+PAGE_FETCHER = os.getenv("SCRAP_FETCHER", "browser")
+RENDER_WAIT_MS = 3000  # Wait for the JavaScript to load
+HTTP_TIMEOUT = (10, 30)
+
+
+def fetch_rendered(page_url, cookie_name, cookie_value):
     # Playwright Test
     with sync_playwright() as p:
-        browser = p.chromium.launch(headless=True)
-        context = browser.new_context()
+        with stage("browser_start"):
+            browser = p.chromium.launch(headless=True)
+            context = browser.new_context()
 
-        # Set your cookies here
-        context.add_cookies(
-            [
-                {
-                    "name": cookie_name,
-                    "value": cookie_value,
-                    "domain": "intranet.falkenberg.se",
-                    "path": "/",
-                    "httpOnly": True,
-                    "secure": True,
-                }
-            ]
-        )
+            # Set your cookies here
+            context.add_cookies(
+                [
+                    {
+                        "name": cookie_name,
+                        "value": cookie_value,
+                        "domain": urlparse(INTRANET_URL).hostname,
+                        "path": "/",
+                        "httpOnly": True,
+                        "secure": INTRANET_URL.startswith("https://"),
+                    }
+                ]
+            )
 
-        page = context.new_page()
-        page.goto(page_url)
+        try:
+            with stage("render") as rendered:
+                page = context.new_page()
+                page.goto(page_url)
 
-        # Wait for the JavaScript to load ms
-        page.wait_for_timeout(3000)
+            with stage("sleep"):
+                page.wait_for_timeout(RENDER_WAIT_MS)
 
-        # Check if page was loaded successfully
-        current_url = page.url
-        if "idp.falkenberg.se" in current_url:
-            logger.info("Error: Invalid cookie. Redirected to login page.")
-            browser.close()
-            return None
+            # Check if page was loaded successfully
+            if "idp.falkenberg.se" in page.url:
+                logger.info("Error: Invalid cookie. Redirected to login page.")
+                return None
 
-        content = page.content()
-        if "idp.falkenberg.se" in content and "SAMLRequest" in content:
-            logger.error(
-                "CRITICAL: Cookie is INVALID! Detected SAML Login Form in response."
-            )
+            content = page.content()
+            rendered.bytes = len(content.encode())
+            return content
+        finally:
             browser.close()
-            return None
-
-        browser.close()
-
-        soup = BeautifulSoup(content, "html.parser")
-
-        title = soup.title.string if soup.title else "No title found"
-
-        main_content = soup.find("div", id="tm-main")
-        if not main_content:
-            main_content = soup.find("div", class_="tm-page") or soup.find("body")
-
-        # Filter unnecessary elements
-        for tag in UNWANTED_TAGS:
-            for match in main_content.find_all(tag):
-                match.decompose()
-        for class_name in UNWANTED_CLASSES:
-            for match in soup.find_all(class_=lambda c: c and class_name in c):
-                match.decompose()
-        for id in UNWANTED_IDS:
-            for match in main_content.find_all(id=id):
-                match.decompose()
-
-        if main_content:
-            for cookie_div in main_content.find_all(
-                "div", id=re.compile("cookie", re.IGNORECASE)
-            ):
-                cookie_div.decompose()
-            texts = " ".join(main_content.stripped_strings)
-        else:
-            texts = "Main or Page not found or empty."
-
-        results = []
-        results.append({"url": page_url, "title": title, "texts": texts})
-
-        # Site Pdfs
-        pdf_links = soup.find_all(
-            "a",
-            href=re.compile(
-                r"(^/alla-dokument/|^https://intranet\.falkenberg\.se/alla-dokument/|\.pdf$)",
-                re.IGNORECASE,
-            ),
-        )
-        for link in pdf_links:
-            pdf_url = link["href"]
-            if pdf_url.startswith("/"):
-                pdf_url = "https://intranet.falkenberg.se" + pdf_url
 
-            if pdf_url.startswith("https://intranet.falkenberg.se/alla-dokument/"):
-                pdf_url = pdf_url + "/file"
 
-            pdf_text = scrap_pdf(
-                pdf_url=pdf_url, cookie_name=cookie_name, cookie_value=cookie_value
+def fetch_static(page_url, cookie_name, cookie_value):
+    with stage("fetch") as fetched:
+        response = requests.get(
+            page_url,
+            cookies={cookie_name: cookie_value} if cookie_name else None,
+            timeout=HTTP_TIMEOUT,
+        )
+        response.raise_for_status()
+        fetched.bytes = len(response.content)
+    if "idp.falkenberg.se" in response.url:
+        logger.info("Error: Invalid cookie. Redirected to login page.")
+        return None
+    return response.text
+
+
+def scrap_site(page_url, cookie_name, cookie_value, skip_document=None):
+    fetch = fetch_static if PAGE_FETCHER == "http" else fetch_rendered
+    content = fetch(page_url, cookie_name, cookie_value)
+    if content is None:
+        return None
+    if "idp.falkenberg.se" in content and "SAMLRequest" in content:
+        logger.error("CRITICAL: Cookie is INVALID! Detected SAML Login Form in response.")
+        return None
+
+    with stage("html_extract", len(content.encode())):
+        title, texts, pdf_links = extract_page(content)
+
+    results = []
+    results.append({"url": page_url, "title": title, "texts": texts})
+
+    # Site Pdfs
+    for pdf_url, link_text in pdf_links:
+        if pdf_url.startswith("/"):
+            pdf_url = INTRANET_URL + pdf_url
+
+        if pdf_url.startswith(f"{INTRANET_URL}/alla-dokument/"):
+            pdf_url = pdf_url + "/file"
+
+        # Already indexed shared documents are listed without downloading them again
+        if skip_document and skip_document(pdf_url):
+            results.append(
+                {
+                    "url": pdf_url,
+                    "title": link_text.strip() or "No title",
+                    "texts": None,
+                    "source_url": page_url,
+                }
             )
-            if pdf_text:
-                results.append(
-                    {
-                        "url": pdf_url,
-                        "title": link.text.strip() or "No title",
-                        "texts": pdf_text,
-                        "source_url": page_url,
-                    }
-                )
-        return results
+            continue
 
+        pdf_text = scrap_pdf(
+            pdf_url=pdf_url, cookie_name=cookie_name, cookie_value=cookie_value
+        )
+        # Failed downloads are still listed, the page keeps linking the document
+        results.append(
+            {
+                "url": pdf_url,
+                "title": link_text.strip() or "No title",
+                "texts": pdf_text or None,
+                "source_url": page_url,
+                "failed": not pdf_text,
+            }
+        )
+    return results
 
-def scrap_pdf(pdf_url, cookie_name, cookie_value):
-    file_path = "temp.pdf"
-    try:
-        if pdf_url.startswith("https://intranet.falkenberg.se"):
-            response = requests.get(
-                pdf_url, cookies={cookie_name: cookie_value}, timeout=10
-            )
-        else:
-            response = requests.get(pdf_url)
-        response.raise_for_status()
 
-        content_type = response.headers.get("Content-Type", "").lower()
-        if (
-            "application/vnd.openxmlformats-officedocument.wordprocessingml.document"
-            in content_type
-            or "application/msword" in content_type
-            or "application/octet-stream" in content_type
-        ):
-            # Hantera docx-fil
-            file_path = "temp.docx"
-            with open(file_path, "wb") as f:
-                f.write(response.content)
-
-            doc = docx.Document(file_path)
-            text_content = []
-            for para in doc.paragraphs:
-                cleaned_text = re.sub(r"[\.\-_]{3,}", "", para.text)
-                text_content.append(cleaned_text)
-
-            for table in doc.tables:
-                for row in table.rows:
-                    for cell in row.cells:
-                        cleaned_text = re.sub(r"[\.\-_]{3,}", "", cell.text)
-                        text_content.append(cleaned_text)
-            return " ".join(text_content) if text_content else None
-        elif "pdf" in content_type:
-            # Hantera pdf-fil
-            with open(file_path, "wb") as f:
-                f.write(response.content)
-
-            text_content = []
-            with pdfplumber.open(file_path) as pdf:
-                for page in pdf.pages:
-                    page_text = page.extract_text()
-                    if page_text:
-                        cleaned_text = re.sub(r"[\.\-_]{3,}", "", page_text)
-                        text_content.append(cleaned_text)
-            return " ".join(text_content) if text_content else None
-        else:
-            return
-    except (requests.exceptions.RequestException, Exception) as e:
-        logging.info(f"Error fetching or processing PDF/DOCX from {pdf_url}: {str(e)}")
-        return
-    finally:
-        if os.path.exists(file_path):
-            os.remove(file_path)
+def scrap_pdf(pdf_url, cookie_name, cookie_value):
+    if pdf_url.startswith(INTRANET_URL):
+        return extract_document(pdf_url, cookies={cookie_name: cookie_value})
+    return extract_document(pdf_url)
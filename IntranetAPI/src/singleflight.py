@@ -0,0 +1,126 @@
+import contextvars
+import logging
+import re
+import threading
+
+# Setup Logging
+logger = logging.getLogger(__name__)
+
+READ_POLL_SECONDS = 0.5
+
+
+def normalize_question(text):
+    """Key for identical questions: case, whitespace and trailing punctuation ignored."""
+    text = re.sub(r"\s+", " ", text.strip().lower())
+    return text.rstrip(" ?!.")
+
+
+class FanoutStream:
+    """Chunks of one generation, replayed to every reader that attaches to it."""
+
+    def __init__(self):
+        self.chunks = []
+        self.done = False
+        self.error = None
+        self.cost = 0
+        self.sources = None  # Chunks the answer was built from, None if retrieval failed
+        self.readers = 0
+        self.abandoned = threading.Event()  # Every reader left before the generation finished
+        self.condition = threading.Condition()
+
+    @classmethod
+    def completed(cls, text):
+        """Stream of an answer that is already known (precomputed)."""
+        stream = cls()
+        stream.attach()
+        stream.append(text)
+        stream.finish()
+        return stream
+
+    def append(self, chunk):
+        with self.condition:
+            self.chunks.append(chunk)
+            self.condition.notify_all()
+
+    def finish(self, error=None):
+        with self.condition:
+            self.done = True
+            self.error = error
+            self.condition.notify_all()
+
+    def attach(self):
+        with self.condition:
+            self.readers += 1
+
+    def read(self, stop_event=None):
+        """Yield all chunks from the start, then follow new ones until the generation ends."""
+        index = 0
+        try:
+            while True:
+                with self.condition:
+                    while index >= len(self.chunks) and not self.done:
+                        self.condition.wait(READ_POLL_SECONDS)
+                        if stop_event is not None and stop_event.is_set():
+                            return
+                    new_chunks = self.chunks[index:]
+                    done = self.done
+                index += len(new_chunks)
+                yield from new_chunks
+                if done and index >= len(self.chunks):
+                    if self.error is not None:
+                        logger.error(f"Shared generation failed: {self.error}")
+                    return
+                if stop_event is not None and stop_event.is_set():
+                    return
+        finally:
+            with self.condition:
+                self.readers -= 1
+                if self.readers == 0 and not self.done:
+                    self.abandoned.set()
+
+
+class SingleFlight:
+    """Runs one producer per key, concurrent callers with the same key share its stream."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.flights = {}
+
+    def join(self, key, produce, on_done=None):
+        """Return (stream, leader). produce(stream) runs in a thread for new flights.
+
+        on_done(stream) runs in that thread once the generation has ended, whether
+        or not any reader is still attached.
+        """
+        with self.lock:
+            stream = self.flights.get(key) if key is not None else None
+            if stream is not None and not stream.done and not stream.abandoned.is_set():
+                stream.attach()
+                return stream, False
+            stream = FanoutStream()
+            stream.attach()
+            if key is not None:
+                self.flights[key] = stream
+
+        def run():
+            try:
+                produce(stream)
+                stream.finish()
+            except Exception as e:
+                stream.finish(e)
+            finally:
+                with self.lock:
+                    if key is not None and self.flights.get(key) is stream:
+                        del self.flights[key]
+            if on_done is not None:
+                try:
+                    on_done(stream)
+                except Exception as e:
+                    logger.error(f"Shared generation follow-up failed: {e}")
+
+        # The producer logs with the request ID of the request that started it
+        context = contextvars.copy_context()
+        threading.Thread(
+            target=context.run, args=(run,), name="singleflight", daemon=True
+        ).start()
+        return stream, True
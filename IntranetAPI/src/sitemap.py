@@ -0,0 +1,213 @@
+from collections import deque
+import gzip
+import logging
+import re
+import sqlite3
+import threading
+import xml.etree.ElementTree as ET
+
+import requests
+
+from crawl_state import parse_datetime, utc_now
+
+# Setup Logging
+logger = logging.getLogger(__name__)
+
+SITEMAP_URL = (
+    "https://intranet.falkenberg.se/index.php?option=com_jmap&view=sitemap&format=xml"
+)
+SITEMAP_NS = "{http://www.sitemaps.org/schemas/sitemap/0.9}"
+SITEMAP_CACHE_PATH = "../data/sitemap_cache.db"
+SITEMAP_TIMEOUT = (10, 60)  # Connect, read
+MAX_SITEMAP_DEPTH = 3  # Nested sitemap indexes followed at most this deep
+
+URLS_TO_EXCLUDE = [
+    "/search", "/min-sida", "/mitt-konto", "/reset", "/logout",
+    "/uppdatera-uppgifter", "https://intranet.falkenberg.se/reg",
+    "/min-profil", "/loggaut", "/uppdatera-min-profil",
+    "/mina-kontakter", "/samarbete", "/sok-efter-anvandare-och-grupper",
+    "/visa-alla-anvandare"
+]
+EXCLUDE_PATTERN = re.compile("|".join(map(re.escape, URLS_TO_EXCLUDE)))
+
+GZIP_MAGIC = b"\x1f\x8b"
+
+
+def is_excluded(url):
+    return EXCLUDE_PATTERN.search(url) is not None
+
+
+class SitemapCache:
+    """ETag/Last-Modified and parsed entries of each fetched sitemap file."""
+
+    def __init__(self, db_path=SITEMAP_CACHE_PATH):
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(db_path, check_same_thread=False, timeout=30)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute(
+            """CREATE TABLE IF NOT EXISTS sitemaps (
+                url TEXT PRIMARY KEY,
+                etag TEXT,
+                last_modified TEXT,
+                fetched_at TEXT NOT NULL
+            )"""
+        )
+        self.conn.execute(
+            """CREATE TABLE IF NOT EXISTS entries (
+                sitemap_url TEXT NOT NULL,
+                loc TEXT NOT NULL,
+                lastmod TEXT,
+                is_sitemap INTEGER NOT NULL
+            )"""
+        )
+        self.conn.execute(
+            "CREATE INDEX IF NOT EXISTS entries_sitemap ON entries (sitemap_url)"
+        )
+        self.conn.commit()
+
+    def validators(self, url):
+        with self.lock:
+            row = self.conn.execute(
+                "SELECT etag, last_modified FROM sitemaps WHERE url = ?", (url,)
+            ).fetchone()
+        return row or (None, None)
+
+    def entries(self, url):
+        with self.lock:
+            return self.conn.execute(
+                "SELECT loc, lastmod, is_sitemap FROM entries WHERE sitemap_url = ?",
+                (url,),
+            ).fetchall()
+
+    def store(self, url, etag, last_modified, entries):
+        with self.lock:
+            self.conn.execute("DELETE FROM entries WHERE sitemap_url = ?", (url,))
+            self.conn.executemany(
+                "INSERT INTO entries (sitemap_url, loc, lastmod, is_sitemap) VALUES (?, ?, ?, ?)",
+                [(url, loc, lastmod, int(is_sitemap)) for loc, lastmod, is_sitemap in entries],
+            )
+            self.conn.execute(
+                "INSERT OR REPLACE INTO sitemaps (url, etag, last_modified, fetched_at) VALUES (?, ?, ?, ?)",
+                (url, etag, last_modified, utc_now().isoformat()),
+            )
+            self.conn.commit()
+
+
+_sitemap_cache = None
+_sitemap_cache_lock = threading.Lock()
+
+
+def get_sitemap_cache():
+    global _sitemap_cache
+    with _sitemap_cache_lock:
+        if _sitemap_cache is None:
+            _sitemap_cache = SitemapCache()
+        return _sitemap_cache
+
+
+class _PeekStream:
+    """File-like wrapper that lets the first bytes be inspected (gzip sniffing)."""
+
+    def __init__(self, raw, size=2):
+        self.raw = raw
+        self.head = raw.read(size)
+
+    def read(self, size=-1):
+        if self.head:
+            head, self.head = self.head, b""
+            if size is None or size < 0:
+                return head + self.raw.read()
+            return head + self.raw.read(max(0, size - len(head)))
+        return self.raw.read(size)
+
+
+# Parse one sitemap file incrementally, yields (loc, lastmod, is_sitemap)
+def _iter_sitemap_file(stream):
+    for _, element in ET.iterparse(stream, events=("end",)):
+        if element.tag in (f"{SITEMAP_NS}url", f"{SITEMAP_NS}sitemap"):
+            loc = (element.findtext(f"{SITEMAP_NS}loc") or "").strip()
+            if loc:
+                lastmod = element.findtext(f"{SITEMAP_NS}lastmod")
+                yield loc, lastmod, element.tag == f"{SITEMAP_NS}sitemap"
+            element.clear()
+
+
+def _fetch_sitemap(session, url, cache):
+    """Yield a sitemap file's entries, from the cache when the server answers 304."""
+    etag, last_modified = cache.validators(url) if cache else (None, None)
+    headers = {}
+    if etag:
+        headers["If-None-Match"] = etag
+    if last_modified:
+        headers["If-Modified-Since"] = last_modified
+
+    with session.get(url, headers=headers, timeout=SITEMAP_TIMEOUT, stream=True) as response:
+        if response.status_code == 304:
+            logger.info(f"Sitemap not modified, using cached entries: {url}")
+            yield from ((loc, lastmod, bool(is_sitemap)) for loc, lastmod, is_sitemap in cache.entries(url))
+            return
+        if response.status_code != 200:
+            raise Exception(
+                f"Failed to fetch sitemap from {url}, status: {response.status_code}"
+            )
+        if "idp.falkenberg.se" in response.url:
+            raise Exception("Sitemap request was redirected to login, cookie is invalid")
+
+        # Content-Encoding is decoded by urllib3, .xml.gz files are sniffed and unpacked here
+        response.raw.decode_content = True
+        stream = _PeekStream(response.raw)
+        if stream.head == GZIP_MAGIC:
+            stream = gzip.GzipFile(fileobj=stream)
+
+        entries = []
+        for entry in _iter_sitemap_file(stream):
+            entries.append(entry)
+            yield entry
+
+        if cache is not None:
+            cache.store(
+                url,
+                response.headers.get("ETag"),
+                response.headers.get("Last-Modified"),
+                entries,
+            )
+
+
+# Stream url entries (loc + lastmod) from the sitemap, following sitemap indexes
+def iter_sitemap_entries(
+    cookie_name, cookie_value, sitemap_url=SITEMAP_URL, session=None, use_cache=True
+):
+    session = session or requests.Session()
+    session.cookies.set(cookie_name, cookie_value)
+    cache = get_sitemap_cache() if use_cache else None
+
+    pending = deque([(sitemap_url, 0)])
+    seen = set()
+    while pending:
+        url, depth = pending.popleft()
+        if url in seen:
+            continue
+        seen.add(url)
+        for loc, lastmod, is_sitemap in _fetch_sitemap(session, url, cache):
+            if is_sitemap:
+                if depth < MAX_SITEMAP_DEPTH:
+                    pending.append((loc, depth + 1))
+                else:
+                    logger.warning(f"Sitemap index too deep, skipping: {loc}")
+                continue
+            yield {"loc": loc, "lastmod": parse_datetime(lastmod)}
+
+
+def get_sitemap_entries(cookie_name, cookie_value, sitemap_url=SITEMAP_URL):
+    entries = list(iter_sitemap_entries(cookie_name, cookie_value, sitemap_url))
+    logger.info(f"Sitemap contains {len(entries)} URLs")
+    return entries
+
+
+# Sitemap page URLs that should be indexed
+def get_sitemap_urls(cookie_name, cookie_value, sitemap_url=SITEMAP_URL):
+    return {
+        entry["loc"]
+        for entry in iter_sitemap_entries(cookie_name, cookie_value, sitemap_url)
+        if not is_excluded(entry["loc"])
+    }
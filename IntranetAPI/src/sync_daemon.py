@@ -0,0 +1,105 @@
+import argparse
+from datetime import timedelta
+import logging
+import os
+import random
+import signal
+import threading
+import time
+
+from logging_setup import log_context, setup_logging
+
+# Setup Logging
+log_file = "../data/sync_daemon_logg.txt"
+setup_logging(log_file)
+logger = logging.getLogger(__name__)
+
+from sitemap import get_sitemap_entries, is_excluded
+from incremental_sync import COOKIE_NAME, COOKIE_VALUE, run_incremental_sync
+from qdrant_remove_diff import ping_healthcheck, remove_web_sitemap_url_diff
+
+# Schedule
+SYNC_INTERVAL = float(os.getenv("SYNC_INTERVAL_MINUTES", "60")) * 60
+SYNC_JITTER = float(os.getenv("SYNC_JITTER_SECONDS", "300"))
+SYNC_MAX_AGE = (
+    timedelta(days=float(os.getenv("SYNC_MAX_AGE_DAYS")))
+    if os.getenv("SYNC_MAX_AGE_DAYS")
+    else None
+)
+# Queue updates for ingest_worker.py (default) or update inline
+SYNC_ENQUEUE = os.getenv("SYNC_ENQUEUE", "1") == "1"
+
+stop_event = threading.Event()
+
+
+# One reconciliation: removals, then additions and changed pages
+def run_cycle(force=False):
+    with log_context(cycle=time.strftime("%Y%m%dT%H%M%S")):
+        _run_cycle(force)
+
+
+def _run_cycle(force):
+    started = time.monotonic()
+
+    # 1 Sitemap, shared by both phases
+    try:
+        entries = get_sitemap_entries(COOKIE_NAME, COOKIE_VALUE)
+    except Exception as e:
+        logger.error(f"Sitemap fetch failed, skipping cycle: {e}")
+        ping_healthcheck("intern-sync-sitemap", fail=True, data=str(e))
+        return
+    ping_healthcheck("intern-sync-sitemap")
+    sitemap_urls = {entry["loc"] for entry in entries if not is_excluded(entry["loc"])}
+
+    # 2 Removals (pings intern-qdrant-diff-remove itself)
+    removed = remove_web_sitemap_url_diff(force=force, sitemap_urls=sitemap_urls)
+
+    # 3 Additions and changed pages
+    try:
+        run_incremental_sync(max_age=SYNC_MAX_AGE, enqueue=SYNC_ENQUEUE, entries=entries)
+        ping_healthcheck("intern-sync-update")
+    except Exception as e:
+        logger.error(f"Update phase failed: {e}")
+        ping_healthcheck("intern-sync-update", fail=True, data=str(e))
+
+    logger.info(
+        f"Sync cycle done in {time.monotonic() - started:.1f}s, "
+        f"{len(sitemap_urls)} sitemap URLs, {len(removed)} removed"
+    )
+
+
+def stop(signum, frame):
+    logger.info(f"Received signal {signum}, stopping after the current cycle")
+    stop_event.set()
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Keep Qdrant in sync with the intranet sitemap."
+    )
+    parser.add_argument("--once", action="store_true", help="Run one cycle and exit.")
+    parser.add_argument(
+        "--force", action="store_true", help="Ignore the removal safety limit."
+    )
+    args = parser.parse_args()
+
+    if args.once:
+        run_cycle(force=args.force)
+        return
+
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+    logger.info(
+        f"Sync daemon started, every {SYNC_INTERVAL / 60:.0f} min + up to {SYNC_JITTER:.0f}s jitter"
+    )
+    while not stop_event.is_set():
+        try:
+            run_cycle(force=args.force)
+        except Exception as e:
+            logger.error(f"Sync cycle crashed: {e}")
+        stop_event.wait(SYNC_INTERVAL + random.uniform(0, SYNC_JITTER))
+    logger.info("Sync daemon stopped")
+
+
+if __name__ == "__main__":
+    main()